@@ -0,0 +1,199 @@
+"""Benchmark concurrent summarize upserts and history list requests against the database.
+
+Each profile runs in its own process on a scratch SQLite file: 'baseline' is
+the old configuration (rollback journal, FULL sync, deferred transactions, a
+new connection per request) and 'tuned' the current settings. Requests go
+through the full Django stack with the echo LLM provider and a canned
+YouTube lookup, so the database is the only shared resource.
+
+Usage:
+    python bench_database.py [--threads 8] [--seconds 10] [--history 200] [--profiles baseline,tuned]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PROFILES = {
+    'baseline': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        # Python's sqlite3 module waits 5 seconds by default too
+        'SQLITE_BUSY_TIMEOUT': '5000',
+        'SQLITE_MMAP_SIZE': '0',
+        'SQLITE_CACHE_SIZE': '-2000',
+        'SQLITE_TRANSACTION_MODE': 'DEFERRED',
+        'DATABASE_CONN_MAX_AGE': '0',
+    },
+    'tuned': {},
+}
+
+SCENARIOS = {
+    'upsert': ('upsert',),
+    'list': ('list',),
+    'mixed': ('upsert', 'list'),
+}
+
+VIDEO_POOL = 1000
+
+
+def video_id(i: int) -> str:
+    return f'{i:011d}'
+
+
+def fake_video_info(url, deadline=None):
+    return {
+        'title': 'Benchmark video',
+        'thumbnail_url': '',
+        'duration': '600',
+        'description': 'A benchmark video. It talks about databases. Writers wait for the lock.',
+    }
+
+
+def seed(users: list, history: int) -> None:
+    """Give every user ``history`` summaries of shared videos"""
+    from summerizer.models import Video, VideoSummary
+
+    Video.objects.bulk_create([
+        Video(video_id=video_id(i), video_url=f'https://youtu.be/{video_id(i)}', title='Seeded video', summary='Seeded summary.')
+        for i in range(history)
+    ])
+    for user in users:
+        VideoSummary.objects.bulk_create([
+            VideoSummary(user=user, video_url=f'https://youtu.be/{video_id(i)}', video_id=video_id(i))
+            for i in range(history)
+        ])
+
+
+def worker(user, kind: str, stop_at: float, results: list, seed_value: int) -> None:
+    from rest_framework.test import APIClient
+
+    rng = random.Random(seed_value)
+    client = APIClient(SERVER_NAME='localhost')
+    client.force_authenticate(user)
+    timings, errors = [], 0
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        if kind == 'upsert':
+            url = f'https://www.youtube.com/watch?v={video_id(rng.randrange(VIDEO_POOL))}'
+            response = client.post('/api/summaries/summarize/', {'url': url}, format='json')
+        else:
+            response = client.get('/api/summaries/', {'page_size': 20})
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            errors += 1
+    results.append((kind, timings, errors))
+
+
+def run_scenario(users: list, kinds: tuple, seconds: float) -> dict:
+    results = []
+    stop_at = time.perf_counter() + seconds
+    threads = [
+        threading.Thread(target=worker, args=(user, kinds[i % len(kinds)], stop_at, results, i))
+        for i, user in enumerate(users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    report = {}
+    for kind in kinds:
+        timings = [ms for k, kind_timings, _ in results if k == kind for ms in kind_timings]
+        timings.sort()
+        report[kind] = {
+            'requests': len(timings),
+            'per_second': round(len(timings) / seconds, 1),
+            'p50_ms': round(statistics.median(timings), 1) if timings else None,
+            'p95_ms': round(timings[int(0.95 * (len(timings) - 1))], 1) if timings else None,
+            'errors': sum(errors for k, _, errors in results if k == kind),
+        }
+    return report
+
+
+def run_profile(args) -> None:
+    """Child process: set up a scratch database under this profile and run every scenario"""
+    from unittest import mock
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    from django.contrib.auth import get_user_model
+
+    # Failed requests are counted; keep them out of the project's error log
+    logging.disable(logging.ERROR)
+
+    call_command('migrate', verbosity=0)
+    users = [
+        get_user_model().objects.create_user(username=f'bench{i}', password='pw') for i in range(args.threads)
+    ]
+    seed(users, args.history)
+
+    from django.db import connection
+    pragmas = {name: connection.cursor().execute(f'PRAGMA {name}').fetchone()[0] for name in ('journal_mode', 'synchronous')}
+    connection.close()
+
+    report = {'pragmas': pragmas}
+    with mock.patch('summerizer.ai_utils.fetch_video_info', side_effect=fake_video_info):
+        for name, kinds in SCENARIOS.items():
+            report[name] = run_scenario(users, kinds, args.seconds)
+    print(json.dumps(report))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--history', type=int, default=200, help="Summaries per user before the run")
+    parser.add_argument('--profiles', default='baseline,tuned')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_profile(args)
+        return
+
+    reports = {}
+    for profile in args.profiles.split(','):
+        with tempfile.TemporaryDirectory() as directory:
+            env = {
+                **os.environ,
+                **PROFILES[profile],
+                'DJANGO_SETTINGS_MODULE': 'core.settings',
+                'DJANGO_SECRET_KEY': os.getenv('DJANGO_SECRET_KEY', 'bench'),
+                'DATABASE_ENGINE': 'sqlite3',
+                'SQLITE_PATH': os.path.join(directory, 'bench.sqlite3'),
+                'SEMANTIC_INDEX_PATH': os.path.join(directory, 'embeddings'),
+                'LLM_PROVIDERS': 'echo',
+            }
+            output = subprocess.run(
+                [sys.executable, __file__, '--run', profile, '--threads', str(args.threads),
+                 '--seconds', str(args.seconds), '--history', str(args.history)],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            reports[profile] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"Threads: {args.threads}, {args.seconds:g}s per scenario, {args.history} summaries per user")
+    for profile, report in reports.items():
+        print(f"{profile}: journal_mode={report['pragmas']['journal_mode']} synchronous={report['pragmas']['synchronous']}")
+    print(f"{'scenario':<8} {'endpoint':<7} {'profile':<9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for name, kinds in SCENARIOS.items():
+        for kind in kinds:
+            for profile, report in reports.items():
+                row = report[name][kind]
+                print(
+                    f"{name:<8} {kind:<7} {profile:<9} {row['per_second']:>8} "
+                    f"{row['p50_ms']!s:>8} {row['p95_ms']!s:>8} {row['errors']:>7}"
+                )
+
+
+if __name__ == "__main__":
+    main()
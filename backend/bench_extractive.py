@@ -0,0 +1,78 @@
+"""Benchmark the extractive TextRank summarizer.
+
+The default input is prose from the docstrings of the Python standard library,
+which has a realistic vocabulary (thousands of distinct words, where
+synthetic text from a short word list has a few dozen). Inputs of a few
+hundred thousand characters are what the EXTRACTIVE_PREFILTER_TOKENS pass
+sends here.
+
+Usage:
+    python bench_extractive.py [--chars 50000 200000 400000] [--runs 20] [--file input.txt]
+"""
+import argparse
+import ast
+import glob
+import os
+import resource
+import statistics
+import time
+
+from summerizer.extractive import WORD_RE, extractive_summary, split_sentences
+
+
+def docstring_text(chars: int) -> str:
+    """Concatenate standard library docstrings, in a stable order, up to ``chars``"""
+    parts = []
+    length = 0
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.__file__), '*.py'))):
+        try:
+            with open(path, encoding='utf-8') as f:
+                tree = ast.parse(f.read())
+        except (SyntaxError, UnicodeDecodeError):
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                docstring = ast.get_docstring(node)
+                if docstring:
+                    parts.append(docstring)
+                    length += len(docstring) + 1
+        if length >= chars:
+            break
+    return '\n'.join(parts)[:chars]
+
+
+def bench(text: str, runs: int) -> None:
+    # Warm up NumPy and the regex caches
+    extractive_summary(text[:2000])
+
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        extractive_summary(text)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    vocabulary = len(set(WORD_RE.findall(text.lower())))
+    print(f"Input: {len(text)} chars, {len(split_sentences(text))} sentences, {vocabulary} distinct words")
+    print(f"  min {min(timings):.2f} ms | median {statistics.median(timings):.2f} ms | max {max(timings):.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chars', type=int, nargs='+', default=[50000, 200000, 400000])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--file', help="Summarize this file instead of standard library docstrings")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            bench(f.read(), args.runs)
+    else:
+        for chars in args.chars:
+            bench(docstring_text(chars), args.runs)
+
+    # ru_maxrss is in kilobytes on Linux
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB")
+
+
+if __name__ == "__main__":
+    main()
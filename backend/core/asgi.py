@@ -3,6 +3,10 @@ ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The streaming summary endpoint (/api/summaries/summarize/stream/) is an async
+view, so serve it through this application (e.g. ``uvicorn core.asgi:application``)
+to stream tokens without holding a worker thread per connection.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -91,14 +91,282 @@ WSGI_APPLICATION = 'core.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# DATABASE_ENGINE is 'sqlite3' (default) or 'postgresql' (needs psycopg, plus
+# psycopg_pool with DATABASE_POOL on). Connections are reused for
+# DATABASE_CONN_MAX_AGE seconds; a pool replaces that with POOL_MIN_SIZE to
+# POOL_MAX_SIZE shared connections.
+# SQLite runs in WAL mode so readers and the writer don't block each other, and
+# waits up to SQLITE_BUSY_TIMEOUT ms for the write lock instead of failing with
+# "database is locked". Write transactions start IMMEDIATE: a deferred one that
+# upgrades its read lock can fail without waiting when another writer is active
+
+DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'sqlite3')
+DATABASE_CONN_MAX_AGE = int(os.getenv('DATABASE_CONN_MAX_AGE', 60))
+DATABASE_POOL = os.getenv('DATABASE_POOL', 'false').lower() in ('1', 'true', 'yes')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'summerizer'),
+            'USER': os.getenv('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            # Pooled connections go back to the pool after each request
+            'CONN_MAX_AGE': 0 if DATABASE_POOL else DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.getenv('POOL_MAX_SIZE', 10)),
+                    'timeout': float(os.getenv('POOL_TIMEOUT', 10)),
+                },
+            } if DATABASE_POOL else {},
+        }
+    }
+else:
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+        # NORMAL only syncs at checkpoints, which is durable enough in WAL mode
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -20000)),
+    }
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': ''.join(f"PRAGMA {name}={value};" for name, value in SQLITE_PRAGMAS.items()),
+                'transaction_mode': os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            },
+        }
+    }
 
-DATABASES = {
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The default local-memory cache is per process; point DJANGO_CACHE_BACKEND at a
+# shared backend (database, file, redis) to share entries between workers.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.getenv('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DJANGO_CACHE_LOCATION', 'summerizer'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('DJANGO_CACHE_MAX_ENTRIES', 10000)),
+        },
     }
 }
 
+# YouTube metadata cache, keyed on the video ID.
+# BACKEND is 'local' (in-process LRU) or 'django' (uses CACHE_ALIAS from CACHES)
+VIDEO_INFO_CACHE = {
+    'BACKEND': os.getenv('VIDEO_INFO_CACHE_BACKEND', 'local'),
+    'CACHE_ALIAS': os.getenv('VIDEO_INFO_CACHE_ALIAS', 'default'),
+    'TIMEOUT': int(os.getenv('VIDEO_INFO_CACHE_TIMEOUT', 6 * 60 * 60)),
+    'MAX_ENTRIES': int(os.getenv('VIDEO_INFO_CACHE_MAX_ENTRIES', 5000)),
+}
+
+# Content-addressed cache of LLM summaries.
+# BACKEND is 'database' (SummaryCacheEntry table) or 'django' (uses CACHE_ALIAS).
+# The table is trimmed to MAX_ENTRIES; its size is counted when this process's
+# estimate passes that, or every SIZE_CHECK_EVERY writes
+SUMMARY_CACHE = {
+    'BACKEND': os.getenv('SUMMARY_CACHE_BACKEND', 'database'),
+    'CACHE_ALIAS': os.getenv('SUMMARY_CACHE_ALIAS', 'default'),
+    'TIMEOUT': int(os.getenv('SUMMARY_CACHE_TIMEOUT', 30 * 24 * 60 * 60)),
+    'MAX_ENTRIES': int(os.getenv('SUMMARY_CACHE_MAX_ENTRIES', 50000)),
+    'SIZE_CHECK_EVERY': int(os.getenv('SUMMARY_CACHE_SIZE_CHECK_EVERY', 100)),
+}
+
+# Background summarization jobs.
+# BACKEND is 'thread' (in-process pool) or 'database' (run `manage.py run_summary_worker`)
+SUMMARY_JOBS = {
+    'BACKEND': os.getenv('SUMMARY_JOBS_BACKEND', 'thread'),
+    'WORKERS': int(os.getenv('SUMMARY_JOBS_WORKERS', 4)),
+    'POLL_INTERVAL': float(os.getenv('SUMMARY_JOBS_POLL_INTERVAL', 1.0)),
+    'STALE_AFTER': int(os.getenv('SUMMARY_JOBS_STALE_AFTER', 15 * 60)),
+}
+
+# Coalesce concurrent summarize requests for the same video.
+# Cross-process coalescing needs CACHE_ALIAS to point at a shared cache backend
+SINGLE_FLIGHT = {
+    'CACHE_ALIAS': os.getenv('SINGLE_FLIGHT_CACHE_ALIAS', 'default'),
+    'LOCK_TIMEOUT': float(os.getenv('SINGLE_FLIGHT_LOCK_TIMEOUT', 60)),
+    'WAIT_TIMEOUT': float(os.getenv('SINGLE_FLIGHT_WAIT_TIMEOUT', 45)),
+    'RESULT_TIMEOUT': float(os.getenv('SINGLE_FLIGHT_RESULT_TIMEOUT', 30)),
+    'POLL_INTERVAL': float(os.getenv('SINGLE_FLIGHT_POLL_INTERVAL', 0.2)),
+}
+
+# Pooled HTTP client used for all outbound requests from ai_utils
+HTTP_CLIENT = {
+    'POOL_CONNECTIONS': int(os.getenv('HTTP_POOL_CONNECTIONS', 10)),
+    'POOL_MAXSIZE': int(os.getenv('HTTP_POOL_MAXSIZE', 20)),
+    'CONNECT_TIMEOUT': float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05)),
+    'READ_TIMEOUT': float(os.getenv('HTTP_READ_TIMEOUT', 10)),
+    'MAX_RETRIES': int(os.getenv('HTTP_MAX_RETRIES', 2)),
+    'BACKOFF_FACTOR': float(os.getenv('HTTP_BACKOFF_FACTOR', 0.3)),
+    'BACKOFF_MAX': float(os.getenv('HTTP_BACKOFF_MAX', 5)),
+}
+
+# Map-reduce summarization of long content: chunks of CHUNK_TOKENS (overlapping
+# by OVERLAP_TOKENS) are summarized CONCURRENCY at a time, then combined.
+# Input above EXTRACTIVE_PREFILTER_TOKENS is first shrunk with TextRank (0 disables)
+SUMMARY_CHUNKING = {
+    'CHUNK_TOKENS': int(os.getenv('SUMMARY_CHUNK_TOKENS', 1500)),
+    'OVERLAP_TOKENS': int(os.getenv('SUMMARY_CHUNK_OVERLAP_TOKENS', 100)),
+    'CONCURRENCY': int(os.getenv('SUMMARY_CHUNK_CONCURRENCY', 4)),
+    'EXTRACTIVE_PREFILTER_TOKENS': int(os.getenv('SUMMARY_EXTRACTIVE_PREFILTER_TOKENS', 12000)),
+}
+
+# Token counting: 'auto' uses tiktoken when installed and its vocabulary is
+# available, otherwise the bundled pure-Python tokenizer ('regex')
+SUMMARY_TOKENIZER = os.getenv('SUMMARY_TOKENIZER', 'auto')
+
+# Completion budget: max_tokens is COMPLETION_RATIO of the input, clamped to
+# [MIN_COMPLETION_TOKENS, MAX_COMPLETION_TOKENS]; the input is trimmed to fit
+SUMMARY_TOKEN_BUDGET = {
+    'COMPLETION_RATIO': float(os.getenv('SUMMARY_COMPLETION_RATIO', 0.35)),
+    'MIN_COMPLETION_TOKENS': int(os.getenv('SUMMARY_MIN_COMPLETION_TOKENS', 96)),
+    'MAX_COMPLETION_TOKENS': int(os.getenv('SUMMARY_MAX_COMPLETION_TOKENS', 425)),
+}
+
+# Batch summarize endpoint: at most MAX_URLS per request, with separate limits
+# on concurrent metadata fetches and concurrent LLM calls
+SUMMARY_BATCH = {
+    'MAX_URLS': int(os.getenv('SUMMARY_BATCH_MAX_URLS', 200)),
+    'FETCH_CONCURRENCY': int(os.getenv('SUMMARY_BATCH_FETCH_CONCURRENCY', 8)),
+    'LLM_CONCURRENCY': int(os.getenv('SUMMARY_BATCH_LLM_CONCURRENCY', 4)),
+}
+
+# Playlist and channel ingestion: WORKERS videos are summarized at once and at
+# most MAX_PENDING are listed ahead of them; progress is saved every
+# CHECKPOINT_EVERY videos. Runs idle for STALE_AFTER seconds can be resumed
+INGESTION = {
+    'WORKERS': int(os.getenv('INGESTION_WORKERS', 4)),
+    'MAX_PENDING': int(os.getenv('INGESTION_MAX_PENDING', 16)),
+    'CHECKPOINT_EVERY': int(os.getenv('INGESTION_CHECKPOINT_EVERY', 10)),
+    'MAX_PAGES': int(os.getenv('INGESTION_MAX_PAGES', 200)),
+    'STALE_AFTER': int(os.getenv('INGESTION_STALE_AFTER', 15 * 60)),
+}
+
+# LLM providers ('openai', 'groq', or 'echo' for an offline extractive stand-in).
+# Calls go to the provider with the lowest rolling median latency and fail over
+# to the others; providers that failed MAX_FAILURE_RATE of their calls in the
+# last FAILURE_WINDOW seconds are only tried after the rest. With HEDGE on, a
+# call still pending after the primary's p95 (HEDGE_DELAY until MIN_SAMPLES
+# calls are measured) is also sent to the next provider and the first answer
+# wins. Providers whose circuit breaker is open
+# are skipped (see CIRCUIT_BREAKER)
+LLM = {
+    'PROVIDERS': [name.strip() for name in os.getenv('LLM_PROVIDERS', 'openai').split(',') if name.strip()],
+    'MODELS': {
+        'openai': os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo'),
+        'groq': os.getenv('GROQ_MODEL', 'llama-3.1-8b-instant'),
+        'echo': 'echo',
+    },
+    'TIMEOUT': float(os.getenv('LLM_TIMEOUT', 30)),
+    'HEDGE': os.getenv('LLM_HEDGE', 'false').lower() in ('1', 'true', 'yes'),
+    'HEDGE_DELAY': float(os.getenv('LLM_HEDGE_DELAY', 2.0)),
+    'MIN_SAMPLES': int(os.getenv('LLM_MIN_SAMPLES', 10)),
+    'LATENCY_WINDOW': int(os.getenv('LLM_LATENCY_WINDOW', 100)),
+    'FAILURE_WINDOW': float(os.getenv('LLM_FAILURE_WINDOW', 300)),
+    'MAX_FAILURE_RATE': float(os.getenv('LLM_MAX_FAILURE_RATE', 0.5)),
+    'MAX_WORKERS': int(os.getenv('LLM_MAX_WORKERS', 8)),
+}
+
+# Circuit breaker in front of each LLM provider. It opens after FAILURE_THRESHOLD
+# consecutive failures, or when at least MIN_CALLS calls in the last WINDOW
+# seconds failed at ERROR_RATE or more; then calls fail fast to the extractive
+# fallback. After RESET_TIMEOUT seconds one probe call tests for recovery.
+# State lives in CACHE_ALIAS (use a shared backend to share it between workers)
+# and each worker re-reads it at most every SYNC_INTERVAL seconds
+CIRCUIT_BREAKER = {
+    'CACHE_ALIAS': os.getenv('CIRCUIT_BREAKER_CACHE_ALIAS', 'default'),
+    'FAILURE_THRESHOLD': int(os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5)),
+    'ERROR_RATE': float(os.getenv('CIRCUIT_BREAKER_ERROR_RATE', 0.5)),
+    'MIN_CALLS': int(os.getenv('CIRCUIT_BREAKER_MIN_CALLS', 10)),
+    'WINDOW': int(os.getenv('CIRCUIT_BREAKER_WINDOW', 60)),
+    'RESET_TIMEOUT': float(os.getenv('CIRCUIT_BREAKER_RESET_TIMEOUT', 30)),
+    'PROBE_TIMEOUT': float(os.getenv('CIRCUIT_BREAKER_PROBE_TIMEOUT', 60)),
+    'SYNC_INTERVAL': float(os.getenv('CIRCUIT_BREAKER_SYNC_INTERVAL', 1.0)),
+}
+
+# Global LLM rate limits (requests and tokens per minute, 0 disables), counted in
+# CACHE_ALIAS so every worker shares them. Calls over the limit queue in their
+# worker: interactive requests before background jobs before batch work, and
+# round-robin between users. A call queued longer than MAX_WAIT seconds falls
+# back to the extractive summary
+LLM_SCHEDULER = {
+    'CACHE_ALIAS': os.getenv('LLM_SCHEDULER_CACHE_ALIAS', 'default'),
+    'RPM': int(os.getenv('LLM_RPM', 500)),
+    'TPM': int(os.getenv('LLM_TPM', 200000)),
+    'MAX_WAIT': float(os.getenv('LLM_SCHEDULER_MAX_WAIT', 30)),
+    'POLL_INTERVAL': float(os.getenv('LLM_SCHEDULER_POLL_INTERVAL', 0.25)),
+}
+
+# Time budget of a synchronous summarize request (the mobile client gives up at
+# 30s). Stages size their timeouts from what is left: pytube gets at most
+# PYTUBE_TIMEOUT, and the LLM is skipped for the extractive fallback when less
+# than LLM_MIN_SECONDS remain
+SUMMARIZE_DEADLINE = {
+    'SECONDS': float(os.getenv('SUMMARIZE_DEADLINE_SECONDS', 25)),
+    'PYTUBE_TIMEOUT': float(os.getenv('SUMMARIZE_PYTUBE_TIMEOUT', 8)),
+    'LLM_MIN_SECONDS': float(os.getenv('SUMMARIZE_LLM_MIN_SECONDS', 3)),
+}
+
+# pytube lookups run on thread pools, since pytube has no timeouts of its own.
+# Interactive requests get WORKERS threads; jobs, batches and ingestion share a
+# separate pool of BACKGROUND_WORKERS so they can't queue ahead of them
+PYTUBE = {
+    'WORKERS': int(os.getenv('PYTUBE_WORKERS', 8)),
+    'BACKGROUND_WORKERS': int(os.getenv('PYTUBE_BACKGROUND_WORKERS', 8)),
+}
+
+# Stats endpoint: responses are cached per user for CACHE_TIMEOUT seconds in
+# CACHE_ALIAS, keyed on the user's HistoryVersion row so any worker's history
+# write makes them stale (the same row is behind the history ETags). With COUNTERS on, totals come
+# from a per-user SummaryCounter row updated on writes instead of counting the
+# history (clear that table before turning COUNTERS back on after a while off)
+SUMMARY_STATS = {
+    'CACHE_ALIAS': os.getenv('SUMMARY_STATS_CACHE_ALIAS', 'default'),
+    'CACHE_TIMEOUT': int(os.getenv('SUMMARY_STATS_CACHE_TIMEOUT', 5 * 60)),
+    'COUNTERS': os.getenv('SUMMARY_STATS_COUNTERS', 'false').lower() in ('1', 'true', 'yes'),
+}
+
+# History list and recent endpoints: cursor pages of PAGE_SIZE summaries,
+# clients can ask for up to MAX_PAGE_SIZE with ?page_size=
+SUMMARY_PAGINATION = {
+    'PAGE_SIZE': int(os.getenv('SUMMARY_PAGE_SIZE', 20)),
+    'MAX_PAGE_SIZE': int(os.getenv('SUMMARY_MAX_PAGE_SIZE', 100)),
+}
+
+# Related summaries: each video's title and summary is embedded locally as a
+# hashed bag of words (DIMENSIONS float32s) and appended to memory-mapped files
+# at PATH as videos are summarized. `manage.py index_embeddings` embeds videos
+# stored before the index existed (related does it lazily otherwise)
+SEMANTIC_INDEX = {
+    'PATH': os.getenv('SEMANTIC_INDEX_PATH', str(BASE_DIR / 'data' / 'video_embeddings')),
+    'DIMENSIONS': int(os.getenv('SEMANTIC_INDEX_DIMENSIONS', 1024)),
+}
+
+# Clearing a history deletes BATCH_SIZE summaries per transaction and sleeps
+# PAUSE seconds between batches, so other writers get the database in between.
+# DELETE clear_history/?mode=async runs it on the background pool instead
+HISTORY_DELETE = {
+    'BATCH_SIZE': int(os.getenv('HISTORY_DELETE_BATCH_SIZE', 500)),
+    'PAUSE': float(os.getenv('HISTORY_DELETE_PAUSE', 0.05)),
+}
+
+# Token stream behind /api/summaries/summarize/stream/: 'llm' (the providers
+# above) or 'fake' (offline)
+LLM_STREAM_BACKEND = os.getenv('LLM_STREAM_BACKEND', 'llm')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
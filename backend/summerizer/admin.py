@@ -1,10 +1,34 @@
 from django.contrib import admin
-from .models import VideoSummary
+from .models import Video, VideoSummary, SummaryCacheEntry
+from .search import fts_enabled, match_expression, matching_ids
 # Register your models here.
+class VideoAdmin(admin.ModelAdmin):
+    list_display = ('title', 'video_id', 'duration', 'updated_at')
+    search_fields = ('title', 'summary', 'video_id')
+    readonly_fields = ('created_at', 'updated_at')
+
+admin.site.register(Video, VideoAdmin)
+
 class VideoSummaryAdmin(admin.ModelAdmin):
-    list_display = ('title', 'user', 'created_at')
+    list_display = ('video', 'user', 'created_at')
     list_filter = ('created_at', 'user')
-    search_fields = ('title', 'summary', 'video_url')
+    list_select_related = ('video', 'user')
+    search_fields = ('video__title', 'video__summary', 'video_url')
+    raw_id_fields = ('video',)
     readonly_fields = ('created_at',)
 
-admin.site.register(VideoSummary, VideoSummaryAdmin)
\ No newline at end of file
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text index instead of LIKE scans over every row
+        match = match_expression(search_term)
+        if not fts_enabled() or match is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=matching_ids(match)), False
+
+admin.site.register(VideoSummary, VideoSummaryAdmin)
+
+class SummaryCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'model', 'hit_count', 'last_used_at')
+    list_filter = ('model',)
+    readonly_fields = ('created_at', 'last_used_at', 'hit_count')
+
+admin.site.register(SummaryCacheEntry, SummaryCacheEntryAdmin)
@@ -1,46 +1,124 @@
-import os 
+import contextvars
 import re
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 from pytube import YouTube
-import openai
 from dotenv import load_dotenv
+from django.conf import settings
+from django.db import connections
+from .cache import get_video_info_cache, get_summary_cache
+from .http_client import get_http_client
+from .extractive import extractive_summary, shrink_text
+from .tokens import count_tokens, count_message_tokens, split_into_chunks, truncate_tokens, fit_prompt, record_usage
+from .breaker import CircuitOpenError
+from .llm import EchoProvider, get_llm_router
+from .deadline import Deadline, get_deadline
+from .scheduler import PRIORITY_INTERACTIVE, current_priority, get_llm_scheduler
+from .video_ids import canonical_video_url, extract_video_id
 
 load_dotenv()
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+SUMMARY_MODEL = 'gpt-3.5-turbo'  # Token budgeting and cache keys, whichever provider answers
+SUMMARY_SYSTEM_PROMPT = "You are a helpful assistant that summarizes video content concisely with important details."
+SUMMARY_MAX_TOKENS = 425  # Upper bound, the actual budget is sized per request
+SUMMARY_PROMPT = "Please provide a concise summary of this video content: {text}"
+CHUNK_PROMPT = "Please summarize this part of a longer video's content, keeping the important details: {text}"
+REDUCE_PROMPT = "These are summaries of consecutive parts of one video. Combine them into one concise summary of the whole video: {text}"
 
-def get_video_info(url: str) -> dict:
-    """Get video information from YouTube URL"""
+YOUTUBE_OEMBED_URL = 'https://www.youtube.com/oembed'
+
+# pytube has no timeouts of its own, so it runs on these pools and we stop
+# waiting when the deadline says so; a stuck lookup just finishes in the background
+_pytube_executors = {}
+_pytube_executors_lock = threading.Lock()
+
+def get_pytube_executor(interactive: bool = True) -> ThreadPoolExecutor:
+    """Return the process-wide pytube pool for interactive requests or for background work"""
+    name = 'interactive' if interactive else 'background'
+    executor = _pytube_executors.get(name)
+    if executor is None:
+        with _pytube_executors_lock:
+            executor = _pytube_executors.get(name)
+            if executor is None:
+                workers = settings.PYTUBE['WORKERS' if interactive else 'BACKGROUND_WORKERS']
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'pytube-{name}')
+                _pytube_executors[name] = executor
+    return executor
+
+def reset_pytube_executors() -> None:
+    """Drop the pools so they are rebuilt from settings"""
+    with _pytube_executors_lock:
+        for executor in _pytube_executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _pytube_executors.clear()
+
+def get_video_info(url: str, deadline: Optional[Deadline] = None) -> dict:
+    """Get video information from YouTube URL, served from the shared cache when possible"""
+    video_id = extract_video_id(url)
+    cache = get_video_info_cache()
+
+    if video_id:
+        cached_info = cache.get(video_id)
+        if cached_info is not None:
+            return cached_info
+
+    video_info = fetch_video_info(url, deadline)
+
+    # Only successful lookups are cached, failures are retried next time
+    if video_id:
+        cache.set(video_id, video_info)
+
+    return video_info
+
+def fetch_video_info(url: str, deadline: Optional[Deadline] = None) -> dict:
+    """Fetch video information from YouTube, bypassing the cache"""
+    deadline = get_deadline(deadline)
     try:
         # Normalize the YouTube URL
         normalized_url = normalize_youtube_url(url)
         
-        # Try pytube first
+        # Try pytube first, for as long as the deadline allows
         try:
-            yt = YouTube(normalized_url)
-            
-            # Validate video information
-            if not yt.title:
-                raise ValueError("Video title is empty")
-            
-            # Handle cases with no description
-            description = yt.description or "No description available"
-            
-            return {
-                'title': yt.title,
-                'thumbnail_url': yt.thumbnail_url,
-                'duration': str(yt.length),
-                'description': description,
-            }
+            executor = get_pytube_executor(interactive=current_priority() == PRIORITY_INTERACTIVE)
+            future = executor.submit(fetch_video_info_pytube, normalized_url)
+            try:
+                return future.result(timeout=deadline.timeout(settings.SUMMARIZE_DEADLINE['PYTUBE_TIMEOUT']))
+            finally:
+                # A lookup still waiting for a thread won't run once we've given up on it
+                future.cancel()
         except Exception as pytube_error:
             # If pytube fails, try an alternative method
-            return fetch_video_info_alternative(normalized_url)
+            return fetch_video_info_alternative(normalized_url, deadline)
     
     except Exception as e:
         raise ValueError(f"Error fetching video info: {str(e)}")
 
+def fetch_video_info_pytube(url: str) -> dict:
+    """Fetch video information with pytube"""
+    yt = YouTube(url)
+    
+    # Validate video information
+    if not yt.title:
+        raise ValueError("Video title is empty")
+    
+    # Handle cases with no description
+    description = yt.description or "No description available"
+    
+    return {
+        'title': yt.title,
+        'thumbnail_url': yt.thumbnail_url,
+        'duration': str(yt.length),
+        'description': description,
+    }
+
 def normalize_youtube_url(url: str) -> str:
     """Normalize YouTube URL to ensure compatibility"""
+    # Any form of video link becomes the standard watch URL
+    video_id = extract_video_id(url)
+    if video_id:
+        return canonical_video_url(video_id)
+    
     # Remove any additional parameters
     base_url = url.split('&')[0]
     
@@ -51,18 +129,21 @@ def normalize_youtube_url(url: str) -> str:
     
     return base_url
 
-def fetch_video_info_alternative(url: str) -> dict:
+def fetch_video_info_alternative(url: str, deadline: Optional[Deadline] = None) -> dict:
     """Alternative method to fetch video information"""
     try:
         # Use YouTube's embed page to extract metadata
-        embed_url = f"https://www.youtube.com/oembed?url={url}&format=json"
-        response = requests.get(embed_url)
+        response = get_http_client().get(
+            YOUTUBE_OEMBED_URL,
+            params={'url': url, 'format': 'json'},
+            deadline=deadline
+        )
         
         if response.status_code == 200:
             embed_data = response.json()
             
             # Fetch description using another method
-            description = fetch_video_description(url)
+            description = fetch_video_description(url, deadline)
             
             return {
                 'title': embed_data.get('title', 'Unknown Title'),
@@ -76,11 +157,11 @@ def fetch_video_info_alternative(url: str) -> dict:
     except Exception as e:
         raise ValueError(f"Alternative video info fetch failed: {str(e)}")
 
-def fetch_video_description(url: str) -> str:
+def fetch_video_description(url: str, deadline: Optional[Deadline] = None) -> str:
     """Attempt to fetch video description using web scraping"""
     try:
-        # Use requests to fetch the YouTube page
-        response = requests.get(url)
+        # Use the pooled HTTP client to fetch the YouTube page
+        response = get_http_client().get(url, deadline=deadline)
         
         if response.status_code == 200:
             # Use regex to extract description
@@ -96,39 +177,25 @@ def fetch_video_description(url: str) -> str:
     except Exception as e:
         return "Unable to fetch description"
 
-def generate_summary(text:str) -> str:
-    """Generate summary using OpenAI or fallback method"""
+def generate_summary(text:str, deadline: Optional[Deadline] = None) -> str:
+    """Generate summary using the LLM or fallback method"""
+    deadline = get_deadline(deadline)
     try:
         # Validate input text
         if not text or len(text.strip()) < 10:
             return "Unable to generate summary due to insufficient content."
         
-        # Truncate very long descriptions to avoid token limits
-        if len(text) > 5000:
-            text = text[:5000]
-        
         try:
-            response = openai.ChatCompletion.create(
-                model='gpt-3.5-turbo',
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that summarizes video content concisely with important details."},
-                    {"role": "user", "content": f"Please provide a concise summary of this video content: {text}"}
-                ],
-                max_tokens=425  # Optimal token range
-            )
+            # Without time for an LLM round trip, go straight to the fallback
+            deadline.check('summary', settings.SUMMARIZE_DEADLINE['LLM_MIN_SECONDS'])
             
-            # Extract the summary from the response
-            summary = response.choices[0].message['content'].strip()
-            
-            # Validate summary
-            if not summary:
-                return generate_fallback_summary(text)
-            
-            return summary
+            # Long content is summarized chunk by chunk before the final pass
+            text, prompt = condense_text(text, deadline)
+            return request_summary(text, prompt, deadline)
         
-        except Exception as openai_error:
-            # Log the specific OpenAI error
-            print(f"OpenAI Error: {openai_error}")
+        except Exception as llm_error:
+            # Log the specific LLM error
+            print(f"LLM Error: {llm_error}")
             
             # Fallback to alternative summary generation
             return generate_fallback_summary(text)
@@ -138,17 +205,176 @@ def generate_summary(text:str) -> str:
         print(f"Unexpected error in summary generation: {e}")
         return generate_fallback_summary(text)
 
-def generate_fallback_summary(text: str) -> str:
-    """Generate a simple extractive summary when OpenAI fails"""
+def request_summary(text: str, prompt: str = SUMMARY_PROMPT, deadline: Optional[Deadline] = None) -> str:
+    """Summarize text with a single LLM call, raising if no summary comes back"""
+    text, max_tokens, prompt_tokens = plan_summary_request(text, prompt)
+    
+    # Identical input, model and prompt always produce a reusable summary
+    summary_cache = get_summary_cache()
+    cache_key = summary_cache_key(text, prompt, max_tokens)
+    cached_summary = summary_cache.get(cache_key)
+    if cached_summary is not None:
+        record_usage(prompt_tokens, 0, cached=True)
+        return cached_summary
+    
+    # Wait for a turn under the global rate limits, then let the router pick
+    # the provider and handle failover and hedging
+    scheduler = get_llm_scheduler()
+    router = get_llm_router()
+    # With every circuit open, fail fast instead of queueing for a slot we can't use
+    router.ranked_providers()
+    reservation = scheduler.acquire(prompt_tokens + max_tokens, timeout=get_deadline(deadline).remaining())
+
+    def reserve_hedge():
+        # A hedge is a second request against the same limits; without
+        # headroom it is skipped. Its reservation stays at the estimate, since
+        # the usage of whichever call loses is never seen
+        return scheduler.try_acquire(prompt_tokens + max_tokens) is not None
+
     try:
-        # Split text into sentences
-        sentences = text.split('.')
+        response = router.complete(summary_messages(text, prompt), max_tokens, deadline, reserve_hedge=reserve_hedge)
+    except CircuitOpenError:
+        scheduler.release(reservation)
+        raise
+    summary = response.text
+    
+    # Prefer the provider's own token accounting when it reports one
+    used_prompt_tokens = response.prompt_tokens if response.prompt_tokens is not None else prompt_tokens
+    used_completion_tokens = response.completion_tokens if response.completion_tokens is not None else count_tokens(summary, SUMMARY_MODEL)
+    record_usage(used_prompt_tokens, used_completion_tokens)
+    scheduler.settle(reservation, used_prompt_tokens + used_completion_tokens)
+    
+    # Validate summary
+    if not summary:
+        raise ValueError("LLM returned an empty summary")
+    
+    # Fallback summaries are never cached, only real completions
+    summary_cache.set(cache_key, summary, response.model)
+    
+    return summary
+
+def plan_summary_request(text: str, prompt: str = SUMMARY_PROMPT) -> tuple:
+    """Fit text into the model's context and size the completion for it.
+
+    Returns ``(text, max_tokens, prompt_tokens)``.
+    """
+    text, max_tokens, _, prompt_tokens = fit_prompt(
+        text, lambda body: summary_messages(body, prompt), SUMMARY_MODEL
+    )
+    return text, max_tokens, prompt_tokens
+
+def summarize_chunk(chunk: str, deadline: Optional[Deadline] = None) -> str:
+    """Map step: summarize one chunk, falling back to extraction on failure"""
+    try:
+        return request_summary(chunk, CHUNK_PROMPT, deadline)
+    except Exception as e:
+        print(f"Chunk summary error: {e}")
+        return generate_fallback_summary(chunk)
+    finally:
+        # Pool threads are short-lived, don't leave their connections behind
+        connections.close_all()
+
+def condense_text(text: str, deadline: Optional[Deadline] = None) -> tuple:
+    """Map stage of map-reduce summarization.
+
+    Returns the text and prompt for the final LLM call: the input itself when it
+    fits in one chunk, otherwise the joined partial summaries of its chunks.
+    """
+    config = settings.SUMMARY_CHUNKING
+    chunk_tokens = config['CHUNK_TOKENS']
+    prompt = SUMMARY_PROMPT
+    deadline = get_deadline(deadline)
+    llm_seconds = settings.SUMMARIZE_DEADLINE['LLM_MIN_SECONDS']
+    
+    # Very long input is first cut down to its most central sentences
+    prefilter_tokens = config.get('EXTRACTIVE_PREFILTER_TOKENS')
+    if prefilter_tokens and count_tokens(text, SUMMARY_MODEL) > prefilter_tokens:
+        text = shrink_text(text, prefilter_tokens, lambda sentence: count_tokens(sentence, SUMMARY_MODEL))
+    
+    while count_tokens(text, SUMMARY_MODEL) > chunk_tokens:
+        if deadline.remaining() < 2 * llm_seconds:
+            # No time for a map pass and the final call: extract down to one chunk
+            return shrink_text(text, chunk_tokens, lambda sentence: count_tokens(sentence, SUMMARY_MODEL)), prompt
         
-        # Select first 2-3 sentences as summary
-        summary_sentences = sentences[:3]
+        chunks = split_into_chunks(text, chunk_tokens, config['OVERLAP_TOKENS'], SUMMARY_MODEL)
+        workers = max(1, min(config['CONCURRENCY'], len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='summary-chunk') as pool:
+            # Each chunk runs in a copy of our context so token usage is still tracked
+            futures = [
+                pool.submit(contextvars.copy_context().run, summarize_chunk, chunk, deadline)
+                for chunk in chunks
+            ]
+            partials = [future.result() for future in futures]
         
-        # Join sentences and add ellipsis if truncated
-        summary = '. '.join(summary_sentences).strip() + ('...' if len(sentences) > 3 else '')
+        condensed = '\n\n'.join(partials)
+        prompt = REDUCE_PROMPT
+        if count_tokens(condensed, SUMMARY_MODEL) >= count_tokens(text, SUMMARY_MODEL):
+            # Summaries aren't shrinking the input, keep what fits in one call
+            return truncate_tokens(condensed, chunk_tokens, SUMMARY_MODEL), prompt
+        text = condensed
+    
+    return text, prompt
+
+def summary_messages(text: str, prompt: str = SUMMARY_PROMPT) -> list:
+    """Build the chat messages asking for a summary of the text"""
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt.format(text=text)}
+    ]
+
+def summary_cache_key(text: str, prompt: str = SUMMARY_PROMPT, max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """Content-addressed summary cache key for the text and prompt sent to the LLM"""
+    return get_summary_cache().make_key(
+        text, SUMMARY_MODEL, f"{SUMMARY_SYSTEM_PROMPT}\n{prompt}", max_tokens
+    )
+
+def stream_summary(text: str, stream_factory=None, prompt: str = SUMMARY_PROMPT,
+                   max_tokens: int = SUMMARY_MAX_TOKENS, deadline: Optional[Deadline] = None) -> Iterator[str]:
+    """Yield summary tokens as the LLM produces them.
+
+    ``text`` should already be condensed and fitted (see condense_text and
+    plan_summary_request). ``stream_factory`` takes the chat messages and
+    max_tokens and returns an iterable of text pieces; it defaults to
+    streaming from the fastest healthy LLM provider, once the rate limits
+    allow it.
+    """
+    messages = summary_messages(text, prompt)
+    if stream_factory is not None:
+        for token in stream_factory(messages, max_tokens):
+            if token:
+                yield token
+        return
+
+    scheduler = get_llm_scheduler()
+    router = get_llm_router()
+    router.ranked_providers()
+    prompt_tokens = count_message_tokens(messages, SUMMARY_MODEL)
+    reservation = scheduler.acquire(prompt_tokens + max_tokens, timeout=get_deadline(deadline).remaining())
+    parts = []
+    try:
+        for token in router.stream(messages, max_tokens):
+            if token:
+                parts.append(token)
+                yield token
+    except CircuitOpenError:
+        if not parts:
+            scheduler.release(reservation)
+            reservation = None
+        raise
+    finally:
+        # Also runs when the client goes away mid-stream
+        if reservation is not None:
+            scheduler.settle(reservation, prompt_tokens + count_tokens(''.join(parts), SUMMARY_MODEL))
+
+def fake_summary_stream(messages: list, max_tokens: int = SUMMARY_MAX_TOKENS, delay: float = 0.0) -> Iterator[str]:
+    """Offline stand-in for a streaming LLM: streams the extractive summary word by word"""
+    return EchoProvider(delay=delay).stream(messages, max_tokens)
+
+def generate_fallback_summary(text: str) -> str:
+    """Generate an extractive TextRank summary when OpenAI fails"""
+    try:
+        # Pick the three most central sentences, kept in their original order
+        summary = extractive_summary(text, sentence_count=3)
         
         return summary if summary else "No summary could be generated."
     
@@ -0,0 +1,189 @@
+import logging
+import math
+import threading
+import time
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Whether an error says the upstream is unhealthy, as opposed to a bad request"""
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None:
+        # Connection errors, timeouts and anything unexpected
+        return True
+    return status_code >= 500 or status_code in (408, 429)
+
+
+class CircuitBreaker:
+    """Closed / open / half-open circuit breaker with state shared through the Django cache.
+
+    The circuit opens after FAILURE_THRESHOLD consecutive failures, or once at
+    least MIN_CALLS calls in the last WINDOW seconds failed at ERROR_RATE or
+    more. While open, ``acquire`` raises CircuitOpenError without touching the
+    network. After RESET_TIMEOUT one probe call at a time (across processes)
+    is let through: its success closes the circuit, its failure reopens it.
+
+    Every process keeps a local copy of the state, refreshed from the cache
+    every SYNC_INTERVAL seconds, so rejecting a call never waits on the cache.
+    """
+
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.cache_alias = config.get('CACHE_ALIAS', 'default')
+        self.failure_threshold = int(config.get('FAILURE_THRESHOLD', 5))
+        self.error_rate = float(config.get('ERROR_RATE', 0.5))
+        self.min_calls = int(config.get('MIN_CALLS', 10))
+        self.window = int(config.get('WINDOW', 60))
+        self.reset_timeout = float(config.get('RESET_TIMEOUT', 30))
+        self.probe_timeout = float(config.get('PROBE_TIMEOUT', 60))
+        self.sync_interval = float(config.get('SYNC_INTERVAL', 1.0))
+
+        self._lock = threading.Lock()
+        self._state = {'state': CLOSED, 'opened_at': 0.0}
+        self._synced_at = -math.inf
+        self._rejected = 0
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _key(self, suffix: str) -> str:
+        return f"breaker:{self.name}:{suffix}"
+
+    def _incr(self, suffix: str, timeout=None) -> int:
+        key = self._key(suffix)
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            self.cache.add(key, 1, timeout)
+            return 1
+
+    def _load(self, force: bool = False) -> dict:
+        with self._lock:
+            if force or time.monotonic() - self._synced_at >= self.sync_interval:
+                self._state = self.cache.get(self._key('state')) or {'state': CLOSED, 'opened_at': 0.0}
+                self._synced_at = time.monotonic()
+            return self._state
+
+    def _transition(self, state: str) -> None:
+        new_state = {'state': state, 'opened_at': time.time() if state == OPEN else 0.0}
+        self.cache.set(self._key('state'), new_state, None)
+        with self._lock:
+            previous = self._state['state']
+            self._state = new_state
+            self._synced_at = time.monotonic()
+
+        self._incr(f"transitions:{state}")
+        if state == CLOSED:
+            self.cache.set(self._key('consecutive'), 0, None)
+        self.cache.delete(self._key('probe'))
+        logger.warning(f"Circuit {self.name}: {previous} -> {state}")
+
+    def state(self) -> str:
+        """Current state; an open circuit whose reset timeout passed reads as half-open"""
+        state = self._load()
+        if state['state'] == OPEN and time.time() - state['opened_at'] >= self.reset_timeout:
+            return HALF_OPEN
+        return state['state']
+
+    def available(self) -> bool:
+        """Whether a call could go through right now (without taking a probe slot)"""
+        return self.state() != OPEN
+
+    def acquire(self) -> bool:
+        """Admit one call, raising CircuitOpenError if the circuit won't allow it.
+
+        Returns True when the call is the half-open probe; pass that on to
+        ``record_success`` / ``record_failure``.
+        """
+        state = self.state()
+        if state == CLOSED:
+            return False
+        if state == HALF_OPEN and self.cache.add(self._key('probe'), 1, self.probe_timeout):
+            return True
+        with self._lock:
+            self._rejected += 1
+        raise CircuitOpenError(f"Circuit {self.name} is open")
+
+    def _window_keys(self) -> tuple:
+        slot = int(time.time() // self.window)
+        return slot, slot - 1
+
+    def record_success(self, probe: bool = False) -> None:
+        if probe:
+            self._transition(CLOSED)
+            return
+        current, _ = self._window_keys()
+        self._incr(f"calls:{current}", self.window * 2)
+        self.cache.set(self._key('consecutive'), 0, None)
+
+    def record_failure(self, probe: bool = False) -> None:
+        if probe:
+            self._transition(OPEN)
+            return
+
+        current, previous = self._window_keys()
+        self._incr(f"calls:{current}", self.window * 2)
+        self._incr(f"errors:{current}", self.window * 2)
+        consecutive = self._incr('consecutive')
+
+        counts = self.cache.get_many([
+            self._key(f"{kind}:{slot}") for kind in ('calls', 'errors') for slot in (current, previous)
+        ])
+        calls = sum(counts.get(self._key(f"calls:{slot}"), 0) for slot in (current, previous))
+        errors = sum(counts.get(self._key(f"errors:{slot}"), 0) for slot in (current, previous))
+
+        tripped = consecutive >= self.failure_threshold or (
+            calls >= self.min_calls and errors / calls >= self.error_rate
+        )
+        if tripped and self._load(force=True)['state'] == CLOSED:
+            self._transition(OPEN)
+
+    def call(self, func, *args, **kwargs):
+        """Run func through the breaker; only upstream failures count against it"""
+        probe = self.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if is_upstream_failure(e):
+                self.record_failure(probe)
+            else:
+                self.record_success(probe)
+            raise
+        self.record_success(probe)
+        return result
+
+    def stats(self) -> dict:
+        """State, recent error counts and transition counters"""
+        current, previous = self._window_keys()
+        keys = [self._key('consecutive')] + [
+            self._key(f"transitions:{state}") for state in (OPEN, CLOSED)
+        ] + [
+            self._key(f"{kind}:{slot}") for kind in ('calls', 'errors') for slot in (current, previous)
+        ]
+        values = self.cache.get_many(keys)
+        with self._lock:
+            rejected = self._rejected
+        return {
+            'state': self.state(),
+            'consecutive_failures': values.get(self._key('consecutive'), 0),
+            'window_calls': sum(values.get(self._key(f"calls:{slot}"), 0) for slot in (current, previous)),
+            'window_errors': sum(values.get(self._key(f"errors:{slot}"), 0) for slot in (current, previous)),
+            'opened': values.get(self._key(f"transitions:{OPEN}"), 0),
+            'closed': values.get(self._key(f"transitions:{CLOSED}"), 0),
+            'rejected': rejected,
+        }
+
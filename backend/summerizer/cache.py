@@ -0,0 +1,247 @@
+import copy
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from datetime import timedelta
+from typing import Optional
+
+from cachetools import TTLCache
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+
+
+class LocalCache:
+    """In-process TTL cache with LRU eviction, shared by all threads of a worker"""
+
+    def __init__(self, timeout: int, max_entries: int):
+        self._cache = TTLCache(maxsize=max_entries, ttl=timeout)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._cache.get(key)
+        # Hand out copies so callers can't mutate the cached entry
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            self._cache[key] = copy.deepcopy(value)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+class DjangoCache:
+    """Cache stored in one of Django's CACHES, shared between worker processes"""
+
+    def __init__(self, alias: str, prefix: str, timeout: int):
+        self._alias = alias
+        self._prefix = prefix
+        self._timeout = timeout
+
+    @property
+    def _cache(self):
+        return caches[self._alias]
+
+    def _make_key(self, key: str) -> str:
+        return f"{self._prefix}:{key}"
+
+    def get(self, key: str):
+        return self._cache.get(self._make_key(key))
+
+    def set(self, key: str, value) -> None:
+        self._cache.set(self._make_key(key), value, self._timeout)
+
+    def delete(self, key: str) -> None:
+        self._cache.delete(self._make_key(key))
+
+    def clear(self) -> None:
+        # Django caches can't drop a single prefix, so only the local
+        # backend supports a real clear; entries here simply expire.
+        pass
+
+
+def build_cache(config: dict, prefix: str):
+    """Build a cache backend from a settings dictionary"""
+    backend = config.get('BACKEND', 'local')
+    timeout = int(config.get('TIMEOUT', 3600))
+
+    if backend == 'local':
+        return LocalCache(timeout, int(config.get('MAX_ENTRIES', 1000)))
+    if backend == 'django':
+        return DjangoCache(config.get('CACHE_ALIAS', 'default'), prefix, timeout)
+
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different inputs share a cache key"""
+    text = unicodedata.normalize('NFC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class SummaryCache:
+    """Content-addressed cache of LLM summaries with hit/miss counters"""
+
+    def __init__(self, config: dict):
+        self.backend = config.get('BACKEND', 'database')
+        self.max_entries = int(config.get('MAX_ENTRIES', 10000))
+        # The table is counted again at least this often, to notice rows other
+        # processes added
+        self.size_check_every = int(config.get('SIZE_CHECK_EVERY', 100))
+        timeout = config.get('TIMEOUT')
+        self.timeout = int(timeout) if timeout else None
+
+        if self.backend == 'django':
+            self._store = DjangoCache(
+                config.get('CACHE_ALIAS', 'default'), 'summary', self.timeout
+            )
+        elif self.backend != 'database':
+            raise ValueError(f"Unknown summary cache backend: {self.backend}")
+
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        # Rows in the table as of the last count plus the ones added since;
+        # None until the first write counts them
+        self._approx_entries = None
+        self._writes_since_count = 0
+
+    @staticmethod
+    def make_key(text: str, model: str, system_prompt: str, max_tokens: int) -> str:
+        """Hash the normalized input together with everything that shapes the output"""
+        payload = json.dumps(
+            [normalize_text(text), model, system_prompt, max_tokens],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[counter] += amount
+
+    def get(self, key: str) -> Optional[str]:
+        if self.backend == 'django':
+            summary = self._store.get(key)
+        else:
+            summary = self._get_from_database(key)
+
+        self._count('hits' if summary is not None else 'misses')
+        return summary
+
+    def set(self, key: str, summary: str, model: str) -> None:
+        if self.backend == 'django':
+            self._store.set(key, summary)
+        else:
+            self._set_in_database(key, summary, model)
+        self._count('writes')
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_rate'] = counters['hits'] / lookups if lookups else 0.0
+        return counters
+
+    def _get_from_database(self, key: str) -> Optional[str]:
+        from .models import SummaryCacheEntry
+
+        entries = SummaryCacheEntry.objects.filter(key=key)
+        if self.timeout:
+            entries = entries.filter(
+                created_at__gte=timezone.now() - timedelta(seconds=self.timeout)
+            )
+
+        summary = entries.values_list('summary', flat=True).first()
+        if summary is not None:
+            entries.update(hit_count=F('hit_count') + 1, last_used_at=timezone.now())
+        return summary
+
+    def _set_in_database(self, key: str, summary: str, model: str) -> None:
+        from .models import SummaryCacheEntry
+
+        _, created = SummaryCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={'summary': summary, 'model': model, 'last_used_at': timezone.now()},
+        )
+        with self._lock:
+            self._writes_since_count += 1
+            if created and self._approx_entries is not None:
+                self._approx_entries += 1
+            due = (
+                self._approx_entries is None
+                or self._approx_entries > self.max_entries
+                or self._writes_since_count >= self.size_check_every
+            )
+        if due:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Drop the least recently used entries once the table outgrows its bound.
+
+        Writes only call this when the approximate size passes MAX_ENTRIES or
+        every SIZE_CHECK_EVERY writes, so most of them skip the COUNT.
+        """
+        from .models import SummaryCacheEntry
+
+        entries = SummaryCacheEntry.objects.count()
+        excess = entries - self.max_entries
+        if excess <= 0:
+            self._counted(entries)
+            return
+
+        # Evict an extra 10% so we don't pay for this on every write
+        excess += self.max_entries // 10
+        stale_ids = list(
+            SummaryCacheEntry.objects.order_by('last_used_at')
+            .values_list('id', flat=True)[:excess]
+        )
+        SummaryCacheEntry.objects.filter(id__in=stale_ids).delete()
+        self._count('evictions', len(stale_ids))
+        self._counted(entries - len(stale_ids))
+
+    def _counted(self, entries: int) -> None:
+        with self._lock:
+            self._approx_entries = entries
+            self._writes_since_count = 0
+
+
+_video_info_cache = None
+_summary_cache = None
+_caches_lock = threading.Lock()
+
+
+def get_video_info_cache():
+    """Return the process-wide video metadata cache"""
+    global _video_info_cache
+    if _video_info_cache is None:
+        with _caches_lock:
+            if _video_info_cache is None:
+                _video_info_cache = build_cache(settings.VIDEO_INFO_CACHE, 'video-info')
+    return _video_info_cache
+
+
+def get_summary_cache() -> SummaryCache:
+    """Return the process-wide summary cache"""
+    global _summary_cache
+    if _summary_cache is None:
+        with _caches_lock:
+            if _summary_cache is None:
+                _summary_cache = SummaryCache(settings.SUMMARY_CACHE)
+    return _summary_cache
+
+
+def reset_caches() -> None:
+    """Forget the configured caches so they are rebuilt from settings"""
+    global _video_info_cache, _summary_cache
+    with _caches_lock:
+        _video_info_cache = None
+        _summary_cache = None
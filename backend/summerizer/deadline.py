@@ -0,0 +1,47 @@
+import math
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a stage can't start or finish within the request's time budget"""
+
+
+class Deadline:
+    """Time budget for one request, shared by every stage of the pipeline.
+
+    Stages size their own timeouts from what is left (``timeout``) and skip
+    work that can no longer finish (``check``). ``Deadline(None)`` never expires.
+    """
+
+    def __init__(self, seconds: Optional[float]):
+        self.expires_at = math.inf if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None, reserve: float = 0.0) -> float:
+        """Seconds a stage may take: what is left minus ``reserve`` for later stages, at most ``cap``.
+
+        Raises DeadlineExceeded when nothing is left for it.
+        """
+        available = self.remaining() - reserve
+        if available <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+        return available if cap is None else min(cap, available)
+
+    def check(self, stage: str, needed: float = 0.0) -> None:
+        """Raise DeadlineExceeded unless at least ``needed`` seconds are left for ``stage``"""
+        if self.remaining() <= needed:
+            raise DeadlineExceeded(f"Not enough time left for {stage}")
+
+    def __repr__(self):
+        return f"Deadline(remaining={self.remaining():.2f}s)"
+
+
+def get_deadline(deadline: Optional[Deadline]) -> Deadline:
+    """Callers without a budget get one that never expires"""
+    return deadline if deadline is not None else Deadline(None)
@@ -0,0 +1,229 @@
+import logging
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+from .extractive import STOP_WORDS
+from .models import Video, VideoSummary
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w\w+')
+
+
+def embed(text: str, dimensions: int) -> np.ndarray:
+    """L2-normalized hashed bag of words and word pairs; cosine similarity is a dot product.
+
+    Features are hashed with CRC32, so vectors are the same in every process
+    and need no vocabulary. The hash's top bit picks the sign, which keeps
+    collisions from only ever adding up.
+    """
+    words = [word for word in TOKEN_RE.findall(text.lower()) if word not in STOP_WORDS]
+    features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    vector = np.zeros(dimensions, dtype=np.float32)
+    if not features:
+        return vector
+
+    hashes = np.fromiter(
+        (zlib.crc32(feature.encode('utf-8')) for feature in features), dtype=np.uint32, count=len(features)
+    )
+    signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, hashes % dimensions, signs)
+
+    # Dampen repeated words
+    vector = np.sign(vector) * np.log1p(np.abs(vector))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def video_text(video: Video) -> str:
+    return f"{video.title}\n{video.summary}"
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indexes of the k highest scores, highest first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+class EmbeddingIndex:
+    """Float32 video embeddings in a memory-mapped file that only ever grows.
+
+    ``<path>.f32`` holds one row of ``dimensions`` floats per video and
+    ``<path>.ids`` the video ID of each row, one per line. New videos are
+    appended and a refreshed summary overwrites its row in place, so nothing
+    is ever rebuilt; other processes see new rows the next time they read.
+    """
+    ID_WIDTH = 12  # 11-character video ID and a newline
+
+    def __init__(self, path: str, dimensions: int):
+        self.vectors_path = f"{path}.f32"
+        self.ids_path = f"{path}.ids"
+        self.lock_path = f"{path}.lock"
+        self.dimensions = dimensions
+        self.row_bytes = dimensions * np.dtype(np.float32).itemsize
+
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._vectors = None
+
+    def _stored_rows(self) -> int:
+        try:
+            ids_size = os.path.getsize(self.ids_path)
+            vectors_size = os.path.getsize(self.vectors_path)
+        except FileNotFoundError:
+            return 0
+        # A writer appends the vector before the ID, so count complete pairs only
+        return min(ids_size // self.ID_WIDTH, vectors_size // self.row_bytes)
+
+    def _refresh(self) -> None:
+        """Map rows appended since the last read (call with the lock held)"""
+        rows = self._stored_rows()
+        if rows <= len(self._rows):
+            return
+        with open(self.ids_path, 'rb') as ids_file:
+            ids_file.seek(len(self._rows) * self.ID_WIDTH)
+            new_ids = ids_file.read((rows - len(self._rows)) * self.ID_WIDTH).decode('ascii').split()
+        for video_id in new_ids:
+            self._rows[video_id] = len(self._rows)
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dimensions))
+
+    @contextmanager
+    def _writing(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+            with open(self.lock_path, 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def add(self, vectors: dict) -> None:
+        """Store embeddings by video ID, appending new videos and overwriting known ones"""
+        if not vectors:
+            return
+        with self._writing():
+            new = [video_id for video_id in vectors if video_id not in self._rows]
+            known = [video_id for video_id in vectors if video_id in self._rows]
+
+            if known:
+                with open(self.vectors_path, 'r+b') as vectors_file:
+                    for video_id in known:
+                        vectors_file.seek(self._rows[video_id] * self.row_bytes)
+                        vectors_file.write(np.asarray(vectors[video_id], dtype=np.float32).tobytes())
+            if new:
+                with open(self.vectors_path, 'ab') as vectors_file:
+                    # Trim a partial row left by a writer that died mid-append
+                    vectors_file.truncate(len(self._rows) * self.row_bytes)
+                    vectors_file.write(b''.join(
+                        np.asarray(vectors[video_id], dtype=np.float32).tobytes() for video_id in new
+                    ))
+                with open(self.ids_path, 'ab') as ids_file:
+                    ids_file.truncate(len(self._rows) * self.ID_WIDTH)
+                    ids_file.write(''.join(f"{video_id}\n" for video_id in new).encode('ascii'))
+            self._refresh()
+
+    def missing(self, video_ids) -> list:
+        """The video IDs without an embedding yet"""
+        with self._lock:
+            self._refresh()
+            return [video_id for video_id in video_ids if video_id not in self._rows]
+
+    def vectors_for(self, video_ids) -> tuple:
+        """The indexed ones of ``video_ids`` and their embeddings, as a (len, dimensions) array"""
+        with self._lock:
+            self._refresh()
+            found = [video_id for video_id in video_ids if video_id in self._rows]
+            if not found:
+                return [], np.empty((0, self.dimensions), dtype=np.float32)
+            return found, np.asarray(self._vectors[[self._rows[video_id] for video_id in found]])
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._rows)
+
+
+def index_videos(videos) -> int:
+    """Embed videos and add them to the index; returns how many"""
+    index = get_embedding_index()
+    vectors = {video.video_id: embed(video_text(video), index.dimensions) for video in videos}
+    index.add(vectors)
+    return len(vectors)
+
+
+def index_videos_safely(videos) -> None:
+    """index_videos for the write path: a failure is logged, the summary is still stored"""
+    try:
+        index_videos(videos)
+    except Exception as e:
+        logger.error(f"Embedding index update failed: {str(e)}", exc_info=True)
+
+
+def related_summaries(user, text: str, limit: int, exclude_video_id: str = None) -> list:
+    """The user's summaries most similar to ``text``, best first, each with a cosine ``score``"""
+    index = get_embedding_index()
+    video_ids = [
+        video_id for video_id in VideoSummary.objects.filter(user=user).values_list('video_id', flat=True)
+        if video_id != exclude_video_id
+    ]
+    # Summaries stored before the index existed are embedded on first use
+    missing = index.missing(video_ids)
+    if missing:
+        index_videos(Video.objects.filter(video_id__in=missing).only('video_id', 'title', 'summary'))
+
+    found, vectors = index.vectors_for(video_ids)
+    scores = vectors @ embed(text, index.dimensions)
+    top = [i for i in top_k(scores, limit) if scores[i] > 0]
+
+    by_video = {
+        summary_obj.video_id: summary_obj
+        for summary_obj in VideoSummary.objects.filter(
+            user=user, video_id__in=[found[i] for i in top]
+        ).select_related('video')
+    }
+    results = []
+    for i in top:
+        summary_obj = by_video[found[i]]
+        summary_obj.score = round(float(scores[i]), 4)
+        results.append(summary_obj)
+    return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_embedding_index() -> EmbeddingIndex:
+    """Return the process-wide embedding index"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                config = settings.SEMANTIC_INDEX
+                _index = EmbeddingIndex(config['PATH'], config['DIMENSIONS'])
+    return _index
+
+
+def reset_embedding_index() -> None:
+    """Drop the shared index so it is reopened from settings"""
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,127 @@
+import re
+
+import numpy as np
+
+SENTENCE_RE = re.compile(r'[^.!?\n]+(?:[.!?]+|\n|$)')
+WORD_RE = re.compile(r'\w\w+|\n')
+
+STOP_WORDS = frozenset('''
+a about above after again against all am an and any are as at be because been
+before being below between both but by can could did do does doing down during
+each few for from further had has have having he her here hers herself him
+himself his how i if in into is it its itself just me more most my myself no nor
+not now of off on once only or other our ours ourselves out over own same she
+should so some such than that the their theirs them themselves then there these
+they this those through to too under until up very was we were what when where
+which while who whom why will with would you your yours yourself yourselves
+'''.split())
+
+
+def split_sentences(text: str) -> list:
+    """Split text into sentences on terminal punctuation and line breaks"""
+    sentences = (match.group().strip() for match in SENTENCE_RE.finditer(text))
+    return [sentence for sentence in sentences if len(sentence) > 1]
+
+
+def tfidf_entries(sentences: list) -> tuple:
+    """The nonzero cells of the L2-normalized sentence x term TF-IDF matrix.
+
+    Returns ``(rows, cols, values)``. Only (sentence, term) pairs that occur
+    are stored, so memory grows with the text, not with sentences times
+    vocabulary.
+    """
+    # Tokenize everything in one regex pass; line breaks mark sentence ends
+    words = WORD_RE.findall('\n'.join(sentence.replace('\n', ' ') for sentence in sentences).lower())
+    vocabulary = {'\n': 0}
+    ids = np.fromiter(
+        [vocabulary.setdefault(word, len(vocabulary)) for word in words],
+        dtype=np.int64, count=len(words),
+    )
+    breaks = ids == 0
+    rows = np.cumsum(breaks)[~breaks]
+    cols = ids[~breaks]
+
+    # Drop stop words and bare numbers
+    ignored = np.zeros(len(vocabulary), dtype=bool)
+    ignored[[index for word, index in vocabulary.items() if word in STOP_WORDS or not word.isalpha()]] = True
+    kept = ~ignored[cols]
+    rows, cols = rows[kept], cols[kept]
+
+    # Count (sentence, term) pairs by sorting their flattened cell indexes
+    width = len(vocabulary)
+    cells, counts = np.unique(rows * width + cols, return_counts=True)
+    rows, cols = cells // width, cells % width
+
+    # Smoothed IDF, as in scikit-learn
+    document_frequency = np.bincount(cols, minlength=width)
+    idf = np.log((1 + len(sentences)) / (1 + document_frequency)) + 1
+    values = np.log1p(counts) * idf[cols]
+
+    norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=len(sentences)))
+    return rows, cols, values / norms[rows]
+
+
+def textrank(rows: np.ndarray, cols: np.ndarray, values: np.ndarray, size: int, damping: float = 0.85,
+             iterations: int = 50, tolerance: float = 1e-5) -> np.ndarray:
+    """PageRank over the cosine similarity graph of TF-IDF rows, without building the graph.
+
+    The similarity matrix is M @ M.T, so each product with it is two passes
+    over the nonzero cells of M; the diagonal (a sentence's similarity with
+    itself) is subtracted.
+    """
+    width = int(cols.max()) + 1 if len(cols) else 0
+    self_similarity = (np.bincount(rows, minlength=size) > 0).astype(np.float64)
+
+    def similarity_times(vector):
+        per_term = np.bincount(cols, weights=values * vector[rows], minlength=width)
+        return np.bincount(rows, weights=values * per_term[cols], minlength=size) - self_similarity * vector
+
+    # Each sentence spreads its score over its neighbours in proportion to
+    # similarity; sentences with no neighbours spread it evenly
+    out_weight = similarity_times(np.ones(size))
+    isolated = out_weight < 1e-9
+    out_weight[isolated] = 1
+
+    scores = np.full(size, 1.0 / size)
+    for _ in range(iterations):
+        spread = np.where(isolated, 0, scores / out_weight)
+        updated = (1 - damping) / size + damping * (similarity_times(spread) + scores[isolated].sum() / size)
+        if np.abs(updated - scores).sum() < tolerance:
+            return updated
+        scores = updated
+    return scores
+
+
+def rank_sentences(text: str):
+    """Return the sentences of text and their TextRank scores"""
+    sentences = split_sentences(text)
+    if len(sentences) < 2:
+        return sentences, np.ones(len(sentences))
+
+    return sentences, textrank(*tfidf_entries(sentences), len(sentences))
+
+
+def extractive_summary(text: str, sentence_count: int = 3) -> str:
+    """Pick the top-ranked sentences and join them in their original order"""
+    sentences, scores = rank_sentences(text)
+    if len(sentences) <= sentence_count:
+        return ' '.join(sentences)
+
+    top = np.sort(np.argpartition(-scores, sentence_count)[:sentence_count])
+    return ' '.join(sentences[index] for index in top)
+
+
+def shrink_text(text: str, max_tokens: int, count_tokens) -> str:
+    """Keep the highest-ranked sentences that fit in max_tokens, in original order.
+
+    Used as a cheap first pass before sending very long input to the LLM.
+    """
+    sentences, scores = rank_sentences(text)
+    budget = max_tokens
+    keep = []
+    for index in np.argsort(-scores, kind='stable'):
+        cost = count_tokens(sentences[index]) + 1
+        if cost <= budget:
+            keep.append(index)
+            budget -= cost
+    return ' '.join(sentences[index] for index in sorted(keep))
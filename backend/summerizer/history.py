@@ -0,0 +1,65 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from .models import HistoryDeletion, VideoSummary
+from .stats import summaries_removed
+
+logger = logging.getLogger(__name__)
+
+
+def start_history_deletion(user) -> HistoryDeletion:
+    """Record a deletion of every summary the user has right now"""
+    counts = VideoSummary.objects.filter(user=user).aggregate(total=Count('id'), max_id=Max('id'))
+    return HistoryDeletion.objects.create(user=user, **counts)
+
+
+def execute_history_deletion(deletion: HistoryDeletion) -> HistoryDeletion:
+    """Delete the summaries a deletion covers in batches, committing after each one.
+
+    A single DELETE of a large history holds the database write lock until it
+    finishes. Here each transaction removes at most BATCH_SIZE rows (picked
+    from the user's slice of the history index, deleted by primary key) and
+    other writers get their turn between batches.
+    """
+    config = settings.HISTORY_DELETE
+    deletion.status = HistoryDeletion.STATUS_RUNNING
+    deletion.save(update_fields=['status', 'updated_at'])
+
+    try:
+        if deletion.max_id is not None:
+            # Summaries added after the request are not part of it
+            pending = VideoSummary.objects.filter(user=deletion.user, id__lte=deletion.max_id)
+            while True:
+                ids = list(pending.values_list('pk', flat=True)[:config['BATCH_SIZE']])
+                if not ids:
+                    break
+                with transaction.atomic():
+                    _, deleted = VideoSummary.objects.filter(pk__in=ids).delete()
+                count = deleted.get(VideoSummary._meta.label, 0)
+
+                summaries_removed(deletion.user, count)
+                deletion.deleted += count
+                HistoryDeletion.objects.filter(pk=deletion.pk).update(
+                    deleted=F('deleted') + count, updated_at=timezone.now()
+                )
+                if config['PAUSE']:
+                    time.sleep(config['PAUSE'])
+        deletion.status = HistoryDeletion.STATUS_DONE
+    except Exception as e:
+        logger.error(f"History deletion {deletion.pk} failed: {str(e)}", exc_info=True)
+        deletion.error = str(e)
+        deletion.status = HistoryDeletion.STATUS_FAILED
+
+    deletion.save(update_fields=['status', 'deleted', 'error', 'updated_at'])
+    return deletion
+
+
+def run_history_deletion(deletion_id) -> HistoryDeletion:
+    """Run a recorded deletion, e.g. on the background pool"""
+    deletion = HistoryDeletion.objects.select_related('user').get(pk=deletion_id)
+    return execute_history_deletion(deletion)
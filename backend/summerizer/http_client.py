@@ -0,0 +1,157 @@
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class HostStats:
+    """Rolling latency and error counters for one upstream host"""
+
+    def __init__(self, window: int):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.samples = deque(maxlen=window)
+
+    def snapshot(self) -> dict:
+        samples = sorted(self.samples)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'p50_ms': _percentile(samples, 0.50),
+            'p95_ms': _percentile(samples, 0.95),
+            'max_ms': samples[-1] if samples else None,
+        }
+
+
+def _percentile(samples: list, fraction: float):
+    if not samples:
+        return None
+    index = min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))
+    return samples[index]
+
+
+class HttpClient:
+    """Pooled keep-alive HTTP session with timeouts, jittered retries and per-host stats"""
+
+    def __init__(self, config: dict):
+        self.connect_timeout = float(config.get('CONNECT_TIMEOUT', 3.05))
+        self.read_timeout = float(config.get('READ_TIMEOUT', 10))
+        self.max_retries = int(config.get('MAX_RETRIES', 2))
+        self.backoff_factor = float(config.get('BACKOFF_FACTOR', 0.3))
+        self.backoff_max = float(config.get('BACKOFF_MAX', 5))
+        self.stats_window = int(config.get('STATS_WINDOW', 200))
+
+        # Retries are handled here so they can be jittered and counted
+        adapter = HTTPAdapter(
+            pool_connections=int(config.get('POOL_CONNECTIONS', 10)),
+            pool_maxsize=int(config.get('POOL_MAXSIZE', 20)),
+            max_retries=0,
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = config.get('USER_AGENT', 'summerize-app/1.0')
+
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method: str, url: str, timeout=None, retries=None, deadline=None,
+                **kwargs) -> requests.Response:
+        """Send a request, retrying connection errors and retryable status codes.
+
+        With a ``deadline``, each attempt's timeouts are cut to the time left and
+        no retry is started that would back off past it.
+        """
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        retries = self.max_retries if retries is None else retries
+        host = urlparse(url).netloc
+
+        attempt = 0
+        while True:
+            attempt_timeout = timeout
+            if deadline is not None:
+                connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+                attempt_timeout = (deadline.timeout(connect_timeout), deadline.timeout(read_timeout))
+
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, timeout=attempt_timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(host, started, error=True, retry=attempt > 0)
+                if attempt >= retries or not self._can_retry(attempt, deadline):
+                    raise
+            else:
+                failed = response.status_code in RETRY_STATUS_CODES
+                self._record(host, started, error=failed, retry=attempt > 0)
+                if not failed or attempt >= retries or not self._can_retry(attempt, deadline):
+                    return response
+                response.close()
+
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _can_retry(self, attempt: int, deadline) -> bool:
+        # Worst-case backoff plus a connect timeout must still fit before the deadline
+        if deadline is None:
+            return True
+        worst_backoff = min(self.backoff_max, self.backoff_factor * (2 ** attempt))
+        return deadline.remaining() > worst_backoff + self.connect_timeout
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps retries from many workers from lining up
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * (2 ** attempt)))
+
+    def _record(self, host: str, started: float, error: bool, retry: bool) -> None:
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self._stats_lock:
+            stats = self._stats.setdefault(host, HostStats(self.stats_window))
+            stats.requests += 1
+            stats.errors += int(error)
+            stats.retries += int(retry)
+            stats.samples.append(elapsed_ms)
+
+    def stats(self) -> dict:
+        """Per-host request counts and latency percentiles"""
+        with self._stats_lock:
+            return {host: stats.snapshot() for host, stats in self._stats.items()}
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Return the process-wide HTTP client"""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = HttpClient(settings.HTTP_CLIENT)
+    return _http_client
+
+
+def reset_http_client() -> None:
+    """Close the shared client so it is rebuilt from settings"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is not None:
+            _http_client.close()
+        _http_client = None
@@ -0,0 +1,233 @@
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .http_client import get_http_client
+from .models import IngestionRun
+from .pipeline import summarize_video
+from .scheduler import PRIORITY_BATCH
+from .video_ids import canonical_video_url
+
+logger = logging.getLogger(__name__)
+
+YOUTUBE_BASE_URL = 'https://www.youtube.com'
+
+LISTING_VIDEO_ID_RE = re.compile(r'"videoId":"([A-Za-z0-9_-]{11})"')
+CONTINUATION_RE = re.compile(r'"continuationCommand":\{"token":"([^"]+)"')
+API_KEY_RE = re.compile(r'"INNERTUBE_API_KEY":"([^"]+)"')
+CLIENT_VERSION_RE = re.compile(r'"INNERTUBE_CLIENT_VERSION":"([^"]+)"')
+CHANNEL_PATH_RE = re.compile(r'^/(@[^/]+|channel/[^/]+|c/[^/]+|user/[^/]+)')
+
+
+def listing_url(source_url: str) -> str:
+    """Map a playlist or channel URL to the page that lists its videos"""
+    parsed = urlparse(source_url)
+    host = (parsed.hostname or '').lower()
+    if not host.endswith('youtube.com'):
+        raise ValueError(f"Not a YouTube URL: {source_url}")
+
+    playlist_id = parse_qs(parsed.query).get('list', [None])[0]
+    if playlist_id:
+        return f"{YOUTUBE_BASE_URL}/playlist?list={playlist_id}"
+
+    channel = CHANNEL_PATH_RE.match(parsed.path)
+    if channel:
+        return f"{YOUTUBE_BASE_URL}/{channel.group(1)}/videos"
+
+    raise ValueError(f"Not a playlist or channel URL: {source_url}")
+
+
+def _parse_listing(text: str, seen: set) -> tuple:
+    """Pull new video IDs and the next continuation token out of a listing response"""
+    video_ids = []
+    for video_id in LISTING_VIDEO_ID_RE.findall(text):
+        if video_id not in seen:
+            seen.add(video_id)
+            video_ids.append(video_id)
+
+    continuation = CONTINUATION_RE.search(text)
+    return video_ids, continuation.group(1) if continuation else None
+
+
+def iter_listing_pages(source_url: str, state: dict = None, seen: set = None):
+    """Yield ``(video_ids, state)`` for each page of a playlist or channel listing.
+
+    ``state`` is the continuation to resume from (None starts at the first
+    page); the yielded state resumes after that page and is None on the last.
+    """
+    client = get_http_client()
+    seen = set() if seen is None else seen
+
+    if state is None:
+        response = client.get(listing_url(source_url))
+        response.raise_for_status()
+        video_ids, token = _parse_listing(response.text, seen)
+
+        api_key = API_KEY_RE.search(response.text)
+        client_version = CLIENT_VERSION_RE.search(response.text)
+        state = {
+            'token': token,
+            'api_key': api_key.group(1) if api_key else '',
+            'client_version': client_version.group(1) if client_version else '2.20240101.00.00',
+        }
+        yield video_ids, state if token else None
+
+    for _ in range(settings.INGESTION['MAX_PAGES']):
+        if not state or not state.get('token'):
+            return
+
+        # Later pages come from the same browse API the YouTube web client uses
+        response = client.post(
+            f"{YOUTUBE_BASE_URL}/youtubei/v1/browse",
+            params={'key': state['api_key']},
+            json={
+                'context': {'client': {'clientName': 'WEB', 'clientVersion': state['client_version']}},
+                'continuation': state['token'],
+            },
+        )
+        response.raise_for_status()
+        video_ids, token = _parse_listing(response.text, seen)
+        state = {**state, 'token': token} if token else None
+        yield video_ids, state
+
+
+class IngestionWorker:
+    """Streams a run's videos through the summarize pipeline with bounded backlog"""
+
+    def __init__(self, run: IngestionRun, workers: int = None, max_pending: int = None):
+        config = settings.INGESTION
+        self.run = run
+        # Resolved up front so worker threads never lazy-load it
+        self.user = run.user
+        self.workers = workers or config['WORKERS']
+        # At most this many videos are resolved but not yet finished
+        self.pending_slots = threading.BoundedSemaphore(max_pending or config['MAX_PENDING'])
+        self.checkpoint_every = config['CHECKPOINT_EVERY']
+
+        self._lock = threading.Lock()
+        self._finished = {}
+        self._since_checkpoint = 0
+
+    def iter_video_ids(self):
+        """Yield ``(index, video_id)`` from the checkpoint on, resolving more pages as needed"""
+        run = self.run
+        index = run.next_index
+        while index < len(run.video_ids):
+            yield index, run.video_ids[index]
+            index += 1
+
+        if run.listing_complete:
+            return
+
+        pages = iter_listing_pages(run.source_url, run.listing_state, set(run.video_ids))
+        for video_ids, state in pages:
+            run.video_ids.extend(video_ids)
+            run.listing_state = state
+            run.listing_complete = state is None
+            run.save(update_fields=['video_ids', 'listing_state', 'listing_complete', 'updated_at'])
+
+            while index < len(run.video_ids):
+                yield index, run.video_ids[index]
+                index += 1
+
+        if not run.listing_complete:
+            # Stopped at MAX_PAGES
+            run.listing_complete = True
+            run.save(update_fields=['listing_complete', 'updated_at'])
+
+    def process(self, index: int, video_id: str) -> None:
+        try:
+            summarize_video(self.user, canonical_video_url(video_id), priority=PRIORITY_BATCH)
+            succeeded = True
+        except Exception as e:
+            logger.error(f"Ingestion of {video_id} failed: {str(e)}")
+            succeeded = False
+        finally:
+            connections.close_all()
+            self.pending_slots.release()
+
+        with self._lock:
+            self._finished[index] = succeeded
+
+    def checkpoint(self, force: bool = False) -> None:
+        """Advance next_index over the finished prefix and persist it"""
+        run = self.run
+        with self._lock:
+            while run.next_index in self._finished:
+                if self._finished.pop(run.next_index):
+                    run.succeeded += 1
+                else:
+                    run.failed += 1
+                run.next_index += 1
+                self._since_checkpoint += 1
+
+            if not force and self._since_checkpoint < self.checkpoint_every:
+                return
+            self._since_checkpoint = 0
+
+        run.save(update_fields=['next_index', 'succeeded', 'failed', 'updated_at'])
+
+    def run_to_completion(self) -> IngestionRun:
+        run = self.run
+        run.status = IngestionRun.STATUS_RUNNING
+        run.error = ''
+        run.save(update_fields=['status', 'error', 'updated_at'])
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ingestion') as pool:
+                for index, video_id in self.iter_video_ids():
+                    # Blocks while the backlog is full, so listing never runs far ahead
+                    self.pending_slots.acquire()
+                    pool.submit(self.process, index, video_id)
+                    self.checkpoint()
+            self.checkpoint(force=True)
+            run.status = IngestionRun.STATUS_DONE
+        except Exception as e:
+            logger.error(f"Ingestion run {run.pk} failed: {str(e)}", exc_info=True)
+            self.checkpoint(force=True)
+            run.status = IngestionRun.STATUS_FAILED
+            run.error = str(e)
+
+        run.save(update_fields=['status', 'error', 'updated_at'])
+        return run
+
+
+def run_ingestion(run_id) -> IngestionRun:
+    """Run (or resume) an ingestion from its last checkpoint"""
+    run = IngestionRun.objects.select_related('user').get(pk=run_id)
+    return IngestionWorker(run).run_to_completion()
+
+
+def is_resumable(run: IngestionRun) -> bool:
+    """A run can resume unless it finished or another worker has it queued or running"""
+    if run.status == IngestionRun.STATUS_DONE:
+        return False
+    if run.status in (IngestionRun.STATUS_QUEUED, IngestionRun.STATUS_RUNNING):
+        stale_after = settings.INGESTION['STALE_AFTER']
+        return (timezone.now() - run.updated_at).total_seconds() > stale_after
+    return True
+
+
+def claim_for_resume(run: IngestionRun, status: str) -> bool:
+    """Move a resumable run to ``status``, unless a concurrent resume claimed it first.
+
+    The update only matches the status and updated_at that were checked, so
+    of two resumes racing on one run only one gets it. On failure ``run``
+    is refreshed to show who has it.
+    """
+    if is_resumable(run):
+        now = timezone.now()
+        claimed = IngestionRun.objects.filter(
+            pk=run.pk, status=run.status, updated_at=run.updated_at
+        ).update(status=status, updated_at=now)
+        if claimed:
+            run.status, run.updated_at = status, now
+            return True
+    run.refresh_from_db(fields=['status', 'updated_at'])
+    return False
@@ -0,0 +1,117 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import SummaryJob
+from .pipeline import summarize_video
+from .scheduler import PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool that runs background work"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.SUMMARY_JOBS['WORKERS'],
+                    thread_name_prefix='summary-job',
+                )
+    return _executor
+
+
+def run_in_background(func, *args) -> None:
+    """Run a function on the worker pool once the current transaction commits"""
+    def submit():
+        get_executor().submit(_run_with_fresh_connection, func, *args)
+
+    transaction.on_commit(submit)
+
+
+def _run_with_fresh_connection(func, *args):
+    # Pool threads outlive requests, so they manage their own DB connections
+    close_old_connections()
+    try:
+        return func(*args)
+    except Exception:
+        logger.exception("Background task %s failed", getattr(func, '__name__', func))
+    finally:
+        close_old_connections()
+
+
+def enqueue_summary_job(user, url: str) -> SummaryJob:
+    """Queue a summarization job and hand it to the configured backend"""
+    job = SummaryJob.objects.create(user=user, video_url=url)
+
+    # The database backend leaves the job for `manage.py run_summary_worker`
+    if settings.SUMMARY_JOBS['BACKEND'] == 'thread':
+        run_in_background(run_job, job.pk)
+
+    return job
+
+
+def claim_job(job_id=None) -> Optional[SummaryJob]:
+    """Atomically move a queued job to running, returning it if we won the race"""
+    queued = SummaryJob.objects.filter(status=SummaryJob.STATUS_QUEUED)
+    if job_id is not None:
+        queued = queued.filter(pk=job_id)
+
+    candidate = queued.order_by('created_at').values_list('pk', flat=True).first()
+    if candidate is None:
+        return None
+
+    # The conditional update is the lock: only one worker sees a row count of 1
+    claimed = SummaryJob.objects.filter(
+        pk=candidate, status=SummaryJob.STATUS_QUEUED
+    ).update(status=SummaryJob.STATUS_RUNNING, started_at=timezone.now())
+    if not claimed:
+        return None
+
+    return SummaryJob.objects.select_related('user').get(pk=candidate)
+
+
+def execute_job(job: SummaryJob) -> SummaryJob:
+    """Run the summarize pipeline for a claimed job and record the outcome"""
+    try:
+        summary_obj, _ = summarize_video(job.user, job.video_url, priority=PRIORITY_BACKGROUND)
+        job.summary = summary_obj
+        job.status = SummaryJob.STATUS_DONE
+    except Exception as e:
+        logger.error(f"Summary job {job.pk} failed: {str(e)}", exc_info=True)
+        job.error = str(e)
+        job.status = SummaryJob.STATUS_FAILED
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['summary', 'status', 'error', 'finished_at'])
+    return job
+
+
+def run_job(job_id) -> Optional[SummaryJob]:
+    """Claim and execute one specific job"""
+    job = claim_job(job_id)
+    return execute_job(job) if job else None
+
+
+def run_next_job() -> Optional[SummaryJob]:
+    """Claim and execute the oldest queued job"""
+    job = claim_job()
+    return execute_job(job) if job else None
+
+
+def requeue_stale_jobs(older_than: timedelta) -> int:
+    """Put jobs left running by a crashed worker back in the queue"""
+    return SummaryJob.objects.filter(
+        status=SummaryJob.STATUS_RUNNING,
+        started_at__lt=timezone.now() - older_than,
+    ).update(status=SummaryJob.STATUS_QUEUED, started_at=None)
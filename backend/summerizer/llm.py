@@ -0,0 +1,391 @@
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+import openai
+from django.conf import settings
+
+from .breaker import CircuitBreaker, CircuitOpenError, is_upstream_failure
+from .deadline import Deadline, DeadlineExceeded, get_deadline
+from .extractive import extractive_summary
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LLMResponse:
+    """One chat completion, with the provider's token accounting when it reports one"""
+    text: str
+    provider: str
+    model: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+class OpenAIProvider:
+    """Chat completions through the OpenAI v1 client"""
+    api_key_env = 'OPENAI_API_KEY'
+
+    def __init__(self, name: str, model: str, timeout: float):
+        self.name = name
+        self.model = model
+        self.timeout = timeout
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def build_client(self):
+        # Retries are left to the router, which can fail over instead
+        return openai.OpenAI(api_key=os.getenv(self.api_key_env), timeout=self.timeout, max_retries=0)
+
+    def get_client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self.build_client()
+        return self._client
+
+    def create(self, **kwargs):
+        return self.get_client().chat.completions.create(**kwargs)
+
+    def complete(self, messages: list, max_tokens: int, timeout: float = None) -> LLMResponse:
+        response = self.create(
+            model=self.model, messages=messages, max_tokens=max_tokens, timeout=timeout or self.timeout
+        )
+        usage = getattr(response, 'usage', None)
+        return LLMResponse(
+            text=(response.choices[0].message.content or '').strip(),
+            provider=self.name,
+            model=self.model,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None,
+        )
+
+    def stream(self, messages: list, max_tokens: int) -> Iterator[str]:
+        response = self.create(model=self.model, messages=messages, max_tokens=max_tokens, stream=True)
+        for chunk in response:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content or ''
+
+
+class GroqProvider(OpenAIProvider):
+    """Chat completions through Groq, whose client mirrors the OpenAI one"""
+    api_key_env = 'GROQ_API_KEY'
+
+    def build_client(self):
+        import groq
+
+        return groq.Groq(api_key=os.getenv(self.api_key_env), timeout=self.timeout, max_retries=0)
+
+
+class EchoProvider:
+    """Offline provider for tests and development: answers with an extractive summary.
+
+    ``delay`` is added before each completion and between streamed words.
+    """
+
+    def __init__(self, name: str = 'echo', model: str = 'echo', timeout: float = None, delay: float = 0.0):
+        self.name = name
+        self.model = model
+        self.delay = delay
+
+    def summarize(self, messages: list) -> str:
+        # Drop the instruction in front of the text, e.g. "Please summarize ...: "
+        text = messages[-1]['content'].split(': ', 1)[-1]
+        return extractive_summary(text, sentence_count=3)
+
+    def complete(self, messages: list, max_tokens: int, timeout: float = None) -> LLMResponse:
+        if self.delay:
+            if timeout is not None and timeout < self.delay:
+                time.sleep(timeout)
+                raise TimeoutError(f"{self.name} timed out")
+            time.sleep(self.delay)
+        return LLMResponse(text=self.summarize(messages), provider=self.name, model=self.model)
+
+    def stream(self, messages: list, max_tokens: int) -> Iterator[str]:
+        for word in re.findall(r'\S+\s*', self.summarize(messages)):
+            if self.delay:
+                time.sleep(self.delay)
+            yield word
+
+
+PROVIDER_CLASSES = {
+    'openai': OpenAIProvider,
+    'groq': GroqProvider,
+    'echo': EchoProvider,
+}
+
+
+class ProviderStats:
+    """Rolling latency of successful calls, recent outcomes and call counts"""
+
+    def __init__(self, window: int):
+        self.calls = 0
+        self.failures = 0
+        self.samples = deque(maxlen=window)
+        # (time, failed) of the latest calls, whatever the error
+        self.outcomes = deque(maxlen=window)
+
+    def failure_rate(self, since: float) -> Optional[float]:
+        """Share of the calls made after ``since`` that failed, None without any"""
+        recent = [failed for at, failed in self.outcomes if at >= since]
+        if not recent:
+            return None
+        return sum(recent) / len(recent)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))]
+
+    def snapshot(self) -> dict:
+        p50 = self.percentile(0.50)
+        p95 = self.percentile(0.95)
+        failure_rate = self.failure_rate(float('-inf'))
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'failure_rate': round(failure_rate, 3) if failure_rate is not None else None,
+            'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class LLMRouter:
+    """Sends each completion to the fastest healthy provider, optionally hedged.
+
+    Providers are ranked by their rolling median latency, stretched by the
+    share of their calls that failed in the last FAILURE_WINDOW seconds.
+    Providers without latency samples come after measured ones, and ones
+    failing at MAX_FAILURE_RATE or more go last, whether or not their errors
+    count against the circuit (a rejected API key is a 4xx). Each provider sits
+    behind its own circuit breaker, and providers whose circuit is open are
+    skipped; when all of them are, CircuitOpenError is raised straight away.
+    Failed calls fall over to the next provider. With HEDGE on, a call still
+    pending after the primary's p95 latency is also sent to the runner-up and
+    whichever answers first wins.
+    """
+
+    def __init__(self, config: dict, providers: list = None, breaker_config: dict = None):
+        self.hedge = bool(config.get('HEDGE', False))
+        self.hedge_delay = float(config.get('HEDGE_DELAY', 2.0))
+        self.min_samples = int(config.get('MIN_SAMPLES', 10))
+        self.timeout = float(config.get('TIMEOUT', 30))
+        self.failure_window = float(config.get('FAILURE_WINDOW', 300))
+        self.max_failure_rate = float(config.get('MAX_FAILURE_RATE', 0.5))
+
+        if providers is None:
+            models = config.get('MODELS', {})
+            providers = [
+                PROVIDER_CLASSES[name](name, models.get(name, ''), self.timeout)
+                for name in config.get('PROVIDERS', ['openai'])
+            ]
+        if not providers:
+            raise ValueError("At least one LLM provider must be configured")
+        self.providers = providers
+
+        window = int(config.get('LATENCY_WINDOW', 100))
+        self._stats = {provider.name: ProviderStats(window) for provider in providers}
+        breaker_config = settings.CIRCUIT_BREAKER if breaker_config is None else breaker_config
+        self.breakers = {
+            provider.name: CircuitBreaker(f"llm:{provider.name}", breaker_config) for provider in providers
+        }
+        self._lock = threading.Lock()
+        # Hedged calls run here; a losing call is left to finish in the background
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(config.get('MAX_WORKERS', 8)), thread_name_prefix='llm'
+        )
+
+    def ranked_providers(self) -> list:
+        """Providers whose circuit isn't open: healthy ones fastest first, then unmeasured, then failing"""
+        available = [provider for provider in self.providers if self.breakers[provider.name].available()]
+        if not available:
+            raise CircuitOpenError("Every LLM provider's circuit is open")
+
+        since = time.monotonic() - self.failure_window
+        with self._lock:
+            def rank(provider):
+                stats = self._stats[provider.name]
+                failure_rate = stats.failure_rate(since) or 0.0
+                median = stats.percentile(0.50)
+                if failure_rate >= self.max_failure_rate:
+                    return (2, failure_rate)
+                if median is None:
+                    return (1, failure_rate)
+                # Expected time to a successful answer
+                return (0, median / (1 - failure_rate))
+
+            return sorted(available, key=rank)
+
+    def record(self, provider, started: float, error: bool, sample: bool = True) -> None:
+        with self._lock:
+            stats = self._stats[provider.name]
+            stats.calls += 1
+            stats.outcomes.append((time.monotonic(), error))
+            if error:
+                stats.failures += 1
+            elif sample:
+                stats.samples.append(time.monotonic() - started)
+
+    def hedge_after(self, provider) -> float:
+        """Seconds to wait for the primary before hedging: its p95 once it is known"""
+        with self._lock:
+            stats = self._stats[provider.name]
+            if len(stats.samples) < self.min_samples:
+                return self.hedge_delay
+            return stats.percentile(0.95)
+
+    def call(self, provider, messages: list, max_tokens: int, deadline: Deadline = None) -> LLMResponse:
+        """Run one completion on one provider and record how it went"""
+        timeout = get_deadline(deadline).timeout(self.timeout)
+        started = time.monotonic()
+        try:
+            response = self.breakers[provider.name].call(provider.complete, messages, max_tokens, timeout)
+        except CircuitOpenError:
+            raise
+        except Exception:
+            self.record(provider, started, error=True)
+            raise
+        self.record(provider, started, error=False)
+        return response
+
+    def complete(self, messages: list, max_tokens: int, deadline: Deadline = None, reserve_hedge=None) -> LLMResponse:
+        """Get one completion, failing over (and hedging) across providers.
+
+        Each call's timeout is cut to what is left of ``deadline``, and no
+        provider is tried once it has passed. ``reserve_hedge`` is asked
+        before a hedged request is sent, which is skipped when it returns
+        False (no rate limit headroom for a second request).
+        """
+        deadline = get_deadline(deadline)
+        candidates = self.ranked_providers()
+        if self.hedge and len(candidates) > 1:
+            return self._complete_hedged(candidates, messages, max_tokens, deadline, reserve_hedge)
+
+        error = None
+        for provider in candidates:
+            if error is not None and deadline.expired():
+                break
+            try:
+                return self.call(provider, messages, max_tokens, deadline)
+            except Exception as e:
+                logger.warning(f"LLM provider {provider.name} failed: {str(e)}")
+                error = e
+        raise error
+
+    def _complete_hedged(self, candidates: list, messages: list, max_tokens: int, deadline: Deadline,
+                         reserve_hedge=None) -> LLMResponse:
+        remaining = list(candidates)
+        pending = {}
+        error = None
+        hedging = True
+
+        def launch():
+            provider = remaining.pop(0)
+            pending[self._executor.submit(self.call, provider, messages, max_tokens, deadline)] = provider
+
+        launch()
+        while pending:
+            # Wait for an answer, but only up to the primary's p95 while there is
+            # still someone to hedge with
+            timeout = deadline.remaining()
+            if remaining and hedging:
+                timeout = min(timeout, self.hedge_after(next(iter(pending.values()))))
+            done, _ = wait(pending, timeout=None if math.isinf(timeout) else timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if deadline.expired():
+                    raise DeadlineExceeded("Request deadline exceeded waiting for the LLM")
+                if reserve_hedge is not None and not reserve_hedge():
+                    logger.info("Not hedging LLM call: no rate limit headroom")
+                    hedging = False
+                    continue
+                logger.info(f"Hedging LLM call to {remaining[0].name} after {timeout:.2f}s")
+                launch()
+                continue
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    logger.warning(f"LLM provider {provider.name} failed: {str(e)}")
+                    error = e
+            if not pending and remaining and not deadline.expired():
+                launch()
+        raise error
+
+    def stream(self, messages: list, max_tokens: int) -> Iterator[str]:
+        """Stream a completion, failing over to the next provider until the first token"""
+        error = None
+        for provider in self.ranked_providers():
+            breaker = self.breakers[provider.name]
+            started = time.monotonic()
+            try:
+                probe = breaker.acquire()
+            except CircuitOpenError as e:
+                error = e
+                continue
+            try:
+                tokens = iter(provider.stream(messages, max_tokens))
+                first = next(tokens, None)
+            except Exception as e:
+                if is_upstream_failure(e):
+                    breaker.record_failure(probe)
+                else:
+                    breaker.record_success(probe)
+                self.record(provider, started, error=True)
+                logger.warning(f"LLM provider {provider.name} failed: {str(e)}")
+                error = e
+                continue
+
+            # Time to first token isn't comparable with completion latency,
+            # so streams only count towards health
+            breaker.record_success(probe)
+            self.record(provider, started, error=False, sample=False)
+            if first is not None:
+                yield first
+            yield from tokens
+            return
+        raise error
+
+    def stats(self) -> dict:
+        """Per-provider call counts, failures, latency percentiles and circuit state"""
+        with self._lock:
+            snapshots = {provider.name: self._stats[provider.name].snapshot() for provider in self.providers}
+        return {
+            name: {**snapshot, 'circuit': self.breakers[name].stats()}
+            for name, snapshot in snapshots.items()
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_llm_router() -> LLMRouter:
+    """Return the process-wide LLM router"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = LLMRouter(settings.LLM)
+    return _router
+
+
+def reset_llm_router() -> None:
+    """Drop the shared router so it is rebuilt from settings"""
+    global _router
+    with _router_lock:
+        if _router is not None:
+            _router.close()
+        _router = None
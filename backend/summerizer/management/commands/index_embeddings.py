@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from summerizer.embeddings import get_embedding_index, index_videos
+from summerizer.models import Video
+
+
+class Command(BaseCommand):
+    help = "Add videos that aren't in the related-summaries index yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        index = get_embedding_index()
+        video_ids = index.missing(Video.objects.values_list('video_id', flat=True).iterator())
+        batch_size = options['batch_size']
+
+        indexed = 0
+        for start in range(0, len(video_ids), batch_size):
+            videos = Video.objects.filter(video_id__in=video_ids[start:start + batch_size])
+            indexed += index_videos(videos.only('video_id', 'title', 'summary'))
+        self.stdout.write(f"Indexed {indexed} video(s); the index holds {len(index)}")
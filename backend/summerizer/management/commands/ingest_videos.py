@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from summerizer.ingestion import IngestionWorker, claim_for_resume, listing_url
+from summerizer.models import IngestionRun
+
+
+class Command(BaseCommand):
+    help = "Summarize every video of a YouTube playlist or channel, resuming interrupted runs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('source_url', nargs='?', help="Playlist or channel URL")
+        parser.add_argument('--user', help="Email of the user the summaries belong to")
+        parser.add_argument('--resume', metavar='RUN_ID', help="Resume an existing run from its checkpoint")
+        parser.add_argument('--workers', type=int, help="Videos summarized concurrently")
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            run = IngestionRun.objects.select_related('user').filter(pk=options['resume']).first()
+            if run is None:
+                raise CommandError(f"No ingestion run {options['resume']}")
+            if not claim_for_resume(run, IngestionRun.STATUS_RUNNING):
+                raise CommandError(f"Run {run.pk} is {run.status} and can't be resumed")
+        else:
+            if not options['source_url'] or not options['user']:
+                raise CommandError("Pass a source URL and --user, or --resume RUN_ID")
+            try:
+                listing_url(options['source_url'])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+            user = get_user_model().objects.filter(email=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user with email {options['user']}")
+            run = IngestionRun.objects.create(user=user, source_url=options['source_url'])
+
+        self.stdout.write(f"Ingestion run {run.pk}: starting at video {run.next_index}")
+        run = IngestionWorker(run, workers=options['workers']).run_to_completion()
+        self.stdout.write(
+            f"Ingestion run {run.pk}: {run.status}, {run.succeeded} succeeded, "
+            f"{run.failed} failed, {len(run.video_ids)} video(s) listed"
+        )
+        if run.status == IngestionRun.STATUS_FAILED:
+            raise CommandError(run.error)
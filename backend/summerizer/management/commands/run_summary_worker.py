@@ -0,0 +1,47 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from summerizer.jobs import requeue_stale_jobs, run_next_job
+
+
+class Command(BaseCommand):
+    help = "Process queued summary jobs from the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.SUMMARY_JOBS['WORKERS'])
+        parser.add_argument('--poll-interval', type=float, default=settings.SUMMARY_JOBS['POLL_INTERVAL'])
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=settings.SUMMARY_JOBS['STALE_AFTER'])
+        requeued = requeue_stale_jobs(stale_after)
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s)")
+
+        workers = options['workers']
+        self.stdout.write(f"Starting summary worker with {workers} thread(s)")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='summary-worker') as pool:
+            results = list(pool.map(lambda _: self.work(options), range(workers)))
+
+        self.stdout.write(f"Processed {sum(results)} job(s)")
+
+    def work(self, options) -> int:
+        processed = 0
+        try:
+            while True:
+                job = run_next_job()
+                if job is not None:
+                    processed += 1
+                    self.stdout.write(f"Job {job.pk}: {job.status}")
+                    continue
+                if options['once']:
+                    return processed
+                time.sleep(options['poll_interval'])
+        finally:
+            close_old_connections()
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+from summerizer.video_ids import extract_video_id
+
+
+def backfill_video_ids(apps, schema_editor):
+    """Fill in video_id and merge each user's duplicate rows of a video, keeping the newest"""
+    VideoSummary = apps.get_model("summerizer", "VideoSummary")
+    SummaryJob = apps.get_model("summerizer", "SummaryJob")
+
+    kept = {}
+    to_update = []
+    duplicates = {}
+    rows = VideoSummary.objects.order_by("user_id", "-created_at", "-id").only(
+        "id", "user_id", "video_url", "created_at"
+    )
+    for row in rows.iterator(chunk_size=2000):
+        row.video_id = extract_video_id(row.video_url)
+        if row.video_id is None:
+            continue
+        key = (row.user_id, row.video_id)
+        if key in kept:
+            duplicates[row.pk] = kept[key]
+        else:
+            kept[key] = row.pk
+            to_update.append(row)
+
+    for duplicate_id, kept_id in duplicates.items():
+        SummaryJob.objects.filter(summary_id=duplicate_id).update(summary_id=kept_id)
+    duplicate_ids = list(duplicates)
+    for start in range(0, len(duplicate_ids), 500):
+        VideoSummary.objects.filter(pk__in=duplicate_ids[start:start + 500]).delete()
+
+    VideoSummary.objects.bulk_update(to_update, ["video_id"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("summerizer", "0002_summary_cache_jobs_ingestion"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="videosummary",
+            name="video_id",
+            field=models.CharField(blank=True, max_length=11, null=True),
+        ),
+        migrations.RunPython(backfill_video_ids, migrations.RunPython.noop),
+    ]
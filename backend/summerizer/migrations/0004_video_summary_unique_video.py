@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separate from the backfill: some databases refuse schema changes in the
+    # same transaction as the data changes before them
+
+    dependencies = [
+        ("summerizer", "0003_video_summary_video_id"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="videosummary",
+            constraint=models.UniqueConstraint(
+                fields=("user", "video_id"), name="unique_user_video_summary"
+            ),
+        ),
+    ]
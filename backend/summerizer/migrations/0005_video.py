@@ -0,0 +1,119 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:42
+
+import logging
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+def move_to_videos(apps, schema_editor):
+    """Create one shared Video per video ID from the newest summary of it and point summaries at it"""
+    Video = apps.get_model("summerizer", "Video")
+    VideoSummary = apps.get_model("summerizer", "VideoSummary")
+
+    # Rows whose URL isn't a YouTube video have nothing to share and can't be
+    # refreshed; they are logged so they can be recovered from a backup
+    unparsed = VideoSummary.objects.filter(legacy_video_id__isnull=True)
+    dropped = 0
+    for row in unparsed.only("id", "user_id", "video_url", "title").iterator(chunk_size=2000):
+        logger.warning(
+            f"Dropping summary {row.pk} of user {row.user_id} without a video ID: {row.video_url} ({row.title})"
+        )
+        dropped += 1
+    if dropped:
+        unparsed.delete()
+        logger.warning(f"Dropped {dropped} summaries whose URL has no YouTube video ID")
+
+    videos = {}
+    rows = VideoSummary.objects.order_by("-created_at", "-id").only(
+        "legacy_video_id", "title", "summary", "thumbnail_url", "duration"
+    )
+    for row in rows.iterator(chunk_size=2000):
+        if row.legacy_video_id not in videos:
+            videos[row.legacy_video_id] = Video(
+                video_id=row.legacy_video_id,
+                video_url=f"https://www.youtube.com/watch?v={row.legacy_video_id}",
+                title=row.title,
+                summary=row.summary,
+                thumbnail_url=row.thumbnail_url,
+                duration=row.duration,
+            )
+    Video.objects.bulk_create(list(videos.values()), batch_size=500)
+    VideoSummary.objects.update(video_id=F("legacy_video_id"))
+
+
+def copy_from_videos(apps, schema_editor):
+    """Put each video's fields back on every summary of it"""
+    VideoSummary = apps.get_model("summerizer", "VideoSummary")
+
+    rows = []
+    for row in VideoSummary.objects.select_related("video").iterator(chunk_size=2000):
+        row.legacy_video_id = row.video.video_id
+        row.title = row.video.title
+        row.summary = row.video.summary
+        row.thumbnail_url = row.video.thumbnail_url
+        row.duration = row.video.duration
+        rows.append(row)
+    VideoSummary.objects.bulk_update(
+        rows, ["legacy_video_id", "title", "summary", "thumbnail_url", "duration"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("summerizer", "0004_video_summary_unique_video"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Video",
+            fields=[
+                ("video_id", models.CharField(max_length=11, primary_key=True, serialize=False)),
+                ("video_url", models.URLField()),
+                ("title", models.CharField(max_length=255)),
+                ("summary", models.TextField()),
+                ("thumbnail_url", models.URLField(blank=True, null=True)),
+                ("duration", models.CharField(blank=True, max_length=50)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name="videosummary",
+            name="unique_user_video_summary",
+        ),
+        # Frees the video_id column name for the foreign key
+        migrations.RenameField(
+            model_name="videosummary",
+            old_name="video_id",
+            new_name="legacy_video_id",
+        ),
+        # Nullable until 0006 drops them, so they can be added back when unapplying
+        migrations.AlterField(
+            model_name="videosummary",
+            name="title",
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name="videosummary",
+            name="summary",
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name="videosummary",
+            name="video",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="summaries",
+                to="summerizer.video",
+            ),
+        ),
+        migrations.RunPython(move_to_videos, copy_from_videos),
+    ]
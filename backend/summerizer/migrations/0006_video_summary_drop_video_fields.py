@@ -0,0 +1,50 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separate from the data move for the same reason as 0004
+
+    dependencies = [
+        ("summerizer", "0005_video"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="videosummary",
+            name="legacy_video_id",
+        ),
+        migrations.RemoveField(
+            model_name="videosummary",
+            name="title",
+        ),
+        migrations.RemoveField(
+            model_name="videosummary",
+            name="summary",
+        ),
+        migrations.RemoveField(
+            model_name="videosummary",
+            name="thumbnail_url",
+        ),
+        migrations.RemoveField(
+            model_name="videosummary",
+            name="duration",
+        ),
+        migrations.AlterField(
+            model_name="videosummary",
+            name="video",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="summaries",
+                to="summerizer.video",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="videosummary",
+            constraint=models.UniqueConstraint(
+                fields=("user", "video"), name="unique_user_video_summary"
+            ),
+        ),
+    ]
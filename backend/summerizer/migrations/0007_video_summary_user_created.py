@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("summerizer", "0006_video_summary_drop_video_fields"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="videosummary",
+            options={
+                "ordering": ["-created_at", "-id"],
+                "verbose_name_plural": "Video Summaries",
+            },
+        ),
+        # Before the user_id index it replaces is dropped
+        migrations.AddIndex(
+            model_name="videosummary",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="videosummary_user_created"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="videosummary",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("summerizer", "0007_video_summary_user_created"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SummaryCounter",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("last_summary_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
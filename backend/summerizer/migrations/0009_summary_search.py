@@ -0,0 +1,87 @@
+from django.db import migrations
+
+# Contentless FTS5 index over each user's history rows (rowid = VideoSummary.id):
+# the text stays in summerizer_video and is only tokenized here. Triggers keep
+# it in sync; a contentless index deletes by re-supplying the indexed values.
+# SQLite rebuilds a table on most ALTERs, which drops its triggers, so later
+# migrations that alter either table have to create these triggers again.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE summerizer_videosummary_fts USING fts5(
+        title, summary, video_url, content='', tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER summerizer_videosummary_fts_insert AFTER INSERT ON summerizer_videosummary BEGIN
+        INSERT INTO summerizer_videosummary_fts(rowid, title, summary, video_url)
+        SELECT new.id, video.title, video.summary, new.video_url
+        FROM summerizer_video AS video WHERE video.video_id = new.video_id;
+    END
+    """,
+    """
+    CREATE TRIGGER summerizer_videosummary_fts_delete AFTER DELETE ON summerizer_videosummary BEGIN
+        INSERT INTO summerizer_videosummary_fts(summerizer_videosummary_fts, rowid, title, summary, video_url)
+        SELECT 'delete', old.id, video.title, video.summary, old.video_url
+        FROM summerizer_video AS video WHERE video.video_id = old.video_id;
+    END
+    """,
+    """
+    CREATE TRIGGER summerizer_videosummary_fts_update AFTER UPDATE OF video_url, video_id ON summerizer_videosummary BEGIN
+        INSERT INTO summerizer_videosummary_fts(summerizer_videosummary_fts, rowid, title, summary, video_url)
+        SELECT 'delete', old.id, video.title, video.summary, old.video_url
+        FROM summerizer_video AS video WHERE video.video_id = old.video_id;
+        INSERT INTO summerizer_videosummary_fts(rowid, title, summary, video_url)
+        SELECT new.id, video.title, video.summary, new.video_url
+        FROM summerizer_video AS video WHERE video.video_id = new.video_id;
+    END
+    """,
+    # A refreshed video is re-indexed in the history of everyone who has it
+    """
+    CREATE TRIGGER summerizer_video_fts_update AFTER UPDATE OF title, summary ON summerizer_video BEGIN
+        INSERT INTO summerizer_videosummary_fts(summerizer_videosummary_fts, rowid, title, summary, video_url)
+        SELECT 'delete', history.id, old.title, old.summary, history.video_url
+        FROM summerizer_videosummary AS history WHERE history.video_id = old.video_id;
+        INSERT INTO summerizer_videosummary_fts(rowid, title, summary, video_url)
+        SELECT history.id, new.title, new.summary, history.video_url
+        FROM summerizer_videosummary AS history WHERE history.video_id = new.video_id;
+    END
+    """,
+    """
+    INSERT INTO summerizer_videosummary_fts(rowid, title, summary, video_url)
+    SELECT history.id, video.title, video.summary, history.video_url
+    FROM summerizer_videosummary AS history
+    JOIN summerizer_video AS video ON video.video_id = history.video_id
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS summerizer_video_fts_update",
+    "DROP TRIGGER IF EXISTS summerizer_videosummary_fts_update",
+    "DROP TRIGGER IF EXISTS summerizer_videosummary_fts_delete",
+    "DROP TRIGGER IF EXISTS summerizer_videosummary_fts_insert",
+    "DROP TABLE IF EXISTS summerizer_videosummary_fts",
+]
+
+
+def create_search_index(apps, schema_editor):
+    # Other databases search with plain filters (see summerizer.search)
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in CREATE_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in DROP_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("summerizer", "0008_summary_counter"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
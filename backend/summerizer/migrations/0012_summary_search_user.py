@@ -0,0 +1,81 @@
+from importlib import import_module
+
+from django.db import migrations
+
+summary_search = import_module("summerizer.migrations.0009_summary_search")
+
+# The index from 0009 with the owner of each row as a fourth column, so a
+# search starts from the user's own rows (user_id : "42" AND ...) instead of
+# matching every user's history and filtering afterwards. The text columns are
+# queried through a column filter, so search words never match user ids.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE summerizer_videosummary_fts USING fts5(
+        title, summary, video_url, user_id, content='', tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER summerizer_videosummary_fts_insert AFTER INSERT ON summerizer_videosummary BEGIN
+        INSERT INTO summerizer_videosummary_fts(rowid, title, summary, video_url, user_id)
+        SELECT new.id, video.title, video.summary, new.video_url, new.user_id
+        FROM summerizer_video AS video WHERE video.video_id = new.video_id;
+    END
+    """,
+    """
+    CREATE TRIGGER summerizer_videosummary_fts_delete AFTER DELETE ON summerizer_videosummary BEGIN
+        INSERT INTO summerizer_videosummary_fts(summerizer_videosummary_fts, rowid, title, summary, video_url, user_id)
+        SELECT 'delete', old.id, video.title, video.summary, old.video_url, old.user_id
+        FROM summerizer_video AS video WHERE video.video_id = old.video_id;
+    END
+    """,
+    """
+    CREATE TRIGGER summerizer_videosummary_fts_update AFTER UPDATE OF video_url, video_id, user_id
+    ON summerizer_videosummary BEGIN
+        INSERT INTO summerizer_videosummary_fts(summerizer_videosummary_fts, rowid, title, summary, video_url, user_id)
+        SELECT 'delete', old.id, video.title, video.summary, old.video_url, old.user_id
+        FROM summerizer_video AS video WHERE video.video_id = old.video_id;
+        INSERT INTO summerizer_videosummary_fts(rowid, title, summary, video_url, user_id)
+        SELECT new.id, video.title, video.summary, new.video_url, new.user_id
+        FROM summerizer_video AS video WHERE video.video_id = new.video_id;
+    END
+    """,
+    """
+    CREATE TRIGGER summerizer_video_fts_update AFTER UPDATE OF title, summary ON summerizer_video BEGIN
+        INSERT INTO summerizer_videosummary_fts(summerizer_videosummary_fts, rowid, title, summary, video_url, user_id)
+        SELECT 'delete', history.id, old.title, old.summary, history.video_url, history.user_id
+        FROM summerizer_videosummary AS history WHERE history.video_id = old.video_id;
+        INSERT INTO summerizer_videosummary_fts(rowid, title, summary, video_url, user_id)
+        SELECT history.id, new.title, new.summary, history.video_url, history.user_id
+        FROM summerizer_videosummary AS history WHERE history.video_id = new.video_id;
+    END
+    """,
+    """
+    INSERT INTO summerizer_videosummary_fts(rowid, title, summary, video_url, user_id)
+    SELECT history.id, video.title, video.summary, history.video_url, history.user_id
+    FROM summerizer_videosummary AS history
+    JOIN summerizer_video AS video ON video.video_id = history.video_id
+    """,
+]
+
+
+def add_user_column(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in summary_search.DROP_SQL + CREATE_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_user_column(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in summary_search.DROP_SQL + summary_search.CREATE_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("summerizer", "0011_history_version"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_user_column, drop_user_column),
+    ]
@@ -1,20 +1,179 @@
+import uuid
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 # Create your models here.
-class VideoSummary(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+class Video(models.Model):
+    """A YouTube video and its summary, shared by every user who summarized it"""
+    video_id = models.CharField(max_length=11, primary_key=True)
     video_url = models.URLField()
     title = models.CharField(max_length=255)
     summary = models.TextField()
     thumbnail_url = models.URLField(blank=True, null=True)
     duration = models.CharField(max_length=50, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.title
+
+
+class VideoSummary(models.Model):
+    """A video in one user's summary history"""
+    # Covered by the leading column of the indexes below
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
+    # The URL as the user gave it
+    video_url = models.URLField()
+    # Keyed by the canonical YouTube ID, so every form of a video's URL maps to one row
+    video = models.ForeignKey(Video, on_delete=models.PROTECT, related_name='summaries')
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ['-created_at']
+        # id breaks ties between rows created in the same instant
+        ordering = ['-created_at', '-id']
         verbose_name_plural = 'Video Summaries'
+        indexes = [
+            # History pages, recent and stats: a user's rows newest first without a sort
+            models.Index(fields=['user', '-created_at', '-id'], name='videosummary_user_created'),
+        ]
+        constraints = [
+            # Also the index behind per-user lookups and upserts by video
+            models.UniqueConstraint(fields=['user', 'video'], name='unique_user_video_summary'),
+        ]
         
     def __str__(self):
-        return f"{self.title} - {self.user.email}"
-    
\ No newline at end of file
+        return f"{self.video.title} - {self.user.email}"
+
+
+class SummaryCounter(models.Model):
+    """Materialized size of a user's history, so stats don't count it (SUMMARY_STATS['COUNTERS'])"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True)
+    total = models.PositiveIntegerField(default=0)
+    last_summary_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user.email} - {self.total}"
+
+
+class HistoryVersion(models.Model):
+    """Bumped on every write to a user's history; all workers validate ETags and cached stats against it"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user.email} - {self.version}"
+
+
+class SummaryCacheEntry(models.Model):
+    """LLM summary keyed on a hash of its input text, model and prompt"""
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=100)
+    summary = models.TextField()
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name_plural = 'Summary Cache Entries'
+
+    def __str__(self):
+        return f"{self.model} - {self.key[:12]}"
+
+
+class SummaryJob(models.Model):
+    """Summarization request processed in the background"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    video_url = models.URLField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    summary = models.ForeignKey(VideoSummary, null=True, blank=True, on_delete=models.SET_NULL)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.video_url} - {self.status}"
+
+
+class IngestionRun(models.Model):
+    """Bulk summarization of a playlist or channel, checkpointed so it can resume"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    source_url = models.URLField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    # Video IDs resolved so far, in listing order, and where listing resumes
+    video_ids = models.JSONField(default=list, blank=True)
+    listing_state = models.JSONField(null=True, blank=True)
+    listing_complete = models.BooleanField(default=False)
+    # Every video before next_index has been processed
+    next_index = models.PositiveIntegerField(default=0)
+    succeeded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.source_url} - {self.status}"
+
+
+class HistoryDeletion(models.Model):
+    """A user's history being cleared in batches, with its progress"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    # Rows up to max_id existed when the deletion was requested; later ones are kept
+    max_id = models.BigIntegerField(null=True, blank=True)
+    total = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.user} - {self.status}"
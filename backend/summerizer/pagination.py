@@ -0,0 +1,79 @@
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Newest-first pages that resume after the (created_at, id) of the previous page's last row.
+
+    The cursor is opaque to clients. Each page is an index range seek from
+    that position, so page N costs the same as page 1, and rows added while
+    paging don't shift later pages the way OFFSET does.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('-created_at', '-id')
+
+    def get_page_size(self, request) -> int:
+        config = settings.SUMMARY_PAGINATION
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return config['PAGE_SIZE']
+        return max(1, min(page_size, config['MAX_PAGE_SIZE']))
+
+    def encode_cursor(self, row) -> str:
+        position = json.dumps({'created_at': row.created_at.isoformat(), 'id': row.pk})
+        return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor: str) -> tuple:
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            position = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            return datetime.fromisoformat(position['created_at']), int(position['id'])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound("Invalid cursor")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            # created_at <= x bounds the index range; the OR only breaks ties
+            queryset = queryset.filter(created_at__lte=created_at).filter(
+                Q(created_at__lt=created_at) | Q(id__lt=pk)
+            )
+
+        # One extra row tells whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        self.next_cursor = self.encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,237 @@
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+
+from .ai_utils import get_video_info, generate_summary, extract_video_id
+from .deadline import Deadline
+from .embeddings import index_videos_safely
+from .scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, scheduled_as
+from .models import Video, VideoSummary
+from .singleflight import get_single_flight
+from .stats import history_changed, summaries_added
+from .tokens import track_usage
+from .video_ids import canonical_video_url
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_and_summarize(url: str, fetch_slots=None, llm_slots=None, deadline: Deadline = None):
+    """Fetch a video and summarize its description.
+
+    ``fetch_slots`` and ``llm_slots`` are optional semaphores bounding how many
+    callers run each stage at once. ``deadline`` bounds the whole pipeline.
+    """
+    # Get video info
+    with fetch_slots or nullcontext():
+        video_info = get_video_info(url, deadline)
+
+    # Generate summary from video description
+    with llm_slots or nullcontext():
+        summary = generate_summary(video_info['description'], deadline)
+
+    return video_info, summary
+
+
+def coalesced_fetch_and_summarize(url: str, deadline: Deadline = None, **slots):
+    """fetch_and_summarize, shared with concurrent callers for the same video"""
+    video_id = extract_video_id(url)
+    if not video_id:
+        return fetch_and_summarize(url, deadline=deadline, **slots)
+
+    return get_single_flight().do(
+        f"summary:{video_id}",
+        lambda: fetch_and_summarize(url, deadline=deadline, **slots),
+        timeout=deadline.remaining() if deadline else None,
+    )
+
+
+def summarize_video(user, url: str, deadline: Deadline = None, priority: int = PRIORITY_INTERACTIVE):
+    """Fetch a video, summarize its description and store it for the user.
+
+    A video someone already summarized is only added to the user's history.
+    ``priority`` is where the LLM calls queue when rate limited.
+    """
+    video = Video.objects.filter(video_id=extract_video_id(url)).first()
+    if video is not None:
+        return add_to_history(user, url, video)
+
+    with track_usage() as usage, scheduled_as(user.pk, priority):
+        video_info, summary = coalesced_fetch_and_summarize(url, deadline=deadline)
+    logger.info(f"Summary token usage for {url}: {usage.totals()}")
+
+    return store_summary(user, url, video_info, summary)
+
+
+def store_summary(user, url: str, video_info: dict, summary: str, replace: bool = False):
+    """Save the shared video and its summary, then add it to the user's history.
+
+    A video someone else stored in the meantime (every follower of a coalesced
+    call) keeps its summary and only the history row is added. ``replace``
+    overwrites it, for an explicit refresh.
+    """
+    video_id = extract_video_id(url)
+    if not video_id:
+        raise ValueError("Not a YouTube video URL")
+    defaults = {
+        'video_url': canonical_video_url(video_id),
+        'title': video_info['title'],
+        'summary': summary,
+        'thumbnail_url': video_info['thumbnail_url'],
+        'duration': video_info['duration']
+    }
+    if not replace:
+        video, created = Video.objects.get_or_create(video_id=video_id, defaults=defaults)
+        if not created:
+            return add_to_history(user, url, video)
+    else:
+        video, created = Video.objects.update_or_create(video_id=video_id, defaults=defaults)
+    if not created:
+        # The new summary shows up in the history of everyone who has the video
+        history_changed(*VideoSummary.objects.filter(video=video).values_list('user_id', flat=True))
+    index_videos_safely([video])
+    return add_to_history(user, url, video)
+
+
+def add_to_history(user, url: str, video: Video):
+    """Create or update the user's history row for a video, whatever form its URL took"""
+    # Upserts go through the (user, video) unique index
+    summary_obj, created = VideoSummary.objects.update_or_create(
+        user=user,
+        video=video,
+        defaults={'video_url': url}
+    )
+    if created:
+        summaries_added(user, 1)
+    else:
+        history_changed(user.pk)
+    summary_obj.video = video
+    return summary_obj, created
+
+
+def summarize_videos(user, urls: list) -> list:
+    """Summarize many videos concurrently and store them with bulk writes.
+
+    URLs pointing at the same video are processed once, and videos that were
+    already summarized aren't processed at all. Returns one result per input
+    URL with a status of created, updated, duplicate or failed.
+    """
+    config = settings.SUMMARY_BATCH
+    results = [{'url': url} for url in urls]
+
+    # Deduplicate by canonical video ID, keeping the first URL of each video
+    first_index = {}
+    for index, url in enumerate(urls):
+        video_id = extract_video_id(url)
+        results[index]['video_id'] = video_id
+        if not video_id:
+            results[index].update(status='failed', error='Not a YouTube video URL')
+        elif video_id in first_index:
+            results[index]['status'] = 'duplicate'
+            results[index]['duplicate_of'] = urls[first_index[video_id]]
+        else:
+            first_index[video_id] = index
+    known = set(Video.objects.filter(video_id__in=first_index).values_list('video_id', flat=True))
+    unique_indexes = [index for video_id, index in first_index.items() if video_id not in known]
+
+    fetch_slots = threading.BoundedSemaphore(config['FETCH_CONCURRENCY'])
+    llm_slots = threading.BoundedSemaphore(config['LLM_CONCURRENCY'])
+
+    def process(url):
+        try:
+            return coalesced_fetch_and_summarize(url, fetch_slots=fetch_slots, llm_slots=llm_slots), None
+        except Exception as e:
+            logger.error(f"Batch summarization error for {url}: {str(e)}")
+            return None, str(e)
+        finally:
+            connections.close_all()
+
+    # Enough workers to keep both stages saturated; the semaphores do the limiting
+    workers = max(1, min(len(unique_indexes), config['FETCH_CONCURRENCY'] + config['LLM_CONCURRENCY']))
+    with track_usage() as usage, scheduled_as(user.pk, PRIORITY_BATCH):
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='summary-batch') as pool:
+            futures = {
+                index: pool.submit(contextvars.copy_context().run, process, urls[index])
+                for index in unique_indexes
+            }
+            outcomes = {index: future.result() for index, future in futures.items()}
+    logger.info(f"Batch of {len(unique_indexes)} video(s) token usage: {usage.totals()}")
+
+    for video_id, index in first_index.items():
+        if video_id in known:
+            outcomes[index] = (None, None)
+    _store_batch(user, urls, results, outcomes)
+    return results
+
+
+def _plan_history(user, urls, video_ids: dict) -> tuple:
+    """Split batch items into new history rows and existing ones whose URL is updated"""
+    existing = {
+        summary_obj.video_id: summary_obj
+        for summary_obj in VideoSummary.objects.filter(user=user, video_id__in=video_ids.values())
+    }
+
+    to_create, to_update = {}, {}
+    for index, video_id in video_ids.items():
+        summary_obj = existing.get(video_id)
+        if summary_obj is None:
+            to_create[index] = VideoSummary(user=user, video_id=video_id, video_url=urls[index])
+        else:
+            summary_obj.video_url = urls[index]
+            to_update[index] = summary_obj
+    return to_create, to_update
+
+
+def _store_batch(user, urls, results, outcomes):
+    """Write batch results with bulk writes: new videos, then the user's history rows.
+
+    An outcome of ``(None, None)`` is a video that is already stored.
+    """
+    for index, (_, error) in outcomes.items():
+        if error is not None:
+            results[index].update(status='failed', error=error)
+    stored = {index: outcome[0] for index, outcome in outcomes.items() if outcome[1] is None}
+    video_ids = {index: results[index]['video_id'] for index in stored}
+
+    new_videos = []
+    for index, outcome in stored.items():
+        if outcome is None:
+            continue
+        video_info, summary = outcome
+        new_videos.append(Video(
+            video_id=video_ids[index],
+            video_url=canonical_video_url(video_ids[index]),
+            title=video_info['title'],
+            summary=summary,
+            thumbnail_url=video_info['thumbnail_url'],
+            duration=video_info['duration'],
+        ))
+
+    # Another request can add one of these videos to the user's history between
+    # the lookup and the insert; the unique constraint catches it and we look again
+    for attempt in range(3):
+        to_create, to_update = _plan_history(user, urls, video_ids)
+        try:
+            with transaction.atomic():
+                # Another request may have stored the same video since the batch started
+                Video.objects.bulk_create(new_videos, ignore_conflicts=True)
+                VideoSummary.objects.bulk_create(list(to_create.values()))
+                VideoSummary.objects.bulk_update(list(to_update.values()), ['video_url'])
+            break
+        except IntegrityError as e:
+            logger.warning(f"Batch history write conflicted (attempt {attempt + 1}): {str(e)}")
+            error = e
+    else:
+        for index in stored:
+            results[index].update(status='failed', error=f"Could not store the summary: {str(error)}")
+        return
+    summaries_added(user, len(to_create))
+    index_videos_safely(new_videos)
+
+    for status, objects in (('created', to_create), ('updated', to_update)):
+        for index, summary_obj in objects.items():
+            results[index].update(status=status, id=summary_obj.pk)
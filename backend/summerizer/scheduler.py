@@ -0,0 +1,280 @@
+import contextvars
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_BACKGROUND: 'background',
+    PRIORITY_BATCH: 'batch',
+}
+
+
+class SchedulerTimeout(TimeoutError):
+    """Raised when an LLM call waited in the queue longer than it is allowed to"""
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits shared through the Django cache.
+
+    Usage is counted per minute with ``cache.incr`` and the previous minute is
+    weighted by how much of it still overlaps the last 60 seconds, which
+    behaves like a token bucket refilling at RPM/TPM per minute. A limit of 0
+    disables it.
+    """
+    WINDOW = 60
+
+    def __init__(self, config: dict):
+        self.cache_alias = config.get('CACHE_ALIAS', 'default')
+        self.rpm = int(config.get('RPM', 0))
+        self.tpm = int(config.get('TPM', 0))
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _keys(self, slot: int) -> tuple:
+        return f"llm-rate:requests:{slot}", f"llm-rate:tokens:{slot}"
+
+    def _incr(self, key: str, delta: int) -> int:
+        self.cache.add(key, 0, self.WINDOW * 2)
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # Expired between add and incr
+            self.cache.add(key, delta, self.WINDOW * 2)
+            return delta
+
+    def usage(self) -> tuple:
+        """Requests and tokens used over the last minute"""
+        now = time.time()
+        slot = int(now // self.WINDOW)
+        overlap = 1 - (now % self.WINDOW) / self.WINDOW
+        keys = self._keys(slot) + self._keys(slot - 1)
+        values = self.cache.get_many(keys)
+        current = [values.get(key, 0) for key in keys[:2]]
+        previous = [values.get(key, 0) for key in keys[2:]]
+        return tuple(current[i] + previous[i] * overlap for i in range(2))
+
+    def try_acquire(self, tokens: int) -> bool:
+        """Reserve one request and ``tokens`` tokens if both limits allow it"""
+        if not self.rpm and not self.tpm:
+            return True
+
+        requests_used, tokens_used = self.usage()
+        if (self.rpm and requests_used + 1 > self.rpm) or (self.tpm and tokens_used + tokens > self.tpm):
+            return False
+
+        # Reserve, then undo if concurrent callers got there first
+        requests_key, tokens_key = self._keys(int(time.time() // self.WINDOW))
+        self._incr(requests_key, 1)
+        self._incr(tokens_key, tokens)
+        requests_used, tokens_used = self.usage()
+        if (self.rpm and requests_used > self.rpm) or (self.tpm and tokens_used > self.tpm):
+            self._incr(requests_key, -1)
+            self._incr(tokens_key, -tokens)
+            return False
+        return True
+
+    def adjust(self, tokens: int) -> None:
+        """Correct the token count of the current minute once real usage is known"""
+        if tokens and self.tpm:
+            self._incr(self._keys(int(time.time() // self.WINDOW))[1], tokens)
+
+    def release(self, tokens: int) -> None:
+        """Give back a request and its tokens that were reserved but never sent"""
+        if not self.rpm and not self.tpm:
+            return
+        requests_key, tokens_key = self._keys(int(time.time() // self.WINDOW))
+        self._incr(requests_key, -1)
+        self._incr(tokens_key, -tokens)
+
+
+@dataclass(eq=False)
+class Reservation:
+    user_key: object
+    priority: int
+    tokens: int
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class LLMScheduler:
+    """Admits LLM calls under global rate limits, queueing the excess fairly.
+
+    Waiting calls queue in this process by priority (interactive before
+    background jobs before batch work) and, within a priority, round-robin
+    between users so one user's batch can't starve everyone else. Only the
+    head of the queue tries the rate limiter; a call that waits longer than
+    MAX_WAIT (or its ``timeout``) raises SchedulerTimeout.
+    """
+
+    def __init__(self, config: dict):
+        self.limiter = RateLimiter(config)
+        self.max_wait = float(config.get('MAX_WAIT', 30))
+        self.poll_interval = float(config.get('POLL_INTERVAL', 0.25))
+
+        self._cond = threading.Condition()
+        # priority -> user -> reservations waiting, oldest first
+        self._queues = {}
+        self._admitted = 0
+        self._timeouts = 0
+        self._waits = deque(maxlen=int(config.get('STATS_WINDOW', 200)))
+
+    def _head(self):
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if users:
+                return next(iter(users.values()))[0]
+        return None
+
+    def _remove(self, reservation: Reservation, admitted: bool) -> None:
+        users = self._queues[reservation.priority]
+        waiting = users[reservation.user_key]
+        waiting.remove(reservation)
+        if admitted:
+            # This user goes to the back of the line for its priority
+            users.move_to_end(reservation.user_key)
+        if not waiting:
+            del users[reservation.user_key]
+
+    def acquire(self, tokens: int, user_key=None, priority: int = None, timeout: float = None) -> Reservation:
+        """Wait for a turn to call the LLM with about ``tokens`` tokens.
+
+        ``user_key`` and ``priority`` default to the ones set with
+        ``scheduled_as``.
+        """
+        if user_key is None and priority is None:
+            user_key, priority = _current_schedule.get()
+        priority = PRIORITY_INTERACTIVE if priority is None else priority
+        if self.limiter.tpm:
+            # A request larger than the whole budget could otherwise never run
+            tokens = min(tokens, self.limiter.tpm)
+
+        reservation = Reservation(user_key, priority, tokens)
+        give_up_at = time.monotonic() + min(self.max_wait, math.inf if timeout is None else timeout)
+        with self._cond:
+            self._queues.setdefault(priority, OrderedDict()).setdefault(user_key, deque()).append(reservation)
+            while True:
+                is_head = self._head() is reservation
+                if is_head and self.limiter.try_acquire(tokens):
+                    self._remove(reservation, admitted=True)
+                    self._admitted += 1
+                    self._waits.append(time.monotonic() - reservation.enqueued_at)
+                    self._cond.notify_all()
+                    return reservation
+
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    self._remove(reservation, admitted=False)
+                    self._timeouts += 1
+                    self._cond.notify_all()
+                    raise SchedulerTimeout(
+                        f"Waited {time.monotonic() - reservation.enqueued_at:.1f}s for an LLM rate limit slot"
+                    )
+                # The head polls the limiter; everyone else waits for the queue to move
+                self._cond.wait(min(remaining, self.poll_interval) if is_head else remaining)
+
+    def try_acquire(self, tokens: int, user_key=None, priority: int = None):
+        """Reserve a slot right away if nobody is queued and the limits allow it, else return None.
+
+        For optional extra calls such as hedges, which shouldn't wait or jump the queue.
+        """
+        if user_key is None and priority is None:
+            user_key, priority = _current_schedule.get()
+        priority = PRIORITY_INTERACTIVE if priority is None else priority
+        if self.limiter.tpm:
+            tokens = min(tokens, self.limiter.tpm)
+
+        with self._cond:
+            if self._head() is not None or not self.limiter.try_acquire(tokens):
+                return None
+            self._admitted += 1
+            self._waits.append(0.0)
+        return Reservation(user_key, priority, tokens)
+
+    def settle(self, reservation: Reservation, actual_tokens: int) -> None:
+        """Replace the estimated token count with what the call really used"""
+        self.limiter.adjust(actual_tokens - reservation.tokens)
+
+    def release(self, reservation: Reservation) -> None:
+        """Undo a reservation whose call was never made, e.g. because every circuit was open"""
+        self.limiter.release(reservation.tokens)
+        with self._cond:
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Queue depth per priority, wait times and rate limit usage"""
+        with self._cond:
+            depth = {
+                PRIORITY_NAMES.get(priority, str(priority)): sum(len(waiting) for waiting in users.values())
+                for priority, users in self._queues.items()
+            }
+            waits = sorted(self._waits)
+            admitted, timeouts = self._admitted, self._timeouts
+
+        def percentile(fraction):
+            if not waits:
+                return None
+            return round(waits[min(len(waits) - 1, int(round(fraction * (len(waits) - 1))))] * 1000, 1)
+
+        requests_used, tokens_used = self.limiter.usage()
+        return {
+            'queue_depth': depth,
+            'admitted': admitted,
+            'timeouts': timeouts,
+            'wait_p50_ms': percentile(0.50),
+            'wait_p95_ms': percentile(0.95),
+            'requests_last_minute': round(requests_used),
+            'tokens_last_minute': round(tokens_used),
+            'rpm_limit': self.limiter.rpm,
+            'tpm_limit': self.limiter.tpm,
+        }
+
+
+_current_schedule = contextvars.ContextVar('llm_schedule', default=(None, PRIORITY_INTERACTIVE))
+
+
+@contextmanager
+def scheduled_as(user_key, priority: int):
+    """Queue the LLM calls made inside the block for this user at this priority"""
+    token = _current_schedule.set((user_key, priority))
+    try:
+        yield
+    finally:
+        _current_schedule.reset(token)
+
+
+def current_priority() -> int:
+    """The priority set by the innermost ``scheduled_as``, interactive outside of one"""
+    return _current_schedule.get()[1]
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Return the process-wide LLM scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler(settings.LLM_SCHEDULER)
+    return _scheduler
+
+
+def reset_llm_scheduler() -> None:
+    """Drop the shared scheduler so it is rebuilt from settings"""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = None
@@ -0,0 +1,92 @@
+import re
+from typing import Optional
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import VideoSummary
+
+FTS_TABLE = 'summerizer_videosummary_fts'
+# Column weights for bm25(): title, summary, video_url, user_id
+BM25_WEIGHTS = (5.0, 1.0, 0.5, 0.0)
+SNIPPET_WORDS = 24
+
+WORD_RE = re.compile(r'\w+')
+
+
+def fts_enabled() -> bool:
+    """Whether the FTS5 index exists; it is only created on SQLite"""
+    return connection.vendor == 'sqlite'
+
+
+def search_terms(text: str) -> list:
+    return WORD_RE.findall(text.lower())
+
+
+def match_expression(text: str) -> Optional[str]:
+    """FTS5 query requiring every word of ``text``, the last one as a prefix (it may be unfinished)"""
+    terms = [f'"{term}"' for term in search_terms(text)]
+    if not terms:
+        return None
+    terms[-1] += '*'
+    # Only the text columns, never user_id
+    return f"{{title summary video_url}} : ({' '.join(terms)})"
+
+
+def user_match_expression(user, text: str) -> Optional[str]:
+    """``match_expression`` limited to the user's rows inside the index, rather than by a join afterwards"""
+    match = match_expression(text)
+    if match is None:
+        return None
+    return f'user_id : "{int(user.pk)}" AND {match}'
+
+
+def matching_ids(match: str) -> RawSQL:
+    """Subquery of the ids of every history row matching a ``match_expression``, for ``pk__in``"""
+    return RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+
+
+def search_summaries(user, text: str, limit: int) -> list:
+    """The user's summaries matching ``text``, best BM25 match first, each with a ``snippet``"""
+    terms = search_terms(text)
+    if not terms:
+        return []
+
+    if fts_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, %s, %s, %s, %s) LIMIT %s",
+                [user_match_expression(user, text), *BM25_WEIGHTS, limit],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        by_id = VideoSummary.objects.filter(user=user).select_related('video').in_bulk(ids)
+        results = [by_id[pk] for pk in ids if pk in by_id]
+    else:
+        matches = Q()
+        for term in terms:
+            matches &= Q(video__title__icontains=term) | Q(video__summary__icontains=term)
+        results = list(VideoSummary.objects.filter(matches, user=user).select_related('video')[:limit])
+
+    for summary_obj in results:
+        summary_obj.snippet = make_snippet(summary_obj.video.summary, terms)
+    return results
+
+
+def make_snippet(text: str, terms: list, size: int = SNIPPET_WORDS) -> str:
+    """About ``size`` words of ``text`` around the first match, matches wrapped in <b>, HTML-escaped"""
+    words = text.split()
+
+    def matches(word):
+        word = ''.join(WORD_RE.findall(word.lower()))
+        return any(word.startswith(term) for term in terms)
+
+    first = next((i for i, word in enumerate(words) if matches(word)), 0)
+    start = max(0, min(first - size // 4, len(words) - size))
+    window = [
+        f"<b>{escape(word)}</b>" if matches(word) else escape(word)
+        for word in words[start:start + size]
+    ]
+    return ('… ' if start > 0 else '') + ' '.join(window) + (' …' if start + size < len(words) else '')
@@ -1,11 +1,89 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import VideoSummary
+from .models import VideoSummary, SummaryJob, IngestionRun, HistoryDeletion
+from .ingestion import listing_url
+from .video_ids import extract_video_id
 
 class VideoURLSerializer(serializers.Serializer):
     url = serializers.URLField(required=True)
+    mode = serializers.ChoiceField(choices=['sync', 'async'], default='sync', required=False)
+
+    def validate_url(self, url):
+        if not extract_video_id(url):
+            raise serializers.ValidationError("Not a YouTube video URL.")
+        return url
+
+class VideoBatchSerializer(serializers.Serializer):
+    urls = serializers.ListField(child=serializers.URLField(), allow_empty=False)
+
+    def validate_urls(self, urls):
+        max_urls = settings.SUMMARY_BATCH['MAX_URLS']
+        if len(urls) > max_urls:
+            raise serializers.ValidationError(f"A batch can contain at most {max_urls} URLs.")
+        return urls
 
 class VideoSummarySerializer(serializers.ModelSerializer):
+    # The video's fields are shared between users, so they are read-only here
+    video_id = serializers.CharField(read_only=True)
+    title = serializers.CharField(source='video.title', read_only=True)
+    summary = serializers.CharField(source='video.summary', read_only=True)
+    thumbnail_url = serializers.URLField(source='video.thumbnail_url', read_only=True)
+    duration = serializers.CharField(source='video.duration', read_only=True)
+
     class Meta:
         model = VideoSummary
-        fields = ['id', 'video_url', 'title', 'summary', 'thumbnail_url', 'duration', 'created_at']
-        read_only_fields = ['created_at']
\ No newline at end of file
+        fields = ['id', 'video_url', 'video_id', 'title', 'summary', 'thumbnail_url', 'duration', 'created_at']
+        read_only_fields = ['created_at']
+
+    def __init__(self, *args, fields=None, **kwargs):
+        """``fields`` limits the output to a subset of Meta.fields"""
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def model_fields(self) -> list:
+        """Model field paths the output reads, for ``QuerySet.only()``"""
+        # Keyset pagination orders and resumes on these
+        paths = {'id', 'created_at'}
+        for field in self.fields.values():
+            paths.add(field.source.replace('.', '__'))
+        return sorted(paths)
+
+class SummaryJobSerializer(serializers.ModelSerializer):
+    summary = VideoSummarySerializer(read_only=True)
+
+    class Meta:
+        model = SummaryJob
+        fields = ['id', 'video_url', 'status', 'summary', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+class IngestionSourceSerializer(serializers.Serializer):
+    url = serializers.URLField(required=True)
+
+    def validate_url(self, url):
+        try:
+            listing_url(url)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return url
+
+class IngestionRunSerializer(serializers.ModelSerializer):
+    total_listed = serializers.SerializerMethodField()
+
+    class Meta:
+        model = IngestionRun
+        fields = [
+            'id', 'source_url', 'status', 'listing_complete', 'total_listed', 'next_index',
+            'succeeded', 'failed', 'error', 'created_at', 'updated_at',
+        ]
+        read_only_fields = fields
+
+    def get_total_listed(self, run):
+        return len(run.video_ids)
+
+class HistoryDeletionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HistoryDeletion
+        fields = ['id', 'status', 'total', 'deleted', 'error', 'created_at', 'updated_at']
+        read_only_fields = fields
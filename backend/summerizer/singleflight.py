@@ -0,0 +1,98 @@
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into a single execution.
+
+    Threads in one process wait on a shared future. Across processes the first
+    caller takes a lock in the Django cache, and the others poll for the result
+    it publishes. Waiters that time out run the call themselves rather than fail.
+    """
+
+    def __init__(self, config: dict):
+        self.cache_alias = config.get('CACHE_ALIAS', 'default')
+        self.lock_timeout = float(config.get('LOCK_TIMEOUT', 60))
+        self.wait_timeout = float(config.get('WAIT_TIMEOUT', 45))
+        self.result_timeout = float(config.get('RESULT_TIMEOUT', 30))
+        self.poll_interval = float(config.get('POLL_INTERVAL', 0.2))
+
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, func, timeout: float = None):
+        """Run func once per key at a time; ``timeout`` caps how long a waiter waits"""
+        wait_timeout = self.wait_timeout if timeout is None else min(self.wait_timeout, timeout)
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            try:
+                return future.result(timeout=wait_timeout)
+            except FutureTimeoutError:
+                return func()
+
+        try:
+            result = self._do_across_processes(key, func, wait_timeout)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _do_across_processes(self, key: str, func, wait_timeout: float):
+        cache = caches[self.cache_alias]
+        lock_key = f"singleflight:lock:{key}"
+        result_key = f"singleflight:result:{key}"
+        token = uuid.uuid4().hex
+
+        if cache.add(lock_key, token, self.lock_timeout):
+            try:
+                result = func()
+                cache.set(result_key, result, self.result_timeout)
+                return result
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        # Another process owns this key: wait for the result it publishes
+        deadline = time.monotonic() + wait_timeout
+        while time.monotonic() < deadline:
+            # Read the lock before the result: the owner publishes, then unlocks
+            lock_held = cache.get(lock_key) is not None
+            result = cache.get(result_key)
+            if result is not None:
+                return result
+            if not lock_held:
+                # The owner finished without a result (it failed), try ourselves
+                break
+            time.sleep(self.poll_interval)
+
+        return func()
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide single-flight group"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight(settings.SINGLE_FLIGHT)
+    return _single_flight
@@ -0,0 +1,109 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import HistoryVersion, SummaryCounter, VideoSummary
+
+RECENT_DAYS = 7
+
+
+def _cache():
+    return caches[settings.SUMMARY_STATS['CACHE_ALIAS']]
+
+
+def _stats_key(user_pk, version) -> str:
+    return f"summary-stats:{user_pk}:{version}"
+
+
+def history_version(user) -> tuple:
+    """The number and time of the user's latest history write; it validates conditional GETs.
+
+    It lives in the database rather than the cache so that every worker sees
+    a write as soon as it is committed.
+    """
+    row = HistoryVersion.objects.filter(user_id=user.pk).values_list('version', 'changed_at').first()
+    # No row: nothing was written since versions were introduced
+    return row if row is not None else (0, user.date_joined)
+
+
+def history_changed(*user_pks) -> None:
+    """Mark these users' histories as changed: new validators and no cached stats"""
+    user_pks = set(user_pks)
+    if not user_pks:
+        return
+    now = timezone.now()
+    rows = HistoryVersion.objects.filter(user_id__in=user_pks)
+    if rows.update(version=F('version') + 1, changed_at=now) < len(user_pks):
+        # First write for some of them
+        HistoryVersion.objects.bulk_create(
+            [HistoryVersion(user_id=user_pk, changed_at=now) for user_pk in user_pks], ignore_conflicts=True
+        )
+        rows.update(version=F('version') + 1, changed_at=now)
+
+
+def get_summary_stats(user) -> dict:
+    """Total and recent summary counts and the time of the last one, cached per user"""
+    version, _ = history_version(user)
+    stats = _cache().get(_stats_key(user.pk, version))
+    if stats is None:
+        since = timezone.now() - timedelta(days=RECENT_DAYS)
+        if settings.SUMMARY_STATS['COUNTERS']:
+            stats = _stats_from_counter(user, since)
+        else:
+            stats = _stats_from_history(user, since)
+        _cache().set(_stats_key(user.pk, version), stats, settings.SUMMARY_STATS['CACHE_TIMEOUT'])
+    return stats
+
+
+def _stats_from_history(user, since) -> dict:
+    # One pass over the user's slice of the (user, created_at) index
+    return VideoSummary.objects.filter(user=user).aggregate(
+        total_summaries=Count('id'),
+        recent_summaries=Count('id', filter=Q(created_at__gte=since)),
+        last_summary=Max('created_at'),
+    )
+
+
+def _stats_from_counter(user, since) -> dict:
+    # The counter row plus a range count of the last week only
+    recent = VideoSummary.objects.filter(
+        user=OuterRef('user'), created_at__gte=since
+    ).order_by().values('user').annotate(count=Count('id')).values('count')
+    row = SummaryCounter.objects.filter(user=user).annotate(
+        recent_summaries=Coalesce(Subquery(recent), 0)
+    ).values('total', 'recent_summaries', 'last_summary_at').first()
+    if row is not None:
+        return {
+            'total_summaries': row['total'],
+            'recent_summaries': row['recent_summaries'],
+            'last_summary': row['last_summary_at'],
+        }
+
+    # First read for this user: build the counter from the history
+    stats = _stats_from_history(user, since)
+    SummaryCounter.objects.get_or_create(
+        user=user,
+        defaults={'total': stats['total_summaries'], 'last_summary_at': stats['last_summary']},
+    )
+    return stats
+
+
+def summaries_added(user, count: int) -> None:
+    """Account for new history rows; call once they are committed"""
+    if count and settings.SUMMARY_STATS['COUNTERS']:
+        SummaryCounter.objects.filter(user=user).update(total=F('total') + count, last_summary_at=timezone.now())
+    history_changed(user.pk)
+
+
+def summaries_removed(user, count: int) -> None:
+    """Account for deleted history rows; call once they are committed"""
+    if count and settings.SUMMARY_STATS['COUNTERS']:
+        last_summary_at = VideoSummary.objects.filter(user=user).values_list('created_at', flat=True).first()
+        SummaryCounter.objects.filter(user=user).update(
+            total=Greatest(F('total') - count, 0), last_summary_at=last_summary_at
+        )
+    history_changed(user.pk)
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+
+from .ai_utils import (
+    get_video_info,
+    stream_summary,
+    fake_summary_stream,
+    generate_fallback_summary,
+    condense_text,
+    plan_summary_request,
+    summary_cache_key,
+    SUMMARY_MODEL,
+)
+from .cache import get_summary_cache
+from .models import Video
+from .pipeline import add_to_history, store_summary
+from .serializers import VideoSummarySerializer, VideoURLSerializer
+from .video_ids import extract_video_id
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(event: str, data) -> bytes:
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+
+
+def get_stream_factory():
+    """Pick the LLM stream configured by LLM_STREAM_BACKEND"""
+    if settings.LLM_STREAM_BACKEND == 'fake':
+        return fake_summary_stream
+    return None
+
+
+def _authenticate(request):
+    """Resolve the user and request body with the same auth classes as the API"""
+    drf_request = Request(
+        request,
+        parsers=[JSONParser()],
+        authenticators=[TokenAuthentication(), SessionAuthentication()],
+    )
+    return drf_request.user, drf_request.data
+
+
+@csrf_exempt
+async def summarize_stream(request):
+    """Summarize a video and stream the summary as Server-Sent Events.
+
+    Events: ``meta`` (video info), ``token`` (summary text as it arrives),
+    ``fallback`` (replacement text if the LLM stream failed) and ``done``
+    (the stored summary). A video someone already summarized is sent as a
+    single token and only added to the user's history.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        user, data = await sync_to_async(_authenticate)(request)
+    except APIException as e:
+        return JsonResponse({'error': str(e.detail)}, status=e.status_code)
+    if not user or not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+
+    serializer = VideoURLSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    url = serializer.validated_data['url']
+
+    video = await Video.objects.filter(video_id=extract_video_id(url)).afirst()
+    if video is not None:
+        events = _stored_summary_events(user, url, video)
+    else:
+        try:
+            video_info = await sync_to_async(get_video_info)(url)
+        except Exception as e:
+            logger.error(f"Summarization Error: {str(e)}", exc_info=True)
+            return JsonResponse({'error': str(e)}, status=400)
+        events = _summary_events(user, url, video_info, get_stream_factory())
+
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _stored_summary_events(user, url, video):
+    yield sse_event('meta', {
+        'title': video.title,
+        'thumbnail_url': video.thumbnail_url,
+        'duration': video.duration,
+    })
+    yield sse_event('token', {'token': video.summary})
+
+    summary_obj, _ = await sync_to_async(add_to_history)(user, url, video)
+    yield sse_event('done', VideoSummarySerializer(summary_obj).data)
+
+
+async def _summary_events(user, url, video_info, stream_factory):
+    yield sse_event('meta', {
+        'title': video_info['title'],
+        'thumbnail_url': video_info['thumbnail_url'],
+        'duration': video_info['duration'],
+    })
+
+    # Long content is map-summarized first so only the reduce pass is streamed
+    text, prompt = await sync_to_async(condense_text, thread_sensitive=False)(video_info['description'])
+    # Tokenizing a long transcript takes a while too
+    text, max_tokens, prompt_tokens = await sync_to_async(plan_summary_request, thread_sensitive=False)(text, prompt)
+    cache_key = summary_cache_key(text, prompt, max_tokens)
+    summary = await sync_to_async(get_summary_cache().get)(cache_key)
+
+    if summary is not None:
+        yield sse_event('token', {'token': summary})
+    else:
+        parts = []
+        try:
+            tokens = stream_summary(text, stream_factory, prompt, max_tokens)
+            while True:
+                # The LLM client blocks, so each read happens off the event loop
+                token = await asyncio.to_thread(next, tokens, None)
+                if token is None:
+                    break
+                parts.append(token)
+                yield sse_event('token', {'token': token})
+            summary = ''.join(parts).strip()
+            logger.info(f"Streamed summary for {url}: prompt_tokens={prompt_tokens} chunks={len(parts)}")
+        except Exception as e:
+            logger.error(f"Streaming summary error: {str(e)}", exc_info=True)
+            summary = ''
+
+        if summary and stream_factory is None:
+            await sync_to_async(get_summary_cache().set)(cache_key, summary, SUMMARY_MODEL)
+        if not summary:
+            summary = await sync_to_async(generate_fallback_summary, thread_sensitive=False)(text)
+            yield sse_event('fallback', {'summary': summary})
+
+    # If another request stored the video meanwhile, its summary is kept (this
+    # one may be a fallback)
+    summary_obj, _ = await sync_to_async(store_summary)(user, url, video_info, summary)
+    yield sse_event('done', VideoSummarySerializer(summary_obj).data)
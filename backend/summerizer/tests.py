@@ -1,3 +1,1850 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import string
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+
+import numpy as np
+import requests
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import caches
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .ai_utils import (
+    get_video_info,
+    generate_summary,
+    fetch_video_info,
+    fetch_video_info_alternative,
+    request_summary,
+    reset_pytube_executors,
+    split_into_chunks,
+    count_tokens,
+    stream_summary,
+    summary_messages,
+)
+from .ingestion import IngestionWorker, claim_for_resume, iter_listing_pages
+from .extractive import extractive_summary, rank_sentences, shrink_text, split_sentences
+from .cache import LocalCache, SummaryCache, reset_caches
+from .http_client import HttpClient, reset_http_client
+from .breaker import CircuitBreaker, CircuitOpenError
+from .deadline import Deadline
+from .embeddings import EmbeddingIndex, embed, get_embedding_index, reset_embedding_index
+from .jobs import run_next_job
+from . import pipeline
+from .pipeline import store_summary
+from .stats import history_version, summaries_removed
+from .llm import EchoProvider, LLMRouter, get_llm_router, reset_llm_router
+from .models import (
+    HistoryDeletion, IngestionRun, SummaryCacheEntry, SummaryCounter, SummaryJob, Video, VideoSummary,
+)
+from .scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    LLMScheduler,
+    SchedulerTimeout,
+    get_llm_scheduler,
+    reset_llm_scheduler,
+    scheduled_as,
+)
+from .singleflight import SingleFlight
+from .video_ids import extract_video_id
+from .tokens import (
+    RegexTokenizer, choose_max_tokens, count_message_tokens, fit_prompt, get_tokenizer, track_usage,
+)
 
 # Create your tests here.
+
+VIDEO_INFO = {
+    'title': 'Test Video',
+    'thumbnail_url': 'https://i.ytimg.com/vi/dQw4w9WgXcQ/hqdefault.jpg',
+    'duration': '212',
+    'description': 'A video about testing. It has several sentences. This is the third one.',
+}
+
+
+
+def make_completion(content):
+    """Build a fake chat completion response without usage accounting"""
+    return mock.Mock(choices=[mock.Mock(message=mock.Mock(content=content))], usage=None)
+
+
+class StubServer:
+    """Local stand-in for an upstream HTTP service.
+
+    ``routes`` maps a path to a list of ``(status, body, delay)`` responses that
+    are served in order; the last one repeats.
+    """
+
+    def __init__(self, routes):
+        self.routes = {path: list(responses) for path, responses in routes.items()}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                stub.requests.append((path, self.client_address[1]))
+                # Drain any request body so the kept-alive connection stays usable
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                responses = stub.routes.get(path, [(404, '', 0)])
+                status, body, delay = responses.pop(0) if len(responses) > 1 else responses[0]
+                time.sleep(delay)
+                payload = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LocalCacheTests(TestCase):
+    def test_expired_entries_are_dropped(self):
+        cache = LocalCache(timeout=60, max_entries=10)
+        cache.set('a', {'title': 'x'})
+        self.assertEqual(cache.get('a'), {'title': 'x'})
+
+        cache._cache.expire(cache._cache.timer() + 61)
+        self.assertIsNone(cache.get('a'))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LocalCache(timeout=60, max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+
+@override_settings(VIDEO_INFO_CACHE={'BACKEND': 'local', 'TIMEOUT': 60, 'MAX_ENTRIES': 10})
+class VideoInfoCacheTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        caches['default'].clear()
+        self.addCleanup(reset_caches)
+
+    def test_extract_video_id(self):
+        for url in (
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=10',
+            'https://youtu.be/dQw4w9WgXcQ',
+            'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+        ):
+            self.assertEqual(extract_video_id(url), 'dQw4w9WgXcQ')
+        self.assertIsNone(extract_video_id('https://example.com/watch?v=dQw4w9WgXcQ'))
+
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    def test_repeat_lookups_share_one_fetch(self, fetch):
+        first = get_video_info('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+        second = get_video_info('https://youtu.be/dQw4w9WgXcQ')
+
+        self.assertEqual(first, VIDEO_INFO)
+        self.assertEqual(second, VIDEO_INFO)
+        fetch.assert_called_once()
+
+    @override_settings(VIDEO_INFO_CACHE={'BACKEND': 'django', 'CACHE_ALIAS': 'default', 'TIMEOUT': 60})
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    def test_django_cache_backend(self, fetch):
+        get_video_info('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+        reset_caches()
+        get_video_info('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+
+        fetch.assert_called_once()
+
+    @mock.patch('summerizer.ai_utils.fetch_video_info', side_effect=ValueError('boom'))
+    def test_failures_are_not_cached(self, fetch):
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                get_video_info('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+        self.assertEqual(fetch.call_count, 2)
+
+
+@override_settings(SUMMARY_CACHE={'BACKEND': 'database', 'MAX_ENTRIES': 10})
+class SummaryCacheTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.addCleanup(reset_caches)
+
+    def test_key_ignores_whitespace_but_not_prompt(self):
+        key = SummaryCache.make_key('Some  video\ntext ', 'gpt', 'prompt', 100)
+        self.assertEqual(key, SummaryCache.make_key('Some video text', 'gpt', 'prompt', 100))
+        self.assertNotEqual(key, SummaryCache.make_key('Some video text', 'gpt', 'other', 100))
+        self.assertNotEqual(key, SummaryCache.make_key('Some video text', 'gpt', 'prompt', 200))
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('Short summary.'))
+    def test_identical_input_calls_llm_once(self, create):
+        text = 'A long enough description of a video about caching.'
+        self.assertEqual(generate_summary(text), 'Short summary.')
+        self.assertEqual(generate_summary(text + '  '), 'Short summary.')
+
+        create.assert_called_once()
+        entry = SummaryCacheEntry.objects.get()
+        self.assertEqual(entry.hit_count, 1)
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', side_effect=RuntimeError('down'))
+    def test_fallback_summaries_are_not_cached(self, create):
+        generate_summary('A long enough description. With sentences.')
+        self.assertFalse(SummaryCacheEntry.objects.exists())
+
+    def test_eviction_keeps_table_bounded(self):
+        cache = SummaryCache({'BACKEND': 'database', 'MAX_ENTRIES': 10})
+        for i in range(15):
+            cache.set(f'key-{i}', f'summary {i}', 'gpt')
+
+        self.assertLessEqual(SummaryCacheEntry.objects.count(), 10)
+        self.assertIsNotNone(cache.get('key-14'))
+        self.assertIsNone(cache.get('key-0'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_writes_count_the_table_only_when_it_may_be_full(self):
+        cache = SummaryCache({'BACKEND': 'database', 'MAX_ENTRIES': 10, 'SIZE_CHECK_EVERY': 5})
+        with CaptureQueriesContext(connection) as captured:
+            for i in range(15):
+                cache.set(f'key-{i}', f'summary {i}', 'gpt')
+        counts = [query for query in captured.captured_queries if 'COUNT(' in query['sql']]
+        # Writes 1 (nothing counted yet), 6 (SIZE_CHECK_EVERY), then 11, 13 and 15
+        # when the estimate passes MAX_ENTRIES
+        self.assertEqual(len(counts), 5)
+
+        # Rows another process added are noticed within SIZE_CHECK_EVERY writes
+        SummaryCacheEntry.objects.bulk_create([
+            SummaryCacheEntry(key=f'other-{i}', model='gpt', summary='-') for i in range(20)
+        ])
+        for i in range(5):
+            cache.set(f'key-{i}', f'summary {i}', 'gpt')
+        self.assertLessEqual(SummaryCacheEntry.objects.count(), 10)
+
+
+class SummarizeAPITestCase(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.addCleanup(reset_caches)
+        # Summaries are embedded on save; keep the index out of the project
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.embeddings_path = os.path.join(directory.name, 'embeddings')
+        overrides = override_settings(SEMANTIC_INDEX={'PATH': self.embeddings_path, 'DIMENSIONS': 256})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_embedding_index()
+        self.addCleanup(reset_embedding_index)
+        User = get_user_model()
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.other = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.client = APIClient()
+
+    def summarize(self, user, url='https://www.youtube.com/watch?v=dQw4w9WgXcQ', **data):
+        self.client.force_authenticate(user)
+        return self.client.post('/api/summaries/summarize/', {'url': url, **data}, format='json')
+
+
+class SummarizeViewTests(SummarizeAPITestCase):
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('Cached summary.'))
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    def test_second_user_is_served_from_caches(self, fetch, create):
+        first = self.summarize(self.user)
+        second = self.summarize(self.other, 'https://youtu.be/dQw4w9WgXcQ')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['summary'], 'Cached summary.')
+        fetch.assert_called_once()
+        create.assert_called_once()
+
+
+class SummaryJobTests(SummarizeAPITestCase):
+    def job_status(self, job_id):
+        return self.client.get(f'/api/summaries/jobs/{job_id}/')
+
+    @override_settings(SUMMARY_JOBS={'BACKEND': 'database', 'WORKERS': 1})
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('Job summary.'))
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    def test_async_mode_returns_job_and_worker_completes_it(self, fetch, create):
+        response = self.summarize(self.user, mode='async')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'queued')
+        fetch.assert_not_called()
+
+        job = run_next_job()
+        self.assertEqual(job.status, SummaryJob.STATUS_DONE)
+        self.assertIsNone(run_next_job())
+
+        status_response = self.job_status(response.data['id'])
+        self.assertEqual(status_response.data['status'], 'done')
+        self.assertEqual(status_response.data['summary']['summary'], 'Job summary.')
+
+    @override_settings(SUMMARY_JOBS={'BACKEND': 'thread', 'WORKERS': 1})
+    @mock.patch('summerizer.ai_utils.fetch_video_info', side_effect=ValueError('Video unavailable'))
+    def test_thread_backend_records_failures(self, fetch):
+        executor = mock.Mock(submit=lambda func, *args: func(*args))
+        with mock.patch('summerizer.jobs.get_executor', return_value=executor):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.summarize(self.user, mode='async')
+
+        status_response = self.job_status(response.data['id'])
+        self.assertEqual(status_response.data['status'], 'failed')
+        self.assertIn('Video unavailable', status_response.data['error'])
+        self.assertFalse(VideoSummary.objects.exists())
+
+    def test_jobs_are_private_to_their_owner(self):
+        job = SummaryJob.objects.create(user=self.other, video_url='https://youtu.be/dQw4w9WgXcQ')
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.job_status(job.pk).status_code, 404)
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.flight = SingleFlight({'WAIT_TIMEOUT': 5, 'POLL_INTERVAL': 0.01})
+
+    def test_concurrent_callers_share_one_execution(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(self.flight.do('video', work)))
+        leader.start()
+        started.wait(5)
+
+        followers = [
+            threading.Thread(target=lambda: results.append(self.flight.do('video', work)))
+            for _ in range(5)
+        ]
+        for thread in followers:
+            thread.start()
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        self.assertEqual(results, ['result'] * 6)
+        self.assertEqual(len(calls), 1)
+
+    def test_waits_for_result_published_by_another_process(self):
+        cache = caches['default']
+        cache.add('singleflight:lock:video', 'other-process', 60)
+
+        def finish_elsewhere():
+            cache.set('singleflight:result:video', 'theirs', 30)
+            cache.delete('singleflight:lock:video')
+
+        threading.Timer(0.05, finish_elsewhere).start()
+        func = mock.Mock(return_value='ours')
+
+        self.assertEqual(self.flight.do('video', func), 'theirs')
+        func.assert_not_called()
+
+    def test_runs_itself_when_the_owner_fails(self):
+        caches['default'].add('singleflight:lock:video', 'other-process', 60)
+        threading.Timer(0.05, caches['default'].delete, ['singleflight:lock:video']).start()
+
+        self.assertEqual(self.flight.do('video', lambda: 'ours'), 'ours')
+
+    def test_errors_propagate_to_the_leader(self):
+        def fail():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            self.flight.do('video', fail)
+        self.assertIsNone(caches['default'].get('singleflight:lock:video'))
+
+
+class HttpClientTests(TestCase):
+    def make_client(self, **config):
+        client = HttpClient({'BACKOFF_FACTOR': 0.01, 'READ_TIMEOUT': 1, **config})
+        self.addCleanup(client.close)
+        return client
+
+    def test_connections_are_reused(self):
+        with StubServer({'/ok': [(200, 'ok', 0)]}) as server:
+            client = self.make_client()
+            for _ in range(3):
+                self.assertEqual(client.get(f"{server.url}/ok").text, 'ok')
+
+        self.assertEqual(len({port for _, port in server.requests}), 1)
+
+    def test_retries_retryable_status_and_records_stats(self):
+        with StubServer({'/flaky': [(503, '', 0), (200, 'ok', 0)]}) as server:
+            client = self.make_client()
+            response = client.get(f"{server.url}/flaky")
+
+        self.assertEqual(response.status_code, 200)
+        stats = client.stats()[server.url.split('//')[1]]
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['retries'], 1)
+        self.assertIsNotNone(stats['p95_ms'])
+
+    def test_read_timeout_is_bounded(self):
+        with StubServer({'/slow': [(200, 'late', 0.5)]}) as server:
+            client = self.make_client(MAX_RETRIES=1)
+            with self.assertRaises(requests.Timeout):
+                client.get(f"{server.url}/slow", timeout=(1, 0.1))
+
+        self.assertEqual(len(server.requests), 2)
+
+    def test_deadline_caps_timeouts_and_retries(self):
+        with StubServer({'/slow': [(200, 'late', 0.5)]}) as server:
+            client = self.make_client(MAX_RETRIES=3)
+            started = time.monotonic()
+            with self.assertRaises(requests.Timeout):
+                client.get(f"{server.url}/slow", deadline=Deadline(0.2))
+            self.assertLess(time.monotonic() - started, 0.4)
+
+        self.assertEqual(len(server.requests), 1)
+
+    def test_alternative_fetch_uses_pooled_client(self):
+        reset_http_client()
+        self.addCleanup(reset_http_client)
+        page = 'var ytInitialPlayerResponse = {"shortDescription":"Line one\\nLine two"};'
+        oembed = json.dumps({'title': 'Stub Video', 'thumbnail_url': 'https://i.ytimg.com/x.jpg'})
+
+        with StubServer({'/oembed': [(200, oembed, 0)], '/watch': [(200, page, 0)]}) as server:
+            with mock.patch('summerizer.ai_utils.YOUTUBE_OEMBED_URL', f"{server.url}/oembed"):
+                info = fetch_video_info_alternative(f"{server.url}/watch")
+
+        self.assertEqual(info['title'], 'Stub Video')
+        self.assertEqual(info['description'], 'Line one\nLine two')
+
+
+@override_settings(LLM_STREAM_BACKEND='fake')
+class SummarizeStreamTests(SummarizeAPITestCase):
+    async def stream(self, headers):
+        client = AsyncClient()
+        response = await client.post(
+            '/api/summaries/summarize/stream/',
+            {'url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'},
+            content_type='application/json',
+            headers=headers,
+        )
+        if not response.streaming:
+            return response, []
+
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8')
+        events = []
+        for block in body.strip().split('\n\n'):
+            event_line, data_line = block.split('\n')
+            events.append((event_line[len('event: '):], json.loads(data_line[len('data: '):])))
+        return response, events
+
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    async def test_streams_tokens_and_persists_summary(self, fetch):
+        token = await sync_to_async(Token.objects.create)(user=self.user)
+        response, events = await self.stream({'Authorization': f'Token {token.key}'})
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        names = [name for name, _ in events]
+        self.assertEqual(names[0], 'meta')
+        self.assertEqual(names[-1], 'done')
+        self.assertGreater(names.count('token'), 1)
+
+        streamed = ''.join(data['token'] for name, data in events if name == 'token').strip()
+        self.assertEqual(events[-1][1]['summary'], streamed)
+        stored = await VideoSummary.objects.select_related('video').aget(user=self.user)
+        self.assertEqual(stored.video.summary, streamed)
+
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    async def test_stored_video_is_not_overwritten(self, fetch):
+        video = await Video.objects.acreate(
+            video_id='dQw4w9WgXcQ', title='Test Video', summary='A carefully written LLM summary.'
+        )
+        await VideoSummary.objects.acreate(user=self.user, video_url='https://youtu.be/dQw4w9WgXcQ', video=video)
+
+        token = await sync_to_async(Token.objects.create)(user=self.other)
+        response, events = await self.stream({'Authorization': f'Token {token.key}'})
+
+        self.assertEqual([name for name, _ in events], ['meta', 'token', 'done'])
+        self.assertEqual(events[1][1]['token'], 'A carefully written LLM summary.')
+        self.assertEqual(events[-1][1]['summary'], 'A carefully written LLM summary.')
+        fetch.assert_not_called()
+        await video.arefresh_from_db()
+        self.assertEqual(video.summary, 'A carefully written LLM summary.')
+        self.assertEqual(await VideoSummary.objects.filter(video=video).acount(), 2)
+
+    @mock.patch('summerizer.streaming.stream_summary', side_effect=RuntimeError('LLM down'))
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    async def test_prompt_planning_and_fallback_run_off_the_event_loop(self, fetch, stream_summary):
+        from .ai_utils import generate_fallback_summary, plan_summary_request
+
+        on_loop = []
+
+        def recorded(function):
+            def wrapper(*args):
+                try:
+                    asyncio.get_running_loop()
+                    on_loop.append(function.__name__)
+                except RuntimeError:
+                    pass
+                return function(*args)
+            return wrapper
+
+        token = await sync_to_async(Token.objects.create)(user=self.user)
+        with mock.patch('summerizer.streaming.plan_summary_request', recorded(plan_summary_request)), \
+                mock.patch('summerizer.streaming.generate_fallback_summary', recorded(generate_fallback_summary)):
+            _, events = await self.stream({'Authorization': f'Token {token.key}'})
+
+        self.assertEqual([name for name, _ in events], ['meta', 'fallback', 'done'])
+        self.assertEqual(on_loop, [])
+
+    async def test_requires_authentication(self):
+        response, _ = await self.stream({})
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(
+    SUMMARY_CACHE={'BACKEND': 'django', 'CACHE_ALIAS': 'default'},
+    SUMMARY_CHUNKING={'CHUNK_TOKENS': 50, 'OVERLAP_TOKENS': 5, 'CONCURRENCY': 4},
+    SUMMARY_TOKENIZER='regex',
+)
+class ChunkedSummaryTests(TestCase):
+    def setUp(self):
+        get_tokenizer.cache_clear()
+        self.addCleanup(get_tokenizer.cache_clear)
+        reset_caches()
+        caches['default'].clear()
+        self.addCleanup(reset_caches)
+
+    def test_chunks_overlap_and_cover_the_text(self):
+        # Every number is a single token
+        text = ' '.join(str(i) for i in range(100, 200))
+        chunks = split_into_chunks(text, chunk_tokens=30, overlap_tokens=5)
+
+        self.assertTrue(all(count_tokens(chunk) <= 30 for chunk in chunks))
+        self.assertTrue(chunks[0].startswith('100 '))
+        self.assertTrue(chunks[0].endswith(' 129'))
+        self.assertTrue(chunks[-1].endswith(' 199'))
+        # Consecutive chunks share the overlap tokens
+        self.assertTrue(chunks[1].startswith('125 '))
+
+    def test_long_text_is_mapped_concurrently_then_reduced(self):
+        text = ' '.join(f'Sentence number {i} about the video.' for i in range(16))
+        barrier = threading.Barrier(4, timeout=5)
+        prompts = []
+
+        def create(**kwargs):
+            content = kwargs['messages'][-1]['content']
+            prompts.append(content)
+            if content.startswith('Please summarize this part'):
+                # Fails unless all four chunks are in flight at once
+                barrier.wait()
+                return make_completion(f'partial {len(prompts)}')
+            return make_completion('Final summary.')
+
+        with mock.patch('summerizer.llm.OpenAIProvider.create', side_effect=create):
+            summary = generate_summary(text)
+
+        self.assertEqual(summary, 'Final summary.')
+        self.assertEqual(len(split_into_chunks(text, 50, 5)), 4)
+        self.assertEqual(len(prompts), 5)
+        self.assertTrue(prompts[-1].startswith('These are summaries'))
+
+
+@override_settings(
+    SUMMARY_TOKENIZER='regex',
+    SUMMARY_TOKEN_BUDGET={'COMPLETION_RATIO': 0.5, 'MIN_COMPLETION_TOKENS': 50, 'MAX_COMPLETION_TOKENS': 400},
+)
+class TokenBudgetTests(TestCase):
+    def setUp(self):
+        get_tokenizer.cache_clear()
+        self.addCleanup(get_tokenizer.cache_clear)
+        reset_caches()
+        self.addCleanup(reset_caches)
+
+    def test_tokenizer_is_loaded_once(self):
+        self.assertIsInstance(get_tokenizer('gpt-3.5-turbo'), RegexTokenizer)
+        self.assertIs(get_tokenizer('gpt-3.5-turbo'), get_tokenizer('gpt-3.5-turbo'))
+
+    def test_regex_tokenizer_spans_cover_the_text(self):
+        tokenizer = RegexTokenizer()
+        text = "It's a summarization test_case with 12345 numbers, 日本語 and  spaces!"
+        self.assertEqual(''.join(text[start:end] for start, end in tokenizer.spans(text)), text)
+        self.assertEqual(tokenizer.count('日本語'), 3)
+
+    def test_max_tokens_scales_with_input(self):
+        self.assertEqual(choose_max_tokens(20), 50)
+        self.assertEqual(choose_max_tokens(300), 150)
+        self.assertEqual(choose_max_tokens(5000), 400)
+
+    def test_input_is_trimmed_to_exactly_fit_the_context(self):
+        text = 'word ' * 20000
+        with mock.patch.dict('summerizer.tokens.MODEL_CONTEXT_WINDOWS', {'tiny': 1000}):
+            fitted, max_tokens, input_tokens, prompt_tokens = fit_prompt(text, summary_messages, 'tiny')
+
+        self.assertEqual(max_tokens, 400)
+        self.assertEqual(prompt_tokens + max_tokens, 1000)
+        self.assertEqual(count_tokens(fitted), input_tokens)
+        self.assertTrue(text.startswith(fitted))
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('Short summary.'))
+    def test_usage_is_recorded_per_request(self, create):
+        text = 'A description long enough to summarize, with a few words.'
+        with track_usage() as usage:
+            generate_summary(text)
+            generate_summary(text)
+
+        totals = usage.totals()
+        self.assertEqual(totals['llm_calls'], 1)
+        self.assertEqual(totals['cached_calls'], 1)
+        self.assertGreater(totals['prompt_tokens'], count_tokens(text))
+        self.assertEqual(create.call_args.kwargs['max_tokens'], 50)
+
+
+class ExtractiveSummaryTests(TestCase):
+    TEXT = (
+        "Subscribe to the channel for more videos. "
+        "In this video we build a Django cache for YouTube summaries. "
+        "The cache stores each video summary so repeated requests are fast. "
+        "Follow me on social media! "
+        "A shared cache also keeps YouTube summaries consistent between workers. "
+        "Thanks for watching."
+    )
+
+    def test_split_sentences(self):
+        self.assertEqual(
+            split_sentences("First one. Second one!\nThird line without a stop"),
+            ['First one.', 'Second one!', 'Third line without a stop'],
+        )
+
+    def test_picks_central_sentences_in_original_order(self):
+        summary = extractive_summary(self.TEXT, sentence_count=3)
+
+        self.assertIn('we build a Django cache', summary)
+        self.assertNotIn('Follow me', summary)
+        self.assertLess(summary.index('Django cache'), summary.index('repeated requests'))
+
+    def test_short_and_empty_input(self):
+        self.assertEqual(extractive_summary('Only one sentence.'), 'Only one sentence.')
+        self.assertEqual(extractive_summary(''), '')
+
+    def test_shrink_text_respects_token_budget(self):
+        shrunk = shrink_text(self.TEXT, 30, lambda sentence: len(sentence.split()))
+
+        self.assertLessEqual(len(shrunk.split()), 30)
+        self.assertIn('Django cache', shrunk)
+
+    def test_memory_grows_with_the_text_not_the_vocabulary(self):
+        # 4000 sentences over a 24000-word vocabulary: dense sentence x term
+        # and sentence x sentence matrices would take hundreds of megabytes
+        rng = random.Random(7)
+        words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(8)) for _ in range(24000)]
+        text = ' '.join(f"{' '.join(rng.sample(words, 10))}." for _ in range(4000))
+
+        tracemalloc.start()
+        try:
+            sentences, scores = rank_sentences(text)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(scores), 4000)
+        self.assertAlmostEqual(float(scores.sum()), 1.0, places=3)
+        self.assertLess(peak, 64 * 1024 * 1024)
+
+
+@override_settings(
+    SUMMARY_CACHE={'BACKEND': 'django', 'CACHE_ALIAS': 'default'},
+    SUMMARY_BATCH={'MAX_URLS': 5, 'FETCH_CONCURRENCY': 2, 'LLM_CONCURRENCY': 1},
+)
+class SummarizeBatchTests(SummarizeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def fake_fetch(self, url, deadline=None):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        if 'bad' in url or 'Bad' in url:
+            raise ValueError('Video unavailable')
+        return {**VIDEO_INFO, 'title': f"Video {extract_video_id(url)}"}
+
+    def batch(self, urls):
+        self.client.force_authenticate(self.user)
+        return self.client.post('/api/summaries/summarize_batch/', {'urls': urls}, format='json')
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('Batch summary.'))
+    def test_deduplicates_and_reports_each_url(self, create):
+        video = Video.objects.create(video_id='aaaaaaaaaaa', title='Old', summary='Old')
+        VideoSummary.objects.create(user=self.user, video_url='https://youtu.be/aaaaaaaaaaa', video=video)
+        Video.objects.create(video_id='ddddddddddd', title='Theirs', summary='Theirs')
+        urls = [
+            'https://www.youtube.com/watch?v=aaaaaaaaaaa',
+            'https://youtu.be/aaaaaaaaaaa',
+            'https://www.youtube.com/watch?v=bbbbbbbbbbb',
+            'https://www.youtube.com/watch?v=BadBadBadBa',
+            'https://www.youtube.com/watch?v=ddddddddddd',
+        ]
+        with mock.patch('summerizer.ai_utils.fetch_video_info', side_effect=self.fake_fetch) as fetch:
+            response = self.batch(urls)
+
+        self.assertEqual(response.status_code, 200)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ['updated', 'duplicate', 'created', 'failed', 'created'])
+        self.assertEqual(response.data['counts'], {'updated': 1, 'duplicate': 1, 'created': 2, 'failed': 1})
+        # Videos already stored aren't fetched again
+        self.assertEqual(fetch.call_count, 2)
+        self.assertLessEqual(self.max_in_flight, 2)
+        self.assertEqual(VideoSummary.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Video.objects.count(), 3)
+        self.assertEqual(VideoSummary.objects.get(video_url=urls[0]).video.title, 'Old')
+        self.assertEqual(Video.objects.get(video_id='bbbbbbbbbbb').title, 'Video bbbbbbbbbbb')
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('Batch summary.'))
+    def test_history_row_added_concurrently_is_updated(self, create):
+        urls = ['https://www.youtube.com/watch?v=aaaaaaaaaaa', 'https://www.youtube.com/watch?v=bbbbbbbbbbb']
+        plan_history = pipeline._plan_history
+
+        def racing_plan(*args):
+            # Another request stores bbbbbbbbbbb for the same user after the lookup
+            planned = plan_history(*args)
+            if racing_plan.calls == 0:
+                video = Video.objects.create(video_id='bbbbbbbbbbb', title='Theirs', summary='Theirs')
+                VideoSummary.objects.create(user=self.user, video_url='https://youtu.be/bbbbbbbbbbb', video=video)
+            racing_plan.calls += 1
+            return planned
+        racing_plan.calls = 0
+
+        with mock.patch('summerizer.ai_utils.fetch_video_info', side_effect=self.fake_fetch), \
+                mock.patch('summerizer.pipeline._plan_history', side_effect=racing_plan):
+            response = self.batch(urls)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'updated'])
+        self.assertEqual(racing_plan.calls, 2)
+        self.assertEqual(VideoSummary.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(VideoSummary.objects.get(video_id='bbbbbbbbbbb').video_url, urls[1])
+
+    def test_rejects_oversized_batches(self):
+        response = self.batch([f'https://youtu.be/{i:011d}' for i in range(6)])
+        self.assertEqual(response.status_code, 400)
+
+
+PLAYLIST_PAGE = (
+    '<script>ytcfg.set({"INNERTUBE_API_KEY":"test-key","INNERTUBE_CLIENT_VERSION":"2.0"});</script>'
+    '<script>var ytInitialData = {"contents":['
+    '{"playlistVideoRenderer":{"videoId":"aaaaaaaaaaa"}},'
+    '{"playlistVideoRenderer":{"videoId":"bbbbbbbbbbb"}},'
+    '{"playlistVideoRenderer":{"videoId":"aaaaaaaaaaa"}},'
+    '{"continuationItemRenderer":{"continuationEndpoint":{"continuationCommand":{"token":"page-2"}}}}'
+    ']};</script>'
+)
+BROWSE_PAGE = json.dumps({'items': [
+    {'playlistVideoRenderer': {'videoId': 'ccccccccccc'}},
+    {'playlistVideoRenderer': {'videoId': 'bbbbbbbbbbb'}},
+]}, separators=(',', ':'))
+
+
+@override_settings(
+    HTTP_CLIENT={'MAX_RETRIES': 0, 'READ_TIMEOUT': 2},
+    INGESTION={'WORKERS': 2, 'MAX_PENDING': 2, 'CHECKPOINT_EVERY': 1, 'MAX_PAGES': 10, 'STALE_AFTER': 60},
+)
+class IngestionTests(SummarizeAPITestCase):
+    SOURCE_URL = 'https://www.youtube.com/playlist?list=PLtest'
+
+    def setUp(self):
+        super().setUp()
+        reset_http_client()
+        self.addCleanup(reset_http_client)
+
+    def stub(self, browse_responses):
+        server = StubServer({'/playlist': [(200, PLAYLIST_PAGE, 0)], '/youtubei/v1/browse': browse_responses})
+        patcher = mock.patch('summerizer.ingestion.YOUTUBE_BASE_URL', server.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return server
+
+    def test_listing_follows_continuations_without_duplicates(self):
+        with self.stub([(200, BROWSE_PAGE, 0)]):
+            pages = list(iter_listing_pages(self.SOURCE_URL))
+
+        self.assertEqual([video_ids for video_ids, _ in pages], [['aaaaaaaaaaa', 'bbbbbbbbbbb'], ['ccccccccccc']])
+        self.assertEqual(pages[0][1]['token'], 'page-2')
+        self.assertIsNone(pages[-1][1])
+
+    @mock.patch('summerizer.ingestion.summarize_video')
+    def test_interrupted_run_resumes_from_checkpoint(self, summarize):
+        run = IngestionRun.objects.create(user=self.user, source_url=self.SOURCE_URL)
+
+        # The continuation page fails: the first page is processed and checkpointed
+        with self.stub([(503, '', 0)]):
+            run = IngestionWorker(run).run_to_completion()
+        self.assertEqual(run.status, IngestionRun.STATUS_FAILED)
+        self.assertEqual(run.next_index, 2)
+        self.assertEqual(run.listing_state['token'], 'page-2')
+
+        summarize.reset_mock()
+        with self.stub([(200, BROWSE_PAGE, 0)]):
+            run = IngestionWorker(IngestionRun.objects.get(pk=run.pk)).run_to_completion()
+
+        self.assertEqual(run.status, IngestionRun.STATUS_DONE)
+        self.assertEqual(run.video_ids, ['aaaaaaaaaaa', 'bbbbbbbbbbb', 'ccccccccccc'])
+        self.assertEqual((run.next_index, run.succeeded, run.failed), (3, 3, 0))
+        summarize.assert_called_once_with(
+            self.user, 'https://www.youtube.com/watch?v=ccccccccccc', priority=PRIORITY_BATCH
+        )
+
+    def test_concurrent_resumes_claim_the_run_once(self):
+        run = IngestionRun.objects.create(user=self.user, source_url=self.SOURCE_URL, status=IngestionRun.STATUS_FAILED)
+        first, second = IngestionRun.objects.get(pk=run.pk), IngestionRun.objects.get(pk=run.pk)
+
+        # Both saw a failed run; only the first update matches it
+        self.assertTrue(claim_for_resume(first, IngestionRun.STATUS_QUEUED))
+        self.assertFalse(claim_for_resume(second, IngestionRun.STATUS_QUEUED))
+        self.assertEqual(second.status, IngestionRun.STATUS_QUEUED)
+
+        IngestionRun.objects.filter(pk=run.pk).update(status=IngestionRun.STATUS_FAILED)
+        self.client.force_authenticate(self.user)
+        with mock.patch('summerizer.views.run_in_background') as background:
+            responses = [self.client.post(f'/api/summaries/ingestions/{run.pk}/resume/') for _ in range(2)]
+        self.assertEqual([response.status_code for response in responses], [202, 409])
+        background.assert_called_once()
+
+    def test_ingest_endpoint_validates_source(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            '/api/summaries/ingest/', {'url': 'https://www.youtube.com/watch?v=aaaaaaaaaaa'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+        with mock.patch('summerizer.views.run_in_background') as background:
+            response = self.client.post('/api/summaries/ingest/', {'url': self.SOURCE_URL}, format='json')
+        self.assertEqual(response.status_code, 202)
+        background.assert_called_once()
+
+        status_response = self.client.get(f"/api/summaries/ingestions/{response.data['id']}/")
+        self.assertEqual(status_response.data['status'], 'queued')
+
+
+class ServiceStatsTests(SummarizeAPITestCase):
+    @override_settings(LLM={**settings.LLM, 'PROVIDERS': ['echo']})
+    def test_staff_only(self):
+        reset_llm_router()
+        self.addCleanup(reset_llm_router)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/service/stats/').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/service/stats/')
+        self.assertEqual(response.status_code, 200)
+        stats = response.json()
+        self.assertEqual(set(stats), {'llm_scheduler', 'llm_providers', 'summary_cache', 'http_client'})
+        self.assertIn('queue_depth', stats['llm_scheduler'])
+        self.assertIn('circuit', stats['llm_providers']['echo'])
+
+
+class FailingProvider:
+    """Provider that always raises, to exercise failover"""
+
+    def __init__(self, name='broken'):
+        self.name = name
+        self.model = name
+
+    def complete(self, messages, max_tokens, timeout=None):
+        raise RuntimeError(f'{self.name} is down')
+
+    def stream(self, messages, max_tokens):
+        raise RuntimeError(f'{self.name} is down')
+
+
+class LLMRouterTests(TestCase):
+    MESSAGES = summary_messages('The router picks a provider. It measures latency. Slow providers are hedged.')
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def router(self, providers, breaker_config=None, **config):
+        router = LLMRouter({'MIN_SAMPLES': 1, **config}, providers=providers, breaker_config=breaker_config or {})
+        self.addCleanup(router.close)
+        return router
+
+    def test_routes_to_the_fastest_provider(self):
+        slow, fast = EchoProvider('slow', delay=0.05), EchoProvider('fast')
+        router = self.router([slow, fast])
+        # Both are measured once, after that the fast one always wins
+        router.call(slow, self.MESSAGES, 50)
+        router.call(fast, self.MESSAGES, 50)
+
+        for _ in range(3):
+            self.assertEqual(router.complete(self.MESSAGES, 50).provider, 'fast')
+        stats = router.stats()
+        self.assertEqual(stats['slow']['calls'], 1)
+        self.assertLess(stats['fast']['p50_ms'], stats['slow']['p50_ms'])
+
+    def test_fails_over_and_benches_unhealthy_providers(self):
+        router = self.router(
+            [FailingProvider(), EchoProvider()], breaker_config={'FAILURE_THRESHOLD': 2, 'RESET_TIMEOUT': 60}
+        )
+        # Keep the failing provider first, so its circuit is what benches it
+        with mock.patch.object(router, 'ranked_providers', return_value=router.providers):
+            for _ in range(3):
+                self.assertEqual(router.complete(self.MESSAGES, 50).provider, 'echo')
+
+        stats = router.stats()
+        self.assertEqual(stats['broken']['failures'], 2)
+        self.assertEqual(stats['broken']['circuit']['state'], 'open')
+
+    def test_providers_that_keep_failing_go_last(self):
+        class Unauthorized(Exception):
+            status_code = 401
+
+        rejected = FailingProvider('rejected')
+        rejected.complete = mock.Mock(side_effect=Unauthorized('Invalid API key'))
+        router = self.router([rejected, EchoProvider('first'), EchoProvider('second')])
+
+        # Only the first call pays for the failing provider
+        for _ in range(5):
+            self.assertEqual(router.complete(self.MESSAGES, 50).provider, 'first')
+        self.assertEqual(rejected.complete.call_count, 1)
+        # Measured and healthy, then unmeasured, then failing
+        self.assertEqual([provider.name for provider in router.ranked_providers()], ['first', 'second', 'rejected'])
+
+        stats = router.stats()
+        self.assertEqual(stats['rejected']['failure_rate'], 1.0)
+        # A 4xx doesn't count against the circuit, so only the ranking keeps it out of the way
+        self.assertEqual(stats['rejected']['circuit']['state'], 'closed')
+
+    def test_hedges_a_slow_primary(self):
+        slow = EchoProvider('slow', delay=0.05)
+        router = self.router([slow, EchoProvider('backup')], HEDGE=True)
+        router.complete(self.MESSAGES, 50)
+        router.complete(self.MESSAGES, 50)
+
+        # The primary's p95 is now known; past it the backup is fired too
+        slow.delay = 1.0
+        with mock.patch.object(router, 'ranked_providers', return_value=router.providers):
+            started = time.monotonic()
+            response = router.complete(self.MESSAGES, 50)
+        self.assertEqual(response.provider, 'backup')
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_stream_fails_over_before_the_first_token(self):
+        router = self.router([FailingProvider(), EchoProvider()])
+        with mock.patch.object(router, 'ranked_providers', return_value=router.providers):
+            text = ''.join(router.stream(self.MESSAGES, 50))
+        self.assertEqual(text.strip(), EchoProvider().summarize(self.MESSAGES))
+        self.assertEqual(router.stats()['broken']['failures'], 1)
+
+
+def slow_pytube(url):
+    time.sleep(1)
+    return VIDEO_INFO
+
+
+@override_settings(
+    SUMMARY_CACHE={'BACKEND': 'django', 'CACHE_ALIAS': 'default', 'TIMEOUT': 60},
+    SUMMARIZE_DEADLINE={'SECONDS': 0.3, 'PYTUBE_TIMEOUT': 8, 'LLM_MIN_SECONDS': 0.1},
+)
+class DeadlineTests(SummarizeAPITestCase):
+    TEXT = 'A description long enough to summarize. It has a second sentence. And a third one.'
+
+    @mock.patch('summerizer.ai_utils.fetch_video_info_alternative', return_value=VIDEO_INFO)
+    @mock.patch('summerizer.ai_utils.fetch_video_info_pytube', side_effect=slow_pytube)
+    def test_stuck_pytube_falls_back_within_the_budget(self, pytube, alternative):
+        started = time.monotonic()
+        self.assertEqual(get_video_info('https://www.youtube.com/watch?v=dQw4w9WgXcQ', Deadline(0.2)), VIDEO_INFO)
+
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertIsInstance(alternative.call_args.args[1], Deadline)
+
+    @override_settings(PYTUBE={'WORKERS': 1, 'BACKGROUND_WORKERS': 1})
+    @mock.patch('summerizer.ai_utils.fetch_video_info_alternative', return_value=VIDEO_INFO)
+    @mock.patch('summerizer.ai_utils.fetch_video_info_pytube', side_effect=lambda url: time.sleep(0.3) or VIDEO_INFO)
+    def test_queued_lookups_are_cancelled_and_background_work_has_its_own_pool(self, pytube, alternative):
+        reset_pytube_executors()
+        self.addCleanup(reset_pytube_executors)
+
+        # The first batch lookup holds the only background thread, the second
+        # gives up while still queued
+        with scheduled_as(None, PRIORITY_BATCH):
+            fetch_video_info('https://youtu.be/aaaaaaaaaaa', Deadline(0.05))
+            fetch_video_info('https://youtu.be/bbbbbbbbbbb', Deadline(0.05))
+        # An interactive lookup still gets a thread straight away
+        fetch_video_info('https://youtu.be/ccccccccccc', Deadline(0.05))
+        self.assertEqual(pytube.call_count, 2)
+
+        # Once the background thread is free, the abandoned lookup doesn't run
+        time.sleep(0.4)
+        self.assertEqual(
+            [call.args[0] for call in pytube.call_args_list],
+            ['https://www.youtube.com/watch?v=aaaaaaaaaaa', 'https://www.youtube.com/watch?v=ccccccccccc'],
+        )
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('LLM summary.'))
+    def test_llm_is_skipped_without_time_for_it(self, create):
+        self.assertEqual(generate_summary(self.TEXT, Deadline(0.05)), extractive_summary(self.TEXT, 3))
+        create.assert_not_called()
+
+        self.assertEqual(generate_summary(self.TEXT, Deadline(5)), 'LLM summary.')
+        self.assertLessEqual(create.call_args.kwargs['timeout'], 5)
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('LLM summary.'))
+    @mock.patch('summerizer.ai_utils.fetch_video_info_alternative', return_value=VIDEO_INFO)
+    @mock.patch('summerizer.ai_utils.fetch_video_info_pytube', side_effect=slow_pytube)
+    def test_summarize_request_answers_before_the_deadline(self, pytube, alternative, create):
+        started = time.monotonic()
+        response = self.summarize(self.user)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 0.6)
+        # Fetching used up the budget, so the summary is the extractive fallback
+        create.assert_not_called()
+        self.assertEqual(response.data['summary'], extractive_summary(VIDEO_INFO['description'], 3))
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        reset_llm_router()
+        self.addCleanup(reset_llm_router)
+
+    def breaker(self, **config):
+        return CircuitBreaker('test', {'FAILURE_THRESHOLD': 3, 'RESET_TIMEOUT': 60, 'SYNC_INTERVAL': 0, **config})
+
+    def test_opens_after_consecutive_failures_and_rejects_fast(self):
+        breaker = self.breaker()
+        for _ in range(3):
+            self.assertFalse(breaker.acquire())
+            breaker.record_failure()
+        self.assertEqual(breaker.state(), 'open')
+
+        breaker.sync_interval = 1.0
+        started = time.monotonic()
+        for _ in range(1000):
+            with self.assertRaises(CircuitOpenError):
+                breaker.acquire()
+        # Rejections are served from the local copy of the state
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(breaker.stats()['rejected'], 1000)
+
+    def test_opens_on_error_rate(self):
+        breaker = self.breaker(FAILURE_THRESHOLD=100, MIN_CALLS=4, ERROR_RATE=0.5)
+        for failed in (False, True, False, True):
+            breaker.record_failure() if failed else breaker.record_success()
+        self.assertEqual(breaker.state(), 'open')
+
+    def test_half_open_probe_closes_or_reopens(self):
+        breaker = self.breaker(RESET_TIMEOUT=0.05)
+        for _ in range(3):
+            breaker.record_failure()
+        time.sleep(0.06)
+        self.assertEqual(breaker.state(), 'half_open')
+
+        # Only one probe at a time; its failure reopens the circuit
+        self.assertTrue(breaker.acquire())
+        with self.assertRaises(CircuitOpenError):
+            breaker.acquire()
+        breaker.record_failure(probe=True)
+        self.assertEqual(breaker.state(), 'open')
+
+        time.sleep(0.06)
+        breaker.record_success(probe=breaker.acquire())
+        self.assertEqual(breaker.state(), 'closed')
+        stats = breaker.stats()
+        self.assertEqual((stats['opened'], stats['closed']), (2, 1))
+
+    def test_state_is_shared_between_workers(self):
+        first, second = self.breaker(), self.breaker()
+        for _ in range(3):
+            first.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            second.acquire()
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('LLM summary.'))
+    def test_open_circuit_goes_straight_to_fallback(self, create):
+        breaker = get_llm_router().breakers['openai']
+        for _ in range(settings.CIRCUIT_BREAKER['FAILURE_THRESHOLD']):
+            breaker.record_failure()
+
+        text = 'A description long enough to summarize. It has a second sentence. And a third one.'
+        self.assertEqual(generate_summary(text), extractive_summary(text, 3))
+        create.assert_not_called()
+
+
+class LLMSchedulerTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        reset_llm_scheduler()
+        self.addCleanup(reset_llm_scheduler)
+
+    def scheduler(self, **config):
+        return LLMScheduler({'RPM': 0, 'TPM': 0, 'MAX_WAIT': 0.1, 'POLL_INTERVAL': 0.01, **config})
+
+    def test_requests_per_minute_limit(self):
+        scheduler = self.scheduler(RPM=2)
+        scheduler.acquire(10)
+        scheduler.acquire(10)
+        with self.assertRaises(SchedulerTimeout):
+            scheduler.acquire(10)
+
+        stats = scheduler.stats()
+        self.assertEqual((stats['admitted'], stats['timeouts']), (2, 1))
+        self.assertEqual(stats['requests_last_minute'], 2)
+
+    def test_tokens_per_minute_limit_uses_actual_usage(self):
+        scheduler = self.scheduler(TPM=100)
+        reservation = scheduler.acquire(60)
+        with self.assertRaises(SchedulerTimeout):
+            scheduler.acquire(60)
+
+        # The first call turned out smaller than estimated
+        scheduler.settle(reservation, 30)
+        scheduler.acquire(60)
+        self.assertEqual(scheduler.stats()['tokens_last_minute'], 90)
+
+    def test_queue_serves_priorities_then_users_round_robin(self):
+        scheduler = self.scheduler(MAX_WAIT=5)
+        gate = threading.Event()
+        admitted = []
+
+        def try_acquire(tokens):
+            if gate.is_set():
+                admitted.append(tokens)
+            return gate.is_set()
+
+        scheduler.limiter.try_acquire = try_acquire
+        # Tokens double as request labels: alice 1-3 and bob 10 are batch work,
+        # carol 20 is interactive and arrives last
+        requests = [('alice', PRIORITY_BATCH, 1), ('alice', PRIORITY_BATCH, 2), ('alice', PRIORITY_BATCH, 3),
+                    ('bob', PRIORITY_BATCH, 10), ('carol', PRIORITY_INTERACTIVE, 20)]
+        threads = []
+        for queued, (user, priority, tokens) in enumerate(requests, 1):
+            thread = threading.Thread(target=scheduler.acquire, args=(tokens, user, priority))
+            thread.start()
+            threads.append(thread)
+            while sum(scheduler.stats()['queue_depth'].values()) < queued:
+                time.sleep(0.005)
+
+        self.assertEqual(scheduler.stats()['queue_depth'], {'batch': 4, 'interactive': 1})
+        gate.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        self.assertEqual(admitted, [20, 1, 10, 2, 3])
+        self.assertEqual(scheduler.stats()['admitted'], 5)
+
+    @override_settings(
+        SUMMARY_CACHE={'BACKEND': 'django', 'CACHE_ALIAS': 'default', 'TIMEOUT': 60},
+        LLM_SCHEDULER={'RPM': 1, 'TPM': 0, 'MAX_WAIT': 0.05, 'POLL_INTERVAL': 0.01},
+    )
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('LLM summary.'))
+    def test_rate_limited_calls_fall_back(self, create):
+        reset_caches()
+        self.addCleanup(reset_caches)
+        first = 'A description long enough to summarize. It has a second sentence.'
+        second = 'Another description to summarize. It has sentences too. And a third.'
+
+        self.assertEqual(generate_summary(first), 'LLM summary.')
+        self.assertEqual(generate_summary(second), extractive_summary(second, 3))
+        create.assert_called_once()
+
+    def test_try_acquire_never_waits_or_jumps_the_queue(self):
+        scheduler = self.scheduler(RPM=2)
+        self.assertIsNotNone(scheduler.try_acquire(10))
+        scheduler.acquire(10)
+        self.assertIsNone(scheduler.try_acquire(10))
+        self.assertEqual(scheduler.stats()['requests_last_minute'], 2)
+
+    @override_settings(SUMMARY_CACHE={'BACKEND': 'django', 'CACHE_ALIAS': 'default', 'TIMEOUT': 60})
+    def test_hedges_need_a_rate_limit_slot_of_their_own(self):
+        reset_caches()
+        self.addCleanup(reset_caches)
+        text = 'A description long enough to summarize. It has a second sentence.'
+        for rpm, hedged in ((1, False), (2, True)):
+            caches['default'].clear()
+            router = LLMRouter(
+                {'HEDGE': True, 'HEDGE_DELAY': 0.05, 'MIN_SAMPLES': 100},
+                providers=[EchoProvider('slow', delay=0.3), EchoProvider('backup')], breaker_config={},
+            )
+            self.addCleanup(router.close)
+            scheduler = self.scheduler(RPM=rpm)
+            with mock.patch('summerizer.ai_utils.get_llm_router', return_value=router), \
+                    mock.patch('summerizer.ai_utils.get_llm_scheduler', return_value=scheduler):
+                request_summary(text)
+
+            # Without headroom the primary is waited for instead of hedged
+            stats = router.stats()
+            self.assertEqual(stats['backup']['calls'], int(hedged))
+            self.assertEqual(scheduler.stats()['requests_last_minute'], rpm)
+
+    def test_release_gives_back_the_reservation(self):
+        scheduler = self.scheduler(RPM=1, TPM=100)
+        scheduler.release(scheduler.acquire(60))
+        self.assertEqual(scheduler.stats()['requests_last_minute'], 0)
+        self.assertEqual(scheduler.stats()['tokens_last_minute'], 0)
+        scheduler.acquire(60)
+
+    @override_settings(LLM_SCHEDULER={'RPM': 1, 'TPM': 0, 'MAX_WAIT': 5, 'POLL_INTERVAL': 0.01})
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('LLM summary.'))
+    def test_open_circuit_takes_no_rate_limit_slot(self, create):
+        reset_llm_router()
+        self.addCleanup(reset_llm_router)
+        breaker = get_llm_router().breakers['openai']
+        for _ in range(settings.CIRCUIT_BREAKER['FAILURE_THRESHOLD']):
+            breaker.record_failure()
+
+        started = time.monotonic()
+        for i in range(3):
+            text = f'Description number {i} to summarize. It has a second sentence.'
+            self.assertEqual(generate_summary(text), extractive_summary(text, 3))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(get_llm_scheduler().stats()['requests_last_minute'], 0)
+        create.assert_not_called()
+
+    @override_settings(LLM_SCHEDULER={'RPM': 0, 'TPM': 10000, 'MAX_WAIT': 0.1, 'POLL_INTERVAL': 0.01})
+    def test_stream_settles_actual_usage(self):
+        reset_llm_router()
+        self.addCleanup(reset_llm_router)
+        text = 'A description to summarize.'
+        with mock.patch.object(get_llm_router(), 'stream', return_value=iter(['Short ', 'summary.'])):
+            self.assertEqual(''.join(stream_summary(text, max_tokens=400)), 'Short summary.')
+
+        prompt_tokens = count_message_tokens(summary_messages(text), 'gpt-3.5-turbo')
+        self.assertEqual(
+            get_llm_scheduler().stats()['tokens_last_minute'],
+            prompt_tokens + count_tokens('Short summary.', 'gpt-3.5-turbo'),
+        )
+
+
+class VideoIdTests(SummarizeAPITestCase):
+    def test_parses_every_youtube_url_form(self):
+        for url in [
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://www.youtube.com/watch?feature=share&v=dQw4w9WgXcQ&t=10s',
+            'https://m.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://music.youtube.com/watch?v=dQw4w9WgXcQ&list=RDdQw4w9WgXcQ',
+            'https://youtu.be/dQw4w9WgXcQ?t=42',
+            'youtu.be/dQw4w9WgXcQ',
+            'www.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+            'https://www.youtube.com/live/dQw4w9WgXcQ?feature=shared',
+            'https://www.youtube.com/embed/dQw4w9WgXcQ?autoplay=1',
+            'https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ',
+            'https://www.youtube.com/v/dQw4w9WgXcQ',
+            'https://www.youtube.com/#!v=dQw4w9WgXcQ',
+            'https://www.youtube.com/attribution_link?u=/watch%3Fv%3DdQw4w9WgXcQ%26feature%3Dshare',
+        ]:
+            self.assertEqual(extract_video_id(url), 'dQw4w9WgXcQ', url)
+
+        for url in [
+            'https://notyoutube.com/watch?v=dQw4w9WgXcQ',
+            'https://www.youtube.com/playlist?list=PLtest',
+            'https://www.youtube.com/@channel',
+            'https://www.youtube.com/watch?v=tooshort',
+            '',
+        ]:
+            self.assertIsNone(extract_video_id(url), url)
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('Summary.'))
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    def test_url_variants_update_one_row(self, fetch, create):
+        for url in [
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=10',
+            'https://youtu.be/dQw4w9WgXcQ',
+            'https://m.youtube.com/watch?v=dQw4w9WgXcQ',
+        ]:
+            self.assertEqual(self.summarize(self.user, url).status_code, 200)
+
+        summary_obj = VideoSummary.objects.get(user=self.user)
+        self.assertEqual(summary_obj.video_id, 'dQw4w9WgXcQ')
+        self.assertEqual(summary_obj.video_url, 'https://m.youtube.com/watch?v=dQw4w9WgXcQ')
+
+    def test_rejects_urls_that_are_not_videos(self):
+        response = self.summarize(self.user, 'https://www.youtube.com/@channel')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('url', response.data)
+
+    def test_lookup_by_video_uses_the_unique_index(self):
+        plan = VideoSummary.objects.filter(user=self.user, video_id='dQw4w9WgXcQ').explain()
+        self.assertIn('USING INDEX', plan)
+        self.assertIn('(user_id=? AND video_id=?)', plan)
+
+
+class SharedVideoTests(SummarizeAPITestCase):
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('Shared summary.'))
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    def test_second_user_only_adds_a_history_row(self, fetch, create):
+        self.assertEqual(self.summarize(self.user, 'https://youtu.be/dQw4w9WgXcQ').status_code, 200)
+        response = self.summarize(self.other, 'https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Test Video')
+        self.assertEqual(response.data['summary'], 'Shared summary.')
+        self.assertEqual(response.data['video_url'], 'https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+        fetch.assert_called_once()
+        create.assert_called_once()
+        self.assertEqual(Video.objects.count(), 1)
+        self.assertEqual(VideoSummary.objects.count(), 2)
+
+    def test_store_keeps_the_shared_summary_unless_replacing(self):
+        video = Video.objects.create(video_id='dQw4w9WgXcQ', title='Test Video', summary='LLM summary.')
+        VideoSummary.objects.create(user=self.user, video_url='https://youtu.be/dQw4w9WgXcQ', video=video)
+        version = history_version(self.user)
+        summary_obj, created = store_summary(self.other, 'https://youtu.be/dQw4w9WgXcQ', VIDEO_INFO, 'Second summary.')
+
+        self.assertTrue(created)
+        self.assertEqual(summary_obj.video.summary, 'LLM summary.')
+        video.refresh_from_db()
+        self.assertEqual(video.summary, 'LLM summary.')
+        # Other holders of the video see no change
+        self.assertEqual(history_version(self.user), version)
+
+        store_summary(self.other, 'https://youtu.be/dQw4w9WgXcQ', VIDEO_INFO, 'Refreshed summary.', replace=True)
+        video.refresh_from_db()
+        self.assertEqual(video.summary, 'Refreshed summary.')
+        self.assertNotEqual(history_version(self.user), version)
+
+    def test_history_lists_without_a_query_per_row(self):
+        for i in range(3):
+            video = Video.objects.create(video_id=f'{i:011d}', title=f'Video {i}', summary='Summary')
+            VideoSummary.objects.create(user=self.user, video_url=f'https://youtu.be/{i:011d}', video=video)
+
+        self.client.force_authenticate(self.user)
+        # The history version behind the ETag, then the page
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/summaries/')
+        self.assertEqual([row['title'] for row in response.data['results']], ['Video 2', 'Video 1', 'Video 0'])
+
+
+class MigrationTests(TransactionTestCase):
+    """Data migrations run against the schema as it was before them"""
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('summerizer', target)])
+        return executor.loader.project_state([('summerizer', target)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes('summerizer')[0][1])
+
+    def test_upgrades_a_baseline_database(self):
+        # Deployments recorded their own 0001_initial with just the summary table
+        old_apps = self.migrate('0001_initial')
+        self.assertNotIn('summerizer_summaryjob', connection.introspection.table_names())
+        User = old_apps.get_model('auth', 'User')
+        OldSummary = old_apps.get_model('summerizer', 'VideoSummary')
+        user = User.objects.create(username='alice')
+        old = OldSummary.objects.create(
+            user=user, video_url='https://youtu.be/dQw4w9WgXcQ', title='Old', summary='Old summary.'
+        )
+
+        executor = MigrationExecutor(connection)
+        new_apps = self.migrate(executor.loader.graph.leaf_nodes('summerizer')[0][1])
+        NewSummary = new_apps.get_model('summerizer', 'VideoSummary')
+        summary_obj = NewSummary.objects.select_related('video').get()
+        self.assertEqual((summary_obj.pk, summary_obj.video_id), (old.pk, 'dQw4w9WgXcQ'))
+        self.assertEqual(summary_obj.video.summary, 'Old summary.')
+        self.assertFalse(new_apps.get_model('summerizer', 'SummaryJob').objects.exists())
+
+    def test_moves_summaries_to_shared_videos(self):
+        old_apps = self.migrate('0002_summary_cache_jobs_ingestion')
+        User = old_apps.get_model('auth', 'User')
+        OldSummary = old_apps.get_model('summerizer', 'VideoSummary')
+        OldJob = old_apps.get_model('summerizer', 'SummaryJob')
+        user = User.objects.create(username='alice')
+        other = User.objects.create(username='bob')
+
+        older = OldSummary.objects.create(
+            user=user, video_url='https://youtu.be/dQw4w9WgXcQ', title='Old', summary='Old'
+        )
+        job = OldJob.objects.create(user=user, video_url=older.video_url, summary=older)
+        # A second URL form of the same video, summarized later
+        newer = OldSummary.objects.create(
+            user=user, video_url='https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=5', title='New', summary='New'
+        )
+        theirs = OldSummary.objects.create(
+            user=other, video_url='https://youtu.be/dQw4w9WgXcQ', title='Theirs', summary='Theirs'
+        )
+        elsewhere = OldSummary.objects.create(
+            user=other, video_url='https://example.com/video', title='Elsewhere', summary='-'
+        )
+
+        with self.assertLogs('summerizer.migrations', 'WARNING') as logs:
+            new_apps = self.migrate('0006_video_summary_drop_video_fields')
+        # Rows that can't have a video are dropped, but not silently
+        self.assertIn(f'Dropping summary {elsewhere.pk} of user {other.pk}', logs.output[0])
+        self.assertIn('https://example.com/video', logs.output[0])
+        Video = new_apps.get_model('summerizer', 'Video')
+        NewSummary = new_apps.get_model('summerizer', 'VideoSummary')
+        NewJob = new_apps.get_model('summerizer', 'SummaryJob')
+
+        self.assertEqual(
+            list(NewSummary.objects.order_by('pk').values_list('pk', 'video_id')),
+            [(newer.pk, 'dQw4w9WgXcQ'), (theirs.pk, 'dQw4w9WgXcQ')],
+        )
+        # The newest summary of the video becomes the shared one
+        video = Video.objects.get()
+        self.assertEqual(video.summary, 'Theirs')
+        self.assertEqual(video.video_url, 'https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+        self.assertEqual(NewJob.objects.get(pk=job.pk).summary_id, newer.pk)
+
+        old_apps = self.migrate('0004_video_summary_unique_video')
+        OldSummary = old_apps.get_model('summerizer', 'VideoSummary')
+        self.assertEqual(
+            list(OldSummary.objects.order_by('pk').values_list('video_id', 'summary')),
+            [('dQw4w9WgXcQ', 'Theirs'), ('dQw4w9WgXcQ', 'Theirs')],
+        )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class QueryPlanTests(SummarizeAPITestCase):
+    """The history queries have to stay index lookups without a sort as tables grow"""
+
+    def setUp(self):
+        super().setUp()
+        for user in (self.user, self.other):
+            for i in range(20):
+                video, _ = Video.objects.get_or_create(video_id=f'{i:011d}', defaults={'title': 'T', 'summary': 'S'})
+                VideoSummary.objects.create(user=user, video_url=f'https://youtu.be/{i:011d}', video=video)
+        self.client.force_authenticate(self.user)
+
+    def assert_uses_indexes(self, run):
+        """Run EXPLAIN QUERY PLAN on every history query ``run`` makes"""
+        with CaptureQueriesContext(connection) as captured:
+            response = run()
+        self.assertLess(response.status_code, 300)
+
+        queries = [
+            query['sql'] for query in captured.captured_queries
+            if query['sql'].startswith('SELECT') and 'summerizer_videosummary' in query['sql']
+        ]
+        self.assertTrue(queries)
+        for sql in queries:
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+            self.assertNotIn('SCAN summerizer_videosummary', plan, sql)
+            self.assertNotIn('TEMP B-TREE', plan, sql)
+
+    def test_list(self):
+        self.assert_uses_indexes(lambda: self.client.get('/api/summaries/'))
+
+    def test_recent(self):
+        self.assert_uses_indexes(lambda: self.client.get('/api/summaries/recent/'))
+
+    def test_later_pages(self):
+        cursor = self.client.get('/api/summaries/?page_size=5').data['next'].split('cursor=')[1]
+        self.assert_uses_indexes(lambda: self.client.get(f'/api/summaries/?page_size=5&cursor={cursor}'))
+
+    def test_stats(self):
+        self.assert_uses_indexes(lambda: self.client.get('/api/summaries/stats/'))
+
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    def test_upsert(self, fetch):
+        self.assert_uses_indexes(lambda: self.summarize(self.user, 'https://youtu.be/00000000005'))
+
+
+class SummaryStatsTests(SummarizeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        for i in range(3):
+            video = Video.objects.create(video_id=f'{i:011d}', title=f'Video {i}', summary='Summary')
+            VideoSummary.objects.create(user=self.user, video_url=f'https://youtu.be/{i:011d}', video=video)
+        VideoSummary.objects.filter(video_id='00000000000').update(created_at=timezone.now() - timedelta(days=10))
+        self.client.force_authenticate(self.user)
+
+    def stats(self):
+        response = self.client.get('/api/summaries/stats/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_one_query_then_cached(self):
+        # The history version the cached stats are keyed on, then the aggregate
+        with self.assertNumQueries(2):
+            stats = self.stats()
+        self.assertEqual(stats['total_summaries'], 3)
+        self.assertEqual(stats['recent_summaries'], 2)
+        self.assertEqual(stats['last_summary'], VideoSummary.objects.first().created_at)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.stats(), stats)
+
+    def test_writes_from_other_workers_are_seen(self):
+        stats = self.stats()
+        # Another worker has its own cache: only the database tells this one
+        other_worker = override_settings(
+            CACHES={**settings.CACHES, 'other': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            SUMMARY_STATS={**settings.SUMMARY_STATS, 'CACHE_ALIAS': 'other'},
+        )
+        with other_worker:
+            VideoSummary.objects.filter(user=self.user).first().delete()
+            summaries_removed(self.user, 1)
+        self.assertEqual(self.stats()['total_summaries'], stats['total_summaries'] - 1)
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('Summary.'))
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    def test_writes_invalidate_the_cache(self, fetch, create):
+        self.assertEqual(self.stats()['total_summaries'], 3)
+        self.summarize(self.user)
+        self.assertEqual(self.stats()['total_summaries'], 4)
+        self.client.delete(f'/api/summaries/{VideoSummary.objects.first().pk}/')
+        self.assertEqual(self.stats()['total_summaries'], 3)
+        self.client.delete('/api/summaries/clear_history/')
+        self.assertEqual(self.stats(), {'total_summaries': 0, 'recent_summaries': 0, 'last_summary': None})
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('Summary.'))
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    def test_counters(self, fetch, create):
+        with override_settings(SUMMARY_STATS={**settings.SUMMARY_STATS, 'COUNTERS': True}):
+            # The first read builds the counter from the history
+            self.assertEqual(self.stats()['total_summaries'], 3)
+            self.assertEqual(SummaryCounter.objects.get(user=self.user).total, 3)
+
+            self.summarize(self.user)
+            with self.assertNumQueries(2):
+                stats = self.stats()
+            self.assertEqual(stats['total_summaries'], 4)
+            self.assertEqual(stats['recent_summaries'], 3)
+
+            latest = VideoSummary.objects.first()
+            self.client.delete(f'/api/summaries/{latest.pk}/')
+            stats = self.stats()
+            self.assertEqual(stats['total_summaries'], 3)
+            self.assertEqual(stats['last_summary'], VideoSummary.objects.first().created_at)
+
+
+class PaginationTests(SummarizeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        created_at = timezone.now()
+        for i in range(7):
+            video = Video.objects.create(video_id=f'{i:011d}', title=f'Video {i}', summary='Summary')
+            VideoSummary.objects.create(user=self.user, video_url=f'https://youtu.be/{i:011d}', video=video)
+        # Ties on created_at are broken by id
+        VideoSummary.objects.filter(video_id__in=['00000000002', '00000000003', '00000000004']).update(
+            created_at=created_at
+        )
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        titles = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            titles.extend(row['title'] for row in response.data['results'])
+            url = response.data['next']
+        return titles
+
+    def test_pages_cover_every_row_once_in_order(self):
+        expected = [summary_obj.video.title for summary_obj in VideoSummary.objects.select_related('video')]
+        self.assertEqual(self.walk('/api/summaries/?page_size=2'), expected)
+        self.assertEqual(self.walk('/api/summaries/recent/?page_size=3'), expected)
+
+    def test_rows_added_while_paging_dont_shift_pages(self):
+        first = self.client.get('/api/summaries/?page_size=3').data
+        video = Video.objects.create(video_id='zzzzzzzzzzz', title='Newer', summary='Summary')
+        VideoSummary.objects.create(user=self.user, video_url='https://youtu.be/zzzzzzzzzzz', video=video)
+
+        rest = self.walk(first['next'])
+        titles = [row['title'] for row in first['results']] + rest
+        self.assertEqual(len(titles), 7)
+        self.assertNotIn('Newer', titles)
+
+    def test_page_size_is_capped_and_bad_cursors_are_rejected(self):
+        with override_settings(SUMMARY_PAGINATION={'PAGE_SIZE': 2, 'MAX_PAGE_SIZE': 4}):
+            self.assertEqual(len(self.client.get('/api/summaries/').data['results']), 2)
+            self.assertEqual(len(self.client.get('/api/summaries/?page_size=50').data['results']), 4)
+        self.assertEqual(self.client.get('/api/summaries/?cursor=not-a-cursor').status_code, 404)
+
+
+class HistoryResponseTests(SummarizeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        for i in range(3):
+            video = Video.objects.create(video_id=f'{i:011d}', title=f'Video {i}', summary='A long summary')
+            VideoSummary.objects.create(user=self.user, video_url=f'https://youtu.be/{i:011d}', video=video)
+        self.client.force_authenticate(self.user)
+
+    def test_sparse_fields_trim_the_query(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/summaries/?fields=id,title,created_at')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'created_at'})
+        sql = captured.captured_queries[-1]['sql']
+        self.assertIn('"title"', sql)
+        self.assertNotIn('"summary"', sql)
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/summaries/recent/?fields=id,video_url')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'video_url'})
+        self.assertNotIn('JOIN', captured.captured_queries[-1]['sql'])
+
+        self.assertEqual(self.client.get('/api/summaries/?fields=id,secret').status_code, 400)
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('Summary.'))
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    def test_unchanged_history_is_not_modified(self, fetch, create):
+        for url in ('/api/summaries/', '/api/summaries/recent/'):
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            # The history version, plus the oldest recent row for recent
+            with self.assertNumQueries(1 if url == '/api/summaries/' else 2):
+                again = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304
+            )
+            # Different query, different representation
+            self.assertEqual(self.client.get(f'{url}?fields=id', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+        etag = self.client.get('/api/summaries/')['ETag']
+        self.summarize(self.user)
+        self.assertEqual(self.client.get('/api/summaries/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get('/api/summaries/')['ETag']
+        response = self.client.patch(
+            f'/api/summaries/{VideoSummary.objects.first().pk}/', {'video_url': 'https://youtu.be/00000000000'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/summaries/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get('/api/summaries/')['ETag']
+        self.client.delete(f'/api/summaries/{VideoSummary.objects.first().pk}/')
+        self.assertEqual(self.client.get('/api/summaries/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SearchTests(SummarizeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.add(self.user, 'aaaaaaaaaaa', 'Sourdough baking basics', 'How to feed a starter and shape loaves.')
+        self.add(self.user, 'bbbbbbbbbbb', 'Weeknight dinners', 'Quick pasta, then sourdough bread on the side.')
+        self.add(self.user, 'ccccccccccc', 'Chess openings', 'The Sicilian defence explained move by move.')
+        self.add(self.other, 'ddddddddddd', 'Sourdough for experts', 'Their own history.')
+        self.client.force_authenticate(self.user)
+
+    def add(self, user, video_id, title, summary):
+        video, _ = Video.objects.get_or_create(video_id=video_id, defaults={'title': title, 'summary': summary})
+        return VideoSummary.objects.create(user=user, video_url=f'https://youtu.be/{video_id}', video=video)
+
+    def search(self, query):
+        response = self.client.get('/api/summaries/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_ranked_results_with_snippets(self):
+        results = self.search('sourdough')
+        # A title match outranks a summary match, and other users' rows are left out
+        self.assertEqual([row['video_id'] for row in results], ['aaaaaaaaaaa', 'bbbbbbbbbbb'])
+        self.assertIn('<b>sourdough</b>', results[1]['snippet'])
+        self.assertEqual([row['video_id'] for row in self.search('sicil')], ['ccccccccccc'])
+        self.assertEqual(self.search('pasta chess'), [])
+        self.assertEqual(self.client.get('/api/summaries/search/').status_code, 400)
+
+    def test_search_starts_from_the_users_rows(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(len(self.search('sourdough')), 2)
+        sql = next(query['sql'] for query in captured.captured_queries if 'MATCH' in query['sql'])
+        # The user is part of the full-text query, not a join over everyone's matches
+        self.assertIn(f'user_id : "{self.user.pk}"', sql)
+        self.assertNotIn('JOIN', sql)
+        # Search words only look at the text columns
+        self.assertEqual(self.search(str(self.user.pk)), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'The full-text index only exists on SQLite')
+    def test_index_triggers_exist_at_the_latest_migration(self):
+        # Later migrations that rebuild either table would silently drop them
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%_fts_%'")
+            triggers = {row[0] for row in cursor.fetchall()}
+        self.assertEqual(triggers, {
+            'summerizer_videosummary_fts_insert',
+            'summerizer_videosummary_fts_delete',
+            'summerizer_videosummary_fts_update',
+            'summerizer_video_fts_update',
+        })
+
+    def test_index_follows_writes(self):
+        video = Video.objects.get(video_id='ccccccccccc')
+        video.summary = 'Endgames with rook and king.'
+        video.save()
+        self.assertEqual(self.search('sicilian'), [])
+        self.assertEqual([row['video_id'] for row in self.search('rook')], ['ccccccccccc'])
+
+        VideoSummary.objects.filter(video_id='aaaaaaaaaaa').update(video_url='https://www.youtube.com/watch?v=aaaaaaaaaaa')
+        self.assertEqual([row['video_id'] for row in self.search('sourdough')], ['aaaaaaaaaaa', 'bbbbbbbbbbb'])
+
+        self.client.delete('/api/summaries/clear_history/')
+        self.assertEqual(self.search('sourdough'), [])
+        self.client.force_authenticate(self.other)
+        self.assertEqual([row['video_id'] for row in self.search('sourdough')], ['ddddddddddd'])
+
+    def test_admin_search_uses_the_index(self):
+        from django.contrib import admin
+        from .admin import VideoSummaryAdmin
+
+        model_admin = VideoSummaryAdmin(VideoSummary, admin.site)
+        with CaptureQueriesContext(connection) as captured:
+            results, _ = model_admin.get_search_results(None, VideoSummary.objects.all(), 'sourdough')
+            self.assertEqual(results.count(), 3)
+        self.assertIn('MATCH', captured.captured_queries[-1]['sql'])
+        self.assertNotIn('LIKE', captured.captured_queries[-1]['sql'])
+
+    @mock.patch('summerizer.search.fts_enabled', return_value=False)
+    def test_fallback_without_fts(self, fts_enabled):
+        self.assertEqual({row['video_id'] for row in self.search('sourdough')}, {'aaaaaaaaaaa', 'bbbbbbbbbbb'})
+
+
+class RelatedSummariesTests(SummarizeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = self.embeddings_path
+        self.bread = self.add(self.user, 'aaaaaaaaaaa', 'Sourdough bread', 'Feeding a sourdough starter and baking bread loaves.')
+        self.add(self.user, 'bbbbbbbbbbb', 'Baking bread at home', 'Simple bread loaves with a sourdough starter.')
+        self.add(self.user, 'ccccccccccc', 'Chess openings', 'The Sicilian defence explained move by move.')
+        self.add(self.other, 'ddddddddddd', 'More sourdough bread', 'Sourdough starter and bread loaves.')
+        self.client.force_authenticate(self.user)
+
+    def add(self, user, video_id, title, summary):
+        video, _ = Video.objects.get_or_create(video_id=video_id, defaults={'title': title, 'summary': summary})
+        return VideoSummary.objects.create(user=user, video_url=f'https://youtu.be/{video_id}', video=video)
+
+    def related(self, **params):
+        response = self.client.get('/api/summaries/related/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_embeddings_are_deterministic_and_normalized(self):
+        vector = embed('Sourdough bread loaves', 256)
+        self.assertEqual(vector.dtype, np.float32)
+        self.assertAlmostEqual(float(np.linalg.norm(vector)), 1.0, places=5)
+        np.testing.assert_array_equal(vector, embed('sourdough BREAD loaves!', 256))
+        self.assertEqual(float(np.linalg.norm(embed('the and of', 256))), 0.0)
+
+    def test_related_to_a_summary_or_text(self):
+        results = self.related(id=self.bread.pk)
+        # Itself and other users' videos are left out
+        self.assertEqual(results[0]['video_id'], 'bbbbbbbbbbb')
+        self.assertNotIn('aaaaaaaaaaa', [row['video_id'] for row in results])
+        self.assertNotIn('ddddddddddd', [row['video_id'] for row in results])
+        self.assertGreater(results[0]['score'], 0.3)
+        self.assertLess(results[-1]['score'], 0.1)
+
+        results = self.related(q='sicilian chess')
+        self.assertEqual(results[0]['video_id'], 'ccccccccccc')
+        self.assertEqual(self.client.get('/api/summaries/related/').status_code, 400)
+        self.assertEqual(self.client.get('/api/summaries/related/', {'id': 999999}).status_code, 404)
+        response = self.client.get('/api/summaries/related/', {'id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('id', response.data)
+
+    @mock.patch('summerizer.llm.OpenAIProvider.create', return_value=make_completion('Bread and sourdough tips.'))
+    @mock.patch('summerizer.ai_utils.fetch_video_info', return_value=VIDEO_INFO)
+    def test_summarize_appends_to_the_index(self, fetch, create):
+        self.related(q='bread')
+        index = get_embedding_index()
+        self.assertEqual(len(index), 3)
+        before = open(f'{self.path}.f32', 'rb').read()
+
+        self.summarize(self.user)
+
+        after = open(f'{self.path}.f32', 'rb').read()
+        self.assertEqual(len(after), len(before) + 256 * 4)
+        self.assertEqual(after[:len(before)], before)
+        # Another process opening the files sees the new row
+        reopened = EmbeddingIndex(self.path, 256)
+        self.assertEqual(reopened.missing(['dQw4w9WgXcQ', 'aaaaaaaaaaa', 'zzzzzzzzzzz']), ['zzzzzzzzzzz'])
+        self.assertIn('dQw4w9WgXcQ', [row['video_id'] for row in self.related(q='sourdough tips')])
+
+
+@override_settings(HISTORY_DELETE={'BATCH_SIZE': 2, 'PAUSE': 0})
+class HistoryDeletionTests(SummarizeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            self.add(self.user, f'{i:011d}')
+        self.add(self.other, '00000000000')
+        self.client.force_authenticate(self.user)
+
+    def add(self, user, video_id):
+        video, _ = Video.objects.get_or_create(video_id=video_id, defaults={'title': 'Video', 'summary': 'Summary'})
+        return VideoSummary.objects.create(user=user, video_url=f'https://youtu.be/{video_id}', video=video)
+
+    def test_deletes_in_batches(self):
+        job = SummaryJob.objects.create(
+            user=self.user, video_url='https://youtu.be/00000000000', summary=VideoSummary.objects.filter(user=self.user).first()
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete('/api/summaries/clear_history/')
+        self.assertEqual(response.status_code, 204)
+
+        deletes = [q['sql'] for q in queries if q['sql'].startswith('DELETE FROM "summerizer_videosummary"')]
+        self.assertEqual(len(deletes), 3)
+        self.assertFalse(VideoSummary.objects.filter(user=self.user).exists())
+        self.assertEqual(VideoSummary.objects.filter(user=self.other).count(), 1)
+        job.refresh_from_db()
+        self.assertIsNone(job.summary)
+
+        deletion = HistoryDeletion.objects.get(user=self.user)
+        self.assertEqual((deletion.status, deletion.total, deletion.deleted), ('done', 5, 5))
+        self.assertEqual(self.client.get('/api/summaries/stats/').data['total_summaries'], 0)
+
+    def test_async_mode_reports_progress(self):
+        executor = mock.Mock(submit=lambda func, *args: func(*args))
+        with mock.patch('summerizer.jobs.get_executor', return_value=executor):
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.delete('/api/summaries/clear_history/?mode=async')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual((response.data['status'], response.data['total']), ('queued', 5))
+
+            # Summaries added after the request are kept
+            kept = self.add(self.user, 'dQw4w9WgXcQ')
+            for callback in callbacks:
+                callback()
+
+        status_response = self.client.get(f"/api/summaries/history_deletions/{response.data['id']}/")
+        self.assertEqual(status_response.data['status'], 'done')
+        self.assertEqual(status_response.data['deleted'], 5)
+        self.assertEqual(list(VideoSummary.objects.filter(user=self.user)), [kept])
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(f"/api/summaries/history_deletions/{response.data['id']}/").status_code, 404)
+        self.assertEqual(self.client.delete('/api/summaries/clear_history/?mode=later').status_code, 400)
@@ -0,0 +1,198 @@
+import contextvars
+import logging
+import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Context windows (prompt + completion) of the chat models we call
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4o-mini': 128000,
+    'gpt-4o': 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# Chat formatting overhead: tokens added per message and to prime the reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+
+class RegexTokenizer:
+    """Pure-Python approximation of a GPT byte-pair tokenizer.
+
+    Text is pre-split like the GPT tokenizers (words with their leading space,
+    digit groups, punctuation runs), then long words are cut into 4-character
+    pieces, roughly the average BPE token length for English. CJK characters
+    count as one token each. It slightly overcounts, which is the safe side
+    for budgeting.
+    """
+    name = 'regex'
+    PIECE_RE = re.compile(
+        r"'(?:[sdmt]|ll|ve|re)"
+        r"|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]"
+        r"| ?[^\W\d_]{1,4}"
+        r"| ?\d{1,3}"
+        r"| ?(?:[^\s\w]|_)+"
+        r"|\s+(?!\S)|\s+"
+    )
+
+    def spans(self, text: str) -> list:
+        return [match.span() for match in self.PIECE_RE.finditer(text)]
+
+    def count(self, text: str) -> int:
+        return sum(1 for _ in self.PIECE_RE.finditer(text))
+
+
+class TiktokenTokenizer:
+    """Exact token counts using tiktoken, when it is installed and its data is available"""
+    name = 'tiktoken'
+
+    def __init__(self, model: str):
+        import tiktoken
+
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding('cl100k_base')
+
+    def spans(self, text: str) -> list:
+        tokens = self.encoding.encode(text)
+        _, offsets = self.encoding.decode_with_offsets(tokens)
+        ends = offsets[1:] + [len(text)]
+        return list(zip(offsets, ends))
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model: str = ''):
+    """Load the configured tokenizer once per process"""
+    if settings.SUMMARY_TOKENIZER in ('auto', 'tiktoken'):
+        try:
+            return TiktokenTokenizer(model)
+        except Exception as e:
+            # tiktoken is optional and downloads its vocabulary on first use
+            if settings.SUMMARY_TOKENIZER == 'tiktoken':
+                raise
+            logger.debug(f"tiktoken unavailable, using regex tokenizer: {e}")
+    return RegexTokenizer()
+
+
+def count_tokens(text: str, model: str = '') -> int:
+    """Count LLM tokens in text"""
+    return get_tokenizer(model).count(text)
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = '') -> str:
+    """Cut text down to at most max_tokens tokens"""
+    if max_tokens <= 0:
+        return ''
+    spans = get_tokenizer(model).spans(text)
+    if len(spans) <= max_tokens:
+        return text
+    return text[:spans[max_tokens - 1][1]]
+
+
+def split_into_chunks(text: str, chunk_tokens: int, overlap_tokens: int = 0, model: str = '') -> list:
+    """Split text into overlapping chunks of at most chunk_tokens tokens"""
+    spans = get_tokenizer(model).spans(text)
+    if len(spans) <= chunk_tokens:
+        return [text]
+
+    step = max(1, chunk_tokens - overlap_tokens)
+    chunks = []
+    for start in range(0, len(spans), step):
+        window = spans[start:start + chunk_tokens]
+        # Slice the original text so spacing and punctuation survive
+        chunks.append(text[window[0][0]:window[-1][1]].strip())
+        if start + chunk_tokens >= len(spans):
+            break
+    return chunks
+
+
+def count_message_tokens(messages: list, model: str = '') -> int:
+    """Count the tokens a list of chat messages takes up in the prompt"""
+    return TOKENS_PER_REPLY + sum(
+        TOKENS_PER_MESSAGE + count_tokens(message['content'], model) for message in messages
+    )
+
+
+def choose_max_tokens(input_tokens: int) -> int:
+    """Size the completion to the input: short descriptions get short summaries"""
+    config = settings.SUMMARY_TOKEN_BUDGET
+    wanted = int(input_tokens * config['COMPLETION_RATIO'])
+    return max(config['MIN_COMPLETION_TOKENS'], min(config['MAX_COMPLETION_TOKENS'], wanted))
+
+
+def fit_prompt(text: str, build_messages, model: str):
+    """Trim text so the prompt plus completion exactly fit the model's context.
+
+    Returns ``(text, max_tokens, input_tokens, prompt_tokens)`` where
+    prompt_tokens covers the full messages built around the (trimmed) text.
+    """
+    context_window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    input_tokens = count_tokens(text, model)
+    max_tokens = choose_max_tokens(input_tokens)
+
+    # Everything except the text itself: system prompt, template, formatting
+    overhead = count_message_tokens(build_messages(''), model)
+    available = context_window - overhead - max_tokens
+    if input_tokens > available:
+        text = truncate_tokens(text, available, model)
+        input_tokens = count_tokens(text, model)
+
+    return text, max_tokens, input_tokens, overhead + input_tokens
+
+
+class TokenUsage:
+    """Token counts of every LLM call made while handling one request"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens: int, completion_tokens: int, cached: bool = False) -> None:
+        with self._lock:
+            self.calls.append({
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'cached': cached,
+            })
+
+    def totals(self) -> dict:
+        with self._lock:
+            calls = list(self.calls)
+        upstream = [call for call in calls if not call['cached']]
+        return {
+            'llm_calls': len(upstream),
+            'cached_calls': len(calls) - len(upstream),
+            'prompt_tokens': sum(call['prompt_tokens'] for call in upstream),
+            'completion_tokens': sum(call['completion_tokens'] for call in upstream),
+        }
+
+
+_current_usage = contextvars.ContextVar('summary_token_usage', default=None)
+
+
+@contextmanager
+def track_usage():
+    """Collect token usage of the LLM calls made inside the block"""
+    usage = TokenUsage()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+
+
+def record_usage(prompt_tokens: int, completion_tokens: int, cached: bool = False) -> None:
+    """Add one LLM call to the usage being tracked, if any"""
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.add(prompt_tokens, completion_tokens, cached)
@@ -1,10 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import VideoSummaryViewSet
+from .views import VideoSummaryViewSet, service_stats
+from .streaming import summarize_stream
 
 router = DefaultRouter()
 router.register(r"summaries", VideoSummaryViewSet, basename='video-summary')
 
 urlpatterns = [
+    path('summaries/summarize/stream/', summarize_stream, name='video-summary-summarize-stream'),
+    path('service/stats/', service_stats, name='service-stats'),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,59 @@
+import re
+from typing import Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+WATCH_URL = 'https://www.youtube.com/watch?v={video_id}'
+
+YOUTUBE_HOSTS = ('youtube.com', 'youtube-nocookie.com')
+SHORT_HOSTS = ('youtu.be',)
+# Path prefixes followed by the video ID, e.g. /shorts/<id>
+ID_PATH_PREFIXES = ('embed', 'shorts', 'v', 'e', 'live', 'watch')
+
+
+def _host_matches(host: str, domains: tuple) -> bool:
+    return any(host == domain or host.endswith(f".{domain}") for domain in domains)
+
+
+def extract_video_id(url: str) -> Optional[str]:
+    """Extract the canonical 11-character video ID from any form of YouTube video URL.
+
+    Handles youtu.be links, watch pages on any subdomain (www, m, music),
+    /embed, /shorts, /live, /v and /e paths, youtube-nocookie embeds, IDs in
+    the URL fragment, attribution links and URLs without a scheme. Returns
+    None for anything that isn't a single video.
+    """
+    if not url:
+        return None
+    url = url.strip()
+    if '//' not in url:
+        url = f"https://{url}"
+
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    path_parts = [part for part in parsed.path.split('/') if part]
+    query = parse_qs(parsed.query)
+
+    video_id = None
+    if _host_matches(host, SHORT_HOSTS):
+        video_id = path_parts[0] if path_parts else None
+    elif _host_matches(host, YOUTUBE_HOSTS):
+        if 'v' in query:
+            video_id = query['v'][0]
+        elif len(path_parts) >= 2 and path_parts[0] in ID_PATH_PREFIXES:
+            video_id = path_parts[1]
+        elif path_parts[:1] == ['attribution_link'] and 'u' in query:
+            # /attribution_link?u=/watch%3Fv%3D<id>
+            return extract_video_id(f"https://www.youtube.com{unquote(query['u'][0])}")
+        elif parsed.fragment:
+            # Old-style /#!v=<id> and /watch#v=<id> links
+            video_id = parse_qs(parsed.fragment.lstrip('!')).get('v', [None])[0]
+
+    if video_id and VIDEO_ID_RE.match(video_id):
+        return video_id
+    return None
+
+
+def canonical_video_url(video_id: str) -> str:
+    """The standard watch URL of a video"""
+    return WATCH_URL.format(video_id=video_id)
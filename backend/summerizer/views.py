@@ -1,66 +1,201 @@
+import hashlib
+
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.utils import timezone
 from datetime import timedelta
-from .models import VideoSummary
-from .serializers import VideoSummarySerializer, VideoURLSerializer
-from .ai_utils import get_video_info, generate_summary
+from .models import VideoSummary, SummaryJob, IngestionRun, HistoryDeletion
+from .serializers import (
+    VideoSummarySerializer,
+    VideoURLSerializer,
+    SummaryJobSerializer,
+    VideoBatchSerializer,
+    IngestionSourceSerializer,
+    IngestionRunSerializer,
+    HistoryDeletionSerializer,
+)
+from .pipeline import summarize_video, summarize_videos
+from .deadline import Deadline
+from .pagination import KeysetPagination
+from .search import search_summaries
+from .embeddings import related_summaries, video_text
+from .stats import RECENT_DAYS, get_summary_stats, history_changed, history_version, summaries_removed
+from .history import start_history_deletion, execute_history_deletion, run_history_deletion
+from .jobs import enqueue_summary_job, run_in_background
+from .ingestion import run_ingestion, claim_for_resume
+from .cache import get_summary_cache
+from .http_client import get_http_client
+from .llm import get_llm_router
+from .scheduler import get_llm_scheduler
 import logging
 logger = logging.getLogger(__name__)
 
 class VideoSummaryViewSet(viewsets.ModelViewSet):
     serializer_class = VideoSummarySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    # Actions that accept ?fields= to return only some fields
+    sparse_actions = ('list', 'retrieve', 'recent')
 
     def get_queryset(self):
-        return VideoSummary.objects.filter(user=self.request.user)
+        queryset = VideoSummary.objects.filter(user=self.request.user).select_related('video')
+        fields = self.requested_fields()
+        if fields is not None:
+            # Trim the SELECT too, and skip the join when no video field is asked for
+            columns = self.get_serializer_class()(fields=fields).model_fields()
+            if not any(column.startswith('video__') for column in columns):
+                queryset = queryset.select_related(None)
+            queryset = queryset.only(*columns)
+        return queryset
+
+    def requested_fields(self):
+        """Fields named in ?fields=, or None for all of them"""
+        if self.action not in self.sparse_actions or not self.request.query_params.get('fields'):
+            return None
+        fields = [name.strip() for name in self.request.query_params['fields'].split(',') if name.strip()]
+        unknown = set(fields) - set(self.get_serializer_class().Meta.fields)
+        if unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}"})
+        return fields
+
+    def get_serializer(self, *args, **kwargs):
+        if self.requested_fields() is not None:
+            kwargs['fields'] = self.requested_fields()
+        return super().get_serializer(*args, **kwargs)
+
+    def conditional_response(self, request, build, *validators):
+        """Answer 304 while the user's history is unchanged, otherwise build the response.
+
+        ETag and Last-Modified come from the user's HistoryVersion row, which
+        every history write bumps; the ETag also covers the query string and
+        ``validators``.
+        """
+        version, changed_at = history_version(request.user)
+        key = f"{request.user.pk}:{version}:{request.get_full_path()}:{request.accepted_renderer.format}:{validators}"
+        etag = quote_etag(hashlib.md5(key.encode('utf-8')).hexdigest())
+        last_modified = int(changed_at.timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = build()
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            # Clients may keep it, but have to revalidate before reusing it
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, lambda: super(VideoSummaryViewSet, self).list(request, *args, **kwargs))
 
     @action(detail=False, methods=['get'])
-    def recent(self):
+    def recent(self, request):
         """Get summaries from the last 7 days"""
-        last_week = timezone.now() - timedelta(days=7)
+        last_week = timezone.now() - timedelta(days=RECENT_DAYS)
         recent_summaries = self.get_queryset().filter(created_at__gte=last_week)
-        serializer = self.get_serializer(recent_summaries, many=True)
-        return Response(serializer.data)
+
+        def build():
+            page = self.paginate_queryset(recent_summaries)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        # Rows also leave the window as time passes: the oldest one still in it is
+        # part of the validator (a single index lookup)
+        oldest = recent_summaries.order_by('created_at', 'id').values_list('pk', flat=True).first()
+        return self.conditional_response(request, build, oldest)
 
     @action(detail=False, methods=['get'])
-    def stats(self):
+    def stats(self, request):
         """Get user's summary statistics"""
-        queryset = self.get_queryset()
-        total_summaries = queryset.count()
-        recent_summaries = queryset.filter(
-            created_at__gte=timezone.now() - timedelta(days=7)
-        ).count()
+        return Response(get_summary_stats(request.user))
+
+    def perform_update(self, serializer):
+        serializer.save()
+        history_changed(self.request.user.pk)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        summaries_removed(self.request.user, 1)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Full-text search of the user's summaries, best match first"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'q': ['This query parameter is required.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = search_summaries(request.user, query, self.paginator.get_page_size(request))
+        data = self.get_serializer(results, many=True).data
+        for row, summary_obj in zip(data, results):
+            row['snippet'] = summary_obj.snippet
+        return Response({'results': data})
+
+    @action(detail=False, methods=['get'])
+    def related(self, request):
+        """The user's summaries most similar to one of them (?id=) or to free text (?q=)"""
+        exclude_video_id = None
+        if request.query_params.get('id'):
+            try:
+                summary_id = int(request.query_params['id'])
+            except ValueError:
+                return Response(
+                    {'id': ['A valid integer is required.']},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            source = VideoSummary.objects.filter(
+                user=request.user, pk=summary_id
+            ).select_related('video').first()
+            if source is None:
+                return Response(
+                    {'error': 'Summary not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            text, exclude_video_id = video_text(source.video), source.video_id
+        elif request.query_params.get('q', '').strip():
+            text = request.query_params['q']
+        else:
+            return Response(
+                {'error': 'Pass the id of a summary or a q to compare with.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        return Response({
-            'total_summaries': total_summaries,
-            'recent_summaries': recent_summaries,
-            'last_summary': queryset.first().created_at if queryset.exists() else None
-        })
+        results = related_summaries(
+            request.user, text, self.paginator.get_page_size(request), exclude_video_id=exclude_video_id
+        )
+        data = self.get_serializer(results, many=True).data
+        for row, summary_obj in zip(data, results):
+            row['score'] = summary_obj.score
+        return Response({'results': data})
 
     @action(detail=False, methods=['post'])
     def summarize(self, request):
+        # The client gives up after a fixed time, work past that is wasted
+        deadline = Deadline(settings.SUMMARIZE_DEADLINE['SECONDS'])
         serializer = VideoURLSerializer(data=request.data)
         if serializer.is_valid():
+            # Job mode hands the pipeline to the worker pool and returns immediately
+            if serializer.validated_data['mode'] == 'async':
+                job = enqueue_summary_job(request.user, serializer.validated_data['url'])
+                return Response(
+                    SummaryJobSerializer(job).data,
+                    status=status.HTTP_202_ACCEPTED
+                )
+            
             try:
-                # Get video info
-                video_info = get_video_info(serializer.validated_data['url'])
-                
-                # Generate summary from video description
-                summary = generate_summary(video_info['description'])
-                
-                # Create or update summary
-                summary_obj, created = VideoSummary.objects.update_or_create(
-                    user=request.user,
-                    video_url=serializer.validated_data['url'],
-                    defaults={
-                        'title': video_info['title'],
-                        'summary': summary,
-                        'thumbnail_url': video_info['thumbnail_url'],
-                        'duration': video_info['duration']
-                    }
+                summary_obj, created = summarize_video(
+                    request.user,
+                    serializer.validated_data['url'],
+                    deadline=deadline
                 )
                 
                 return Response(
@@ -82,8 +217,132 @@ class VideoSummaryViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @action(detail=False, methods=['post'])
+    def summarize_batch(self, request):
+        """Summarize a list of videos, reporting the outcome of each URL"""
+        serializer = VideoBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            logger.error(f"Serializer Validation Error: {serializer.errors}")
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = summarize_videos(request.user, serializer.validated_data['urls'])
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        
+        return Response(
+            {'results': results, 'counts': counts},
+            status=status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})')
+    def job_status(self, request, job_id=None):
+        """Get the status and result of a background summary job"""
+        job = SummaryJob.objects.filter(user=request.user, pk=job_id).select_related('summary').first()
+        if job is None:
+            return Response(
+                {'error': 'Job not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(SummaryJobSerializer(job).data)
+
+    @action(detail=False, methods=['post'])
+    def ingest(self, request):
+        """Start summarizing every video of a playlist or channel in the background"""
+        serializer = IngestionSourceSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        run = IngestionRun.objects.create(user=request.user, source_url=serializer.validated_data['url'])
+        run_in_background(run_ingestion, run.pk)
+        return Response(
+            IngestionRunSerializer(run).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+    @action(detail=False, methods=['get'], url_path=r'ingestions/(?P<run_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})')
+    def ingestion_status(self, request, run_id=None):
+        """Get the progress of a playlist or channel ingestion"""
+        run = IngestionRun.objects.filter(user=request.user, pk=run_id).first()
+        if run is None:
+            return Response(
+                {'error': 'Ingestion not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(IngestionRunSerializer(run).data)
+
+    @action(detail=False, methods=['post'], url_path=r'ingestions/(?P<run_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})/resume')
+    def ingestion_resume(self, request, run_id=None):
+        """Resume an interrupted ingestion from its last checkpoint"""
+        run = IngestionRun.objects.filter(user=request.user, pk=run_id).first()
+        if run is None:
+            return Response(
+                {'error': 'Ingestion not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if not claim_for_resume(run, IngestionRun.STATUS_QUEUED):
+            return Response(
+                {'error': f'Ingestion is {run.status} and can\'t be resumed'},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        run_in_background(run_ingestion, run.pk)
+        return Response(
+            IngestionRunSerializer(run).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
     @action(detail=False, methods=['delete'])
     def clear_history(self, request):
-        """Clear all user's summaries"""
-        self.get_queryset().delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        """Clear all user's summaries, in batches; ?mode=async does it in the background"""
+        mode = request.query_params.get('mode', 'sync')
+        if mode not in ('sync', 'async'):
+            return Response(
+                {'mode': [f'"{mode}" is not a valid choice.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        deletion = start_history_deletion(request.user)
+        if mode == 'async':
+            run_in_background(run_history_deletion, deletion.pk)
+            return Response(
+                HistoryDeletionSerializer(deletion).data,
+                status=status.HTTP_202_ACCEPTED
+            )
+        
+        deletion = execute_history_deletion(deletion)
+        if deletion.status == HistoryDeletion.STATUS_FAILED:
+            return Response(
+                {'error': deletion.error},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['get'], url_path=r'history_deletions/(?P<deletion_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})')
+    def history_deletion_status(self, request, deletion_id=None):
+        """Get the progress of a background history deletion"""
+        deletion = HistoryDeletion.objects.filter(user=request.user, pk=deletion_id).first()
+        if deletion is None:
+            return Response(
+                {'error': 'Deletion not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(HistoryDeletionSerializer(deletion).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def service_stats(request):
+    """This process's LLM queue, provider and circuit, summary cache and HTTP client metrics, for staff"""
+    return Response({
+        'llm_scheduler': get_llm_scheduler().stats(),
+        'llm_providers': get_llm_router().stats(),
+        'summary_cache': get_summary_cache().stats(),
+        'http_client': get_http_client().stats(),
+    })